@@ -107,6 +107,16 @@ class DystopiaBuildConfig(SlottedModel):
     channel_id = Field(snowflake, default=None)
     # How often (seconds) to poll for finished runs.
     poll_seconds = Field(int, default=60)
+    # Most recent tasks looked at per poll (fetched in pages). Large enough that a backlog after
+    # downtime is announced in one tick rather than 50 tasks a minute.
+    task_limit = Field(int, default=300)
+
+
+class MetricsConfig(SlottedModel):
+    # Local listener for the Prometheus metrics endpoint (http://<host>:<port>/metrics). Unset port =
+    # no listener. Binds loopback by default; expose it through the compose network, not publicly.
+    host = Field(text, default="127.0.0.1")
+    port = Field(int, default=None)
 
 
 class BaseConfig(SlottedModel):
@@ -119,6 +129,7 @@ class BaseConfig(SlottedModel):
     pickup_games = DictField(snowflake, DictField(text, PickupGamesConfig, default={}), default={})
     dystopia = Field(DystopiaConfig, default=None)
     dystopia_build = Field(DystopiaBuildConfig, default=None)
+    metrics = Field(MetricsConfig, default=None)
 
 
 CONFIG = BaseConfig(config_values)
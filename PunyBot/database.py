@@ -1,12 +1,16 @@
+import logging
 import os
 
 from peewee import Model
+from playhouse.migrate import SqliteMigrator, migrate
 from playhouse.sqlite_ext import SqliteExtDatabase
 
 sqlite_db = SqliteExtDatabase(os.getcwd() + '/data/database.db', pragmas={'journal_mode': 'wal'})
 
 REGISTERED_MODELS = []
 
+log = logging.getLogger(__name__)
+
 
 class SQLiteBase(Model):
     class Meta:
@@ -15,9 +19,41 @@ class SQLiteBase(Model):
     @staticmethod
     def register(cls):
         cls.create_table(True)
+        add_missing_columns(cls)
         if hasattr(cls, 'SQL'):
             sqlite_db.execute_sql(cls.SQL)
 
         REGISTERED_MODELS.append(cls)
         return cls
 
+
+def add_missing_columns(cls):
+    """Add columns declared on the model but missing from an existing table (create_table(True) leaves
+    existing tables alone). New fields must be nullable or have a default."""
+    existing = {column.name for column in sqlite_db.get_columns(cls._meta.table_name)}
+    missing = [field for field in cls._meta.sorted_fields if field.column_name not in existing]
+    if missing:
+        migrator = SqliteMigrator(sqlite_db)
+        migrate(*(migrator.add_column(cls._meta.table_name, field.column_name, field) for field in missing))
+
+
+def run_migrations(migrations):
+    """Bring the schema up to date. ``migrations`` is a list of ``(version, description, apply)``, where
+    ``apply`` is a list of SQL statements or a callable. Every version above the database's current one
+    (``PRAGMA user_version``) is applied in order, each in one transaction with its version bump, so a
+    failed migration leaves the schema at the last good version. Returns the versions applied."""
+    current = sqlite_db.pragma('user_version')
+    applied = []
+    for version, description, apply in sorted(migrations, key=lambda migration: migration[0]):
+        if version <= current:
+            continue
+        with sqlite_db.atomic():
+            if callable(apply):
+                apply()
+            else:
+                for statement in apply:
+                    sqlite_db.execute_sql(statement)
+            sqlite_db.pragma('user_version', version)
+        log.info("Applied schema migration %d: %s", version, description)
+        applied.append(version)
+    return applied
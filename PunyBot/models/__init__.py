@@ -1,4 +1,9 @@
 from PunyBot.models.agreement import Agreement
-from PunyBot.models.pickupgames import PickupGame
-from PunyBot.models.media_cache import SteamNewsCache, RssCache
+from PunyBot.models.pickupgames import PickupGame, PickupPlayer
+from PunyBot.models.media_cache import SteamNewsCache, SteamAppCache, RssCache, HttpValidatorCache
 from PunyBot.models.dystopia_cache import DystopiaBuildCache, DystopiaFeedCache
+
+from PunyBot.database import run_migrations
+from PunyBot.models.migrations import MIGRATIONS
+
+run_migrations(MIGRATIONS)
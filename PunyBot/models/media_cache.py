@@ -1,4 +1,6 @@
-from peewee import TextField, BigIntegerField, CompositeKey, IntegerField
+from datetime import datetime
+
+from peewee import TextField, BigIntegerField, CompositeKey, IntegerField, FloatField, DateTimeField
 
 from PunyBot.database import SQLiteBase
 
@@ -19,3 +21,38 @@ class SteamNewsCache(SQLiteBase):
 
     app = IntegerField(primary_key=True)
     post_id = BigIntegerField(null=False)
+
+
+@SQLiteBase.register
+class SteamAppCache(SQLiteBase):
+    """Steam store metadata for an app shown in the bot's status (``status_apps``), from
+    ``store.steampowered.com/api/appdetails``. Persisted so a restart needs no store calls; rows
+    older than the refresher's max age are re-fetched in the background."""
+
+    class Meta:
+        table_name = 'steam_app_cache'
+
+    app = IntegerField(primary_key=True)
+    name = TextField(null=False)
+    app_type = TextField(null=True)
+    header_image = TextField(null=True)
+    fetched_at = DateTimeField(default=datetime.now)
+
+
+@SQLiteBase.register
+class HttpValidatorCache(SQLiteBase):
+    """HTTP cache validators for a polled media URL (an RSS feed or a Steam news endpoint).
+
+    ``etag``/``last_modified`` are sent back as ``If-None-Match``/``If-Modified-Since`` on the next
+    poll; a ``304`` then skips the download and the parse. ``body_bytes``/``parse_ms`` describe the
+    last full response and are what each 304 is credited with saving.
+    """
+
+    class Meta:
+        table_name = 'http_validator_cache'
+
+    url = TextField(primary_key=True)
+    etag = TextField(null=True)
+    last_modified = TextField(null=True)
+    body_bytes = IntegerField(default=0)
+    parse_ms = FloatField(default=0)
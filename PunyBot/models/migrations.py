@@ -0,0 +1,51 @@
+from PunyBot.models.kaboom import KaboomMessage
+from PunyBot.models.pickupgames import PickupGame, PickupPlayer, migrate_roster_from_extra_info
+
+# Schema migrations, applied by PunyBot.database.run_migrations and recorded in PRAGMA user_version.
+# Append only - never renumber or edit one that has shipped.
+MIGRATIONS = [
+    # The kaboom timer heap and the ActiveGames registry look rows up by key; the only non-key reads
+    # left are the registry's startup load of the active games (a small slice of an ever-growing
+    # history table) and a user's games across that history.
+    (1, "Index the active pickup games and each user's roster rows", [
+        'CREATE INDEX IF NOT EXISTS "pickup_games_active" ON "pickup_games" ("active")',
+        'CREATE INDEX IF NOT EXISTS "pickupplayer_user_id" ON "pickup_players" ("user_id")',
+    ]),
+    (2, "Move pickup rosters out of extra_info into pickup_players", migrate_roster_from_extra_info),
+]
+
+
+def hot_queries():
+    """The queries the bot actually issues against the timer and pickup tables, by name, for EXPLAIN
+    QUERY PLAN checks (see tools/db_query_plan_bench.py): ``{name: (query, needs_index)}``. Kaboom's
+    startup recovery reads the whole table by design, so it is only timed. Sample ids stand in for the real
+    parameters - the plan doesn't depend on them."""
+    return {
+        # kaboom: startup timer recovery, then each sweep's rows (and the write-behind delete) by id.
+        "kaboom_recover": (KaboomMessage.select(), False),
+        "kaboom_by_id": (KaboomMessage.select().where(KaboomMessage.message_id.in_([1, 2, 3])), True),
+        # pickup: the ActiveGames registry load (its recover_timers works from memory), its roster, and a
+        # user's roster rows across the whole history.
+        "pickup_registry": (PickupGame.select().where(PickupGame.active == True), True),
+        "roster_for_games": (PickupPlayer.select().where(PickupPlayer.game_id.in_([1, 2, 3])), True),
+        "roster_remove": (PickupPlayer.select().where((PickupPlayer.game_id == 1) & (PickupPlayer.user_id == 1)),
+                          True),
+        "roster_for_user": (PickupPlayer.select().where(PickupPlayer.user_id == 1), True),
+    }
+
+
+def query_plan(query):
+    """EXPLAIN QUERY PLAN detail lines for a peewee query."""
+    sql, params = query.sql()
+    cursor = query.model._meta.database.execute_sql("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[-1] for row in cursor.fetchall()]
+
+
+def uses_index(plan):
+    """False if any step of the plan scans a whole table or sorts in a temp b-tree."""
+    for detail in plan:
+        if detail.startswith("SCAN") and " USING " not in detail:
+            return False
+        if "TEMP B-TREE" in detail:
+            return False
+    return True
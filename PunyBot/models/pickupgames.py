@@ -1,8 +1,8 @@
 from datetime import datetime
-from peewee import IntegerField, BigIntegerField, DateTimeField, BooleanField, TextField
+from peewee import IntegerField, BigIntegerField, DateTimeField, BooleanField, TextField, CompositeKey, fn
 from playhouse.sqlite_ext import JSONField
 
-from PunyBot.database import SQLiteBase
+from PunyBot.database import SQLiteBase, sqlite_db
 
 
 @SQLiteBase.register
@@ -25,3 +25,38 @@ class PickupGame(SQLiteBase):
     control_message_id = BigIntegerField()
     extra_info = JSONField()
     active = BooleanField(default=True)
+    # Key of the game's entry in CONFIG.pickup_games[guild_id] (NULL on games created before it was stored).
+    config_key = TextField(null=True)
+
+
+@SQLiteBase.register
+class PickupPlayer(SQLiteBase):
+    """One player on a pickup game's roster (replaces the old ``extra_info['players']`` list)."""
+
+    class Meta:
+        table_name = 'pickup_players'
+        primary_key = CompositeKey('game_id', 'user_id')
+        indexes = (
+            (('user_id',), False),
+        )
+
+    game_id = IntegerField()
+    user_id = BigIntegerField()
+    joined_at = DateTimeField(default=datetime.now)
+
+
+def migrate_roster_from_extra_info():
+    """Move any legacy ``extra_info['players']`` lists into pickup_players. Idempotent: a game's list is
+    dropped from its extra_info in the same transaction its rows are inserted."""
+    legacy = PickupGame.select().where(fn.json_extract(PickupGame.extra_info, '$.players').is_null(False))
+    moved = 0
+    with sqlite_db.atomic():
+        for game in legacy:
+            players = game.extra_info.pop('players')
+            if players:
+                PickupPlayer.insert_many(
+                    [{'game_id': game.id, 'user_id': player, 'joined_at': game.start_datetime} for player in players]
+                ).on_conflict_ignore().execute()
+            game.save(only=[PickupGame.extra_info])
+            moved += 1
+    return moved
@@ -5,23 +5,24 @@ from disco.types.message import MessageModal, ActionRow, TextInputStyles, Compon
 from PunyBot import CONFIG
 from PunyBot.constants import Messages
 from PunyBot.models import Agreement
+from PunyBot.utils.interactions import router
+from PunyBot.utils.write_behind import write_behind
 
 
 class AgreementPlugin(Plugin):
     def load(self, ctx):
+        router.add(self, self.button_listener, (3,), custom_id="agreement_start")
+        router.add(self, self.button_listener, (5,), custom_id="agreement_submit")
         super(AgreementPlugin, self).load(ctx)
 
-    @Plugin.listen('InteractionCreate')
+    def unload(self, ctx):
+        router.remove_owner(self)
+        super(AgreementPlugin, self).unload(ctx)
+
     def button_listener(self, event):
 
         #Todo: Switch back to event.type after lib patch.
-        if not (event.raw_data['interaction']['type'] != 3 or event.raw_data['interaction']['type'] != 5):
-            return
-
         if event.raw_data['interaction']['type'] != InteractionType.MODAL_SUBMIT:
-            if event.data.custom_id != "agreement_start":
-                return
-
             if CONFIG.agreement.pre_process_role not in event.member.roles or CONFIG.agreement.post_process_role in event.member.roles:
                 return event.reply(type=6)
 
@@ -54,9 +55,6 @@ class AgreementPlugin(Plugin):
 
             return event.reply(type=9, modal=modal)
         else:
-            if event.data.custom_id != "agreement_submit":
-                return
-
             first_name = None
             last_name = None
 
@@ -79,7 +77,7 @@ class AgreementPlugin(Plugin):
                 guild.get_member(event.member.id).modify(roles=tmp_roles, reason="User signed agreement. Assigning proper role!")
             except:
                 self.log.error(f"Unable to add role to user who signed the agreement. User ID {event.member.id}")
-            Agreement.create(user_id=event.member.id, first_name=first_name, last_name=last_name)
+            write_behind.execute(Agreement.insert(user_id=event.member.id, first_name=first_name, last_name=last_name))
 
             return event.reply(type=6)
 
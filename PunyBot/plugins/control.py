@@ -3,57 +3,71 @@
 import os
 import signal
 
-from gevent.exceptions import BlockingSwitchOutError
+import gevent
 
 from disco.bot.plugin import Plugin
 
-from PunyBot.database import sqlite_db
+from PunyBot.utils.profiler import DEFAULT_SECONDS, MAX_SECONDS, profiler
+from PunyBot.utils.shutdown import ShutdownCoordinator
 
 PY_CODE_BLOCK = u'```py\n{}\n```'
 
+# `kill -USR2 <pid>` profiles every greenlet for DEFAULT_SECONDS (see PunyBot.utils.profiler).
+PROFILE_SIGNAL = signal.SIGUSR2
+
 
 class ControlPlugin(Plugin):
     def load(self, ctx):
         super(ControlPlugin, self).load(ctx)
+        self.shutdown = None  # the graceful shutdown greenlet, once one has started
         # register Process listeners
         signal.signal(signal.SIGINT, self.process_control)
         signal.signal(signal.SIGTERM, self.process_control)
         # signal.signal(signal.SIGUSR1, self.ProcessControl)
+        signal.signal(PROFILE_SIGNAL, self.on_profile_signal)
+
+    def on_profile_signal(self, signal_number=None, frame=None):
+        self.spawn(self.profile_greenlets, DEFAULT_SECONDS)
+
+    def profile_greenlets(self, seconds, channel=None):
+        """Run the greenlet profiler and log its report (and post it to ``channel`` if given)."""
+        if profiler.running:
+            self.log.warning("Profile requested while one is already running, ignoring.")
+            return
+        report, path = profiler.profile(seconds)
+        self.log.info("Greenlet profile written to %s:\n%s", path, report)
+        if channel is not None:
+            channel.send_message(f"`{path}`\n```\n{report}\n```"[:2000])
+
+    @Plugin.command('profile', '[seconds:int]')
+    def profile_command(self, event, seconds=DEFAULT_SECONDS):
+        if profiler.running:
+            return event.msg.reply("`A profile is already running.`")
+        seconds = max(1, min(MAX_SECONDS, seconds))
+        self.spawn(self.profile_greenlets, seconds, event.channel)
+        return event.msg.reply(f"`Profiling greenlets for {seconds}s...`")
 
     def process_control(self, signal_number=None, frame=None):
-        if signal_number in [2, 15]:
+        if signal_number in [2, 15] and self.shutdown is None:
             self.log.warning("Graceful shutdown initiated")
+            # Stop taking gateway events; disco's main greenlet keeps waiting on ws_event, which is
+            # only set once the coordinator is done, so the process outlives the drain.
             self.client.gw.shutting_down = True
             self.client.gw.ws.close(status=4000)
-            self.client.gw.ws_event.set()
-            # unload plugins
-            for x in list(self.bot.plugins):
-                if x == 'CorePlugin' or x == 'ControlPlugin':
-                    self.log.info('Skipping plugin: {}'.format(x))
-                    continue
-                plugin = next((v for k, v in self.bot.plugins.items() if k.lower() == x.lower()), None)
-                if plugin:
-                    self.log.info('Unloading plugin: {}'.format(x))
-                    try:
-                        self.bot.rmv_plugin(plugin)
-                    except BlockingSwitchOutError:
-                        self.log.warning("Plugin {} Has a active greenlet/schedule, Bruteforce".format(x))
-                        plugin.greenlet = []
-                        plugin.schedule = []
-                        for listener in plugin.listeners:
-                            listener.remove()
-                        pass
-                    except Exception:
-                        self.log.exception("Failed to unload: {}".format(x))
-            self.log.info("Closing connection to database")
-            try:
-                sqlite_db.close()
-                self.log.info("Database connection closed!")
-            except Exception:
-                self.log.exception("Failed to close Database connection.")
+            # Signal handlers can run on the hub, where nothing may block: shut down on a greenlet.
+            self.shutdown = gevent.spawn(self.graceful_shutdown)
         elif signal_number == 10:  # sysuser1
             self.log.warning("Resetting shard connection to Discord")
             self.client.gw.ws.close(status=4000)
         else:
+            # Anything else - including a second SIGINT/SIGTERM while a graceful shutdown runs.
             self.log.warning("Force Shutdown initiated")
             os.kill(os.getpid(), signal.SIGKILL)
+
+    def graceful_shutdown(self):
+        try:
+            ShutdownCoordinator(self.bot, keep=('CorePlugin', 'ControlPlugin')).run()
+        except Exception:
+            self.log.exception("Graceful shutdown failed")
+        finally:
+            self.client.gw.ws_event.set()
@@ -1,9 +1,12 @@
 import contextlib
 import os
+import re
+import time
 from datetime import datetime
+from urllib.parse import urlsplit
 
-import gevent
 import requests
+from gevent.pool import Pool
 from disco.api.http import APIException
 from disco.bot import Plugin
 from disco.bot.command import CommandEvent
@@ -14,6 +17,85 @@ from dotenv import load_dotenv
 
 from PunyBot import CONFIG
 from PunyBot.constants import Messages
+from PunyBot.models import SteamAppCache
+from PunyBot.utils.http_pool import http_client
+from PunyBot.utils.interactions import router
+from PunyBot.utils.metrics import metrics, track_poll
+from PunyBot.utils.post_scheduler import post_scheduler
+from PunyBot.utils.write_behind import write_behind
+
+STEAM_PLAYERS_URL = "https://api.steampowered.com/ISteamUserStats/GetNumberOfCurrentPlayers/v1/?appid={app_id}"
+STEAM_APPDETAILS_URL = "https://store.steampowered.com/api/appdetails?appids={app_id}"
+
+# How often every status app's player count is re-fetched in the background. The status rotation
+# itself ticks every 5 s and only reads what this left in memory.
+PLAYER_COUNT_REFRESH_SECONDS = 30
+
+# Concurrent GetNumberOfCurrentPlayers calls per refresh.
+STEAM_FETCH_CONCURRENCY = 4
+
+# Store metadata (names) is persisted and only re-fetched once it is this old (seconds).
+APP_METADATA_MAX_AGE = 7 * 86400
+
+# Per-endpoint backoff after consecutive failures: BACKOFF_BASE, doubling up to BACKOFF_MAX (seconds).
+STEAM_BACKOFF_BASE = 15
+STEAM_BACKOFF_MAX = 900
+
+# Chat commands only count when the message starts with this.
+COMMAND_PREFIX = '!'
+
+# Every Discord REST call, recorded from disco's after_request hook for the metrics endpoint. Routes are
+# the request path with ids, tokens and reaction emoji folded out, so the label set stays small.
+DISCORD_REQUEST_SECONDS = metrics.histogram("punybot_discord_request_seconds", "Discord REST call latency.",
+                                            ("method", "route"))
+DISCORD_RESPONSES = metrics.counter("punybot_discord_responses_total", "Discord REST responses, by status.",
+                                    ("method", "route", "status"))
+DISCORD_LIMITER_WAIT = metrics.counter("punybot_discord_rate_limit_wait_seconds_total",
+                                       "Time Discord REST calls were held by disco's rate limiter before sending.")
+
+# Path segments that are ids (snowflakes) or tokens (webhook/interaction tokens are long and opaque).
+_ID_SEGMENT = re.compile(r"^\d+$")
+_TOKEN_MIN_LENGTH = 32
+
+
+def _discord_route(url):
+    """``/channels/:id/messages/:id``-style route for a Discord API url."""
+    segments = urlsplit(url).path.split("/")
+    if len(segments) > 2 and segments[1] == "api" and segments[2].startswith("v"):
+        segments = segments[:1] + segments[3:]
+    route = []
+    for segment in segments:
+        if _ID_SEGMENT.match(segment):
+            segment = ":id"
+        elif route and route[-1] == "reactions" and segment:
+            segment = ":emoji"
+        elif len(segment) >= _TOKEN_MIN_LENGTH:
+            segment = ":token"
+        route.append(segment)
+    return "/".join(route)
+
+
+class _Backoff(object):
+    """Exponential backoff for one Steam endpoint: after ``n`` consecutive failures the endpoint is
+    skipped for ``STEAM_BACKOFF_BASE * 2 ** (n - 1)`` seconds (capped); any success resets it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.until = 0
+
+    def ready(self):
+        return time.monotonic() >= self.until
+
+    def failed(self, log):
+        self.failures += 1
+        delay = min(STEAM_BACKOFF_MAX, STEAM_BACKOFF_BASE * 2 ** (self.failures - 1))
+        self.until = time.monotonic() + delay
+        log.warning("[status] %s failed %d time(s) in a row; backing off %ss", self.name, self.failures, delay)
+
+    def succeeded(self):
+        self.failures = 0
+        self.until = 0
 
 
 class CorePlugin(Plugin):
@@ -23,81 +105,145 @@ class CorePlugin(Plugin):
         self.guild_menu_roles = {}
 
         self.current_status_app = None
-        self.bad_requests = 0
-        self.schedule_restarts = 0
 
-        # Player/Name Cache
-        self.game_titles = {}
+        # "!" command gate: admin roles as a set (re-read whenever the plugin is (re)loaded), a
+        # first word -> commands table built lazily from the bot's commands, and the gate's counters.
+        self.admin_roles = frozenset(CONFIG.admin_role)
+        self._command_table = None
+        self._command_table_source = None
+        self.command_counts = {"filtered": 0, "denied": 0, "unknown": 0, "dispatched": 0}
+        metrics.counter("punybot_command_messages_total", "Messages seen by the ! command listener, by result.",
+                        ("result",), fn=lambda: self.command_counts)
+
+        # Time every Discord REST call (chained in front of disco's own hook, which api.capture() uses).
+        self._previous_after_request = self.client.api.http.after_request
+        self.client.api.http.after_request = self._record_discord_request
+
+        if CONFIG.metrics and CONFIG.metrics.port:
+            metrics.serve(CONFIG.metrics.host, CONFIG.metrics.port)
+
+        # Player/Name Cache: counts are kept fresh by refresh_player_counts, names come from SQLite.
         self.player_counts = {}
+        self.steam_backoff = {"players": _Backoff("GetNumberOfCurrentPlayers"), "store": _Backoff("appdetails")}
+        self._load_app_metadata()
 
         for gid in CONFIG.roles:
             self.guild_menu_roles[gid] = []
             for role in CONFIG.roles[gid].select_menu:
                 self.guild_menu_roles[gid].append(role.role_id)
 
-        super(CorePlugin, self).load(ctx)
+        if CONFIG.status_apps:
+            self.register_schedule(self.refresh_player_counts, PLAYER_COUNT_REFRESH_SECONDS)
 
-    # Method to handle any bad steam requests from status updates
-    def handle_bad_requests(self):
-        self.bad_requests += 1
-        if self.bad_requests > 10:
-            self.schedule_restarts += 1
-            if self.schedule_restarts > 3:
-                # Reset values back to 0.
-                self.bad_requests = 0
-                self.schedule_restarts = 0
-
-                # Log and kill the scheduled task
-                self.log.error("Error: More than 3 restarts on the Status Scheduler. Killing until reboot or forced to restart via command.")
-                self.schedules['update_status'].kill()
-                return
+        router.add(self, self.test_menu_select, (3,), prefix='roles_menu_')
+        router.add(self, self.test_menu_select, (3,), prefix='rules_')
 
-            # Log, grab tasks, sleep, re-register, kill old one, reset counter.
-            self.log.error("Error: More than 10 bad steam reponses. Killing status scheduler, pausing for 15 seconds, and retrying.")
-            schedule = self.schedules['update_status']
-            gevent.sleep(10)
-            self.register_schedule(self.update_status, 5, init=False)
-            self.bad_requests = 0
-            schedule.kill()
-        return
+        super(CorePlugin, self).load(ctx)
 
-    def update_status(self):
-        players = 0
-        if not self.player_counts.get(self.current_status_app) or (datetime.now().timestamp() - self.player_counts[self.current_status_app]['last_requested']) > 30:
-            try:
-                # Public Steam Web API endpoint — GetNumberOfCurrentPlayers needs no API key.
-                r = requests.get(
-                    f"https://api.steampowered.com/ISteamUserStats/GetNumberOfCurrentPlayers/v1/?appid={self.current_status_app}")
-                if not r.json():
-                    self.log.error("Error: Unable to grab player information")
-                elif r.json()['response'].get('player_count') is not None:
-                    players = r.json()['response']['player_count']
-                    self.player_counts[self.current_status_app] = {'count': players, 'last_requested': datetime.now().timestamp()}
-            except Exception as e:
-                self.log.error("Error: Exception when getting players from Steam's API. Possible bad response? Skipping Status Update...")
-                self.handle_bad_requests()
-                return
-        else:
-            players = self.player_counts[self.current_status_app]['count']
+    def unload(self, ctx):
+        router.remove_owner(self)
+        self.client.api.http.after_request = self._previous_after_request
+        metrics.stop()
+        super(CorePlugin, self).unload(ctx)
 
-        app_name = None
-        if self.game_titles.get(self.current_status_app):
-            app_name = self.game_titles.get(self.current_status_app)
+    def _record_discord_request(self, response):
+        try:
+            r = response.response
+            route = _discord_route(r.url)
+            DISCORD_REQUEST_SECONDS.observe(r.elapsed.total_seconds(), method=r.request.method, route=route)
+            DISCORD_RESPONSES.inc(method=r.request.method, route=route, status=r.status_code)
+            if response.rate_limited_duration:
+                DISCORD_LIMITER_WAIT.inc(response.rate_limited_duration)
+        except Exception:
+            self.log.exception("Recording a Discord request's metrics failed")
+        if self._previous_after_request:
+            self._previous_after_request(response)
+
+    def _load_app_metadata(self):
+        """Store names persisted by earlier runs, so the status can show them without a store call."""
+        self.game_titles = {}
+        self.app_fetched = {}
+        for row in SteamAppCache.select().where(SteamAppCache.app.in_(list(CONFIG.status_apps))):
+            self.game_titles[row.app] = row.name
+            self.app_fetched[row.app] = row.fetched_at
+
+    def refresh_player_counts(self):
+        """Background refresher for the status rotation: every status app's player count, fetched
+        concurrently, plus store metadata for any app we have no (or only stale) metadata for. Each
+        Steam endpoint backs off on its own after failures; update_status only ever reads memory."""
+        try:
+            with track_poll("steam_status"):
+                self._refresh_counts()
+                self._refresh_metadata()
+        except Exception:
+            self.log.exception("[status] player count refresh failed (retrying next tick)")
+
+    def _refresh_counts(self):
+        players = self.steam_backoff["players"]
+        if not players.ready():
+            return
+        apps = list(CONFIG.status_apps)
+        counts = dict(Pool(STEAM_FETCH_CONCURRENCY).imap(self._fetch_player_count, apps))
+        fetched = {app: count for app, count in counts.items() if count is not None}
+        self.player_counts.update(fetched)
+        if fetched:
+            players.succeeded()
         else:
+            players.failed(self.log)
+
+    def _fetch_player_count(self, app):
+        # Public Steam Web API endpoint — GetNumberOfCurrentPlayers needs no API key.
+        try:
+            r = http_client.get(STEAM_PLAYERS_URL.format(app_id=app))
+            count = ((r.json() or {}).get('response') or {}).get('player_count')
+        except Exception as e:
+            self.log.error("[status] Unable to get the player count for app %s: %s", app, e)
+            return app, None
+        if count is None:
+            self.log.error("[status] No player count in Steam's response for app %s", app)
+        return app, count
+
+    def _refresh_metadata(self):
+        store = self.steam_backoff["store"]
+        now = datetime.now()
+        stale = [app for app in CONFIG.status_apps
+                 if app not in self.app_fetched
+                 or (now - self.app_fetched[app]).total_seconds() > APP_METADATA_MAX_AGE]
+        # The store API rate-limits hard: one app at a time, and stop at the first failure.
+        for app in stale:
+            if not store.ready():
+                return
             try:
-                r = requests.get(f"https://store.steampowered.com/api/appdetails?appids={self.current_status_app}")
-                if not r.json():
-                    self.log.error("Error: Unable to grab store app page")
-                else:
-                    if not r.json()[str(self.current_status_app)]['success']:
-                        self.log.error("Error: App not found on the steam store")
-                    else:
-                        app_name = r.json()[str(self.current_status_app)]['data']['name']
-                        self.game_titles[self.current_status_app] = app_name
+                r = http_client.get(STEAM_APPDETAILS_URL.format(app_id=app))
+                entry = (r.json() or {}).get(str(app)) or {}
             except Exception as e:
-                self.log.error("Error: Exception when getting app information from Steam's API. Possible bad response? Skipping Status Update...")
-                self.handle_bad_requests()
+                self.log.error("[status] Unable to get store details for app %s: %s", app, e)
+                store.failed(self.log)
                 return
+            store.succeeded()
+            if not entry.get('success'):
+                self.log.error("[status] App %s not found on the Steam store", app)
+                self.app_fetched[app] = now  # don't ask again until the metadata would be stale anyway
+                self.game_titles.setdefault(app, str(app))  # still rotate it into the status, by id
+                continue
+            data = entry.get('data') or {}
+            write_behind.execute(SteamAppCache.insert(
+                app=app, name=data.get('name') or str(app), app_type=data.get('type'),
+                header_image=data.get('header_image'), fetched_at=now).on_conflict_replace())
+            self.game_titles[app] = data.get('name') or str(app)
+            self.app_fetched[app] = now
+
+    def _next_status_app(self):
+        index = CONFIG.status_apps.index(self.current_status_app)
+        self.current_status_app = CONFIG.status_apps[(index + 1) % len(CONFIG.status_apps)]
+
+    def update_status(self):
+        app = self.current_status_app
+        players = self.player_counts.get(app)
+        app_name = self.game_titles.get(app)
+        if players is None or not app_name:
+            # Not refreshed yet (or Steam is backing off): show the next app that has data instead.
+            return self._next_status_app()
 
         try:
             self.bot.client.update_presence(Status.ONLINE,
@@ -106,10 +252,7 @@ class CorePlugin(Plugin):
             self.log.warning("[status] update_presence skipped (gateway reconnecting?): %s", e)
             return
 
-        if CONFIG.status_apps.index(self.current_status_app) == (len(CONFIG.status_apps) - 1):
-            self.current_status_app = CONFIG.status_apps[0]
-        else:
-            self.current_status_app = CONFIG.status_apps[CONFIG.status_apps.index(self.current_status_app) + 1]
+        self._next_status_app()
 
     @contextlib.contextmanager
     def send_control_message(self):
@@ -148,13 +291,11 @@ class CorePlugin(Plugin):
         if not len(CONFIG.status_apps):
             return self.log.info("Status apps is empty, skipping setting bot status.")
 
-        # Player counts come from the PUBLIC Steam Web API (api.steampowered.com),
-        # which needs no API key. Re-register cleanly so gateway reconnects don't
-        # orphan or duplicate the status greenlet (and reset failure counters).
+        # Player counts come from the PUBLIC Steam Web API (api.steampowered.com), which needs no
+        # API key, and are fetched by refresh_player_counts. Re-register cleanly so gateway
+        # reconnects don't orphan or duplicate the status greenlet.
         if self.schedules.get('update_status'):
             self.schedules['update_status'].kill()
-        self.bad_requests = 0
-        self.schedule_restarts = 0
 
         if self.current_status_app is None:
             from random import choice
@@ -168,28 +309,55 @@ class CorePlugin(Plugin):
             embed.color = 0xffb347
             embed.add_field(name='Replayed Events', value=str(self.bot.client.gw.replayed_events))
 
+    def _commands_for(self, content):
+        """(command, match) pairs for ``content`` (prefix already stripped), like disco's
+        ``get_commands_for_message`` but only regex-matching the commands whose trigger is the first
+        word; grouped/regex/multi-word commands are always tried. The table is rebuilt whenever
+        disco recomputes its command regex (a plugin was loaded or unloaded)."""
+        source = getattr(self.bot, 'command_matches_re', None)
+        if self._command_table is None or source is not self._command_table_source:
+            table, always = {}, []
+            for command in self.bot.commands:
+                if command.group or command.is_regex or any(' ' in t for t in command.triggers):
+                    always.append(command)
+                    continue
+                for trigger in command.triggers:
+                    table.setdefault(trigger.lower(), []).append(command)
+            self._command_table = (table, always)
+            self._command_table_source = source
+
+        table, always = self._command_table
+        word = content.split(None, 1)[0].lower() if content else ''
+        options = []
+        for command in table.get(word, []) + always:
+            match = command.compiled_regex.match(content)
+            if match:
+                options.append((command, match))
+        return sorted(options, key=lambda obj: obj[0].group is None)
+
     @Plugin.listen('MessageCreate')
     def on_command_msg(self, event):
         """
         Borrow by Nadie <iam@nadie.dev> (https://github.com/hackerjef/) [Used with permission]
         """
+        content = event.message.content
+        if not content or content[0] != COMMAND_PREFIX:
+            self.command_counts["filtered"] += 1
+            return
         if event.message.author.bot:
             return
         if not event.guild:
             return
 
-        has_permission = False
-        for role_id in CONFIG.admin_role:
-            if role_id in event.member.roles:
-                has_permission = True
-                break
-
-        if not has_permission:
+        if self.admin_roles.isdisjoint(event.member.roles):
+            self.command_counts["denied"] += 1
             return
 
-        commands = self.bot.get_commands_for_message(False, {}, '!', event.message)
+        commands = self._commands_for(content[len(COMMAND_PREFIX):])
         if not commands:
+            self.command_counts["unknown"] += 1
             return
+        self.command_counts["dispatched"] += 1
         for command, match in commands:
             return command.plugin.execute(CommandEvent(command, event, match))
 
@@ -254,6 +422,62 @@ class CorePlugin(Plugin):
         self.register_schedule(self.update_status, 5)
         return event.msg.add_reaction("👍")
 
+    # TODO: Replace with /command
+    @Plugin.command('httpstats')
+    def http_stats(self, event):
+        stats = http_client.stats()
+        if not stats:
+            return event.msg.reply("`No outbound HTTP requests made yet.`")
+
+        lines = []
+        for host, s in sorted(stats.items()):
+            lines.append(f"{host}: {s['requests']} req, {s['errors']} err, {s['connections']} conn, "
+                         f"{s['pool_hits']} pool hits ({s['handshakes_avoided']} TLS handshakes avoided), "
+                         f"p50/p90/p99 {s['p50_ms']}/{s['p90_ms']}/{s['p99_ms']} ms")
+        return event.msg.reply("```\n{}\n```".format("\n".join(lines))[:2000])
+
+    # TODO: Replace with /command
+    @Plugin.command('poststats')
+    def post_stats(self, event):
+        stats = post_scheduler.stats()
+        if not stats:
+            return event.msg.reply("`No scheduled posts made yet.`")
+
+        lines = [f"pending {post_scheduler.pending()}, 429s {post_scheduler.rate_limited} "
+                 f"({post_scheduler.global_rate_limited} global)"]
+        for channel_id, s in sorted(stats.items()):
+            lines.append(f"{channel_id}: {s['sent']} sent, {s['failed']} failed, {s['queued']} queued "
+                         f"(peak {s['peak_queued']}), {s['rate_limited']} 429s, held {s['waited_s']}s, "
+                         f"bucket {s['tokens']}/{s['capacity']}")
+        return event.msg.reply("```\n{}\n```".format("\n".join(lines))[:2000])
+
+    @Plugin.command('dbstats')
+    def db_stats(self, event):
+        s = write_behind.stats()
+        return event.msg.reply(f"```\npending {s['pending']} (peak {s['peak_pending']}), {s['committed']} committed, "
+                               f"{s['failed']} failed in {s['batches']} batches (avg {s['avg_batch']}, largest "
+                               f"{s['largest_batch']}), commit {s['avg_commit_ms']}ms avg, latency "
+                               f"{s['p50_latency_ms']}ms p50 / {s['max_latency_ms']}ms max\n```")
+
+    @Plugin.command('interactionstats')
+    def interaction_stats(self, event):
+        stats = router.stats()
+        if not stats:
+            return event.msg.reply(f"`No routed interactions yet ({router.unrouted} unrouted).`")
+
+        lines = [f"unrouted {router.unrouted}, ack deadline 3s"]
+        for key, s in sorted(stats.items()):
+            lines.append(f"{key}: {s['calls']} calls, {s['errors']} errors, {s['late']} late, handler "
+                         f"{s['handler_ms']}ms avg, age p50 {s['p50_s']}s / p95 {s['p95_s']}s / max {s['max_s']}s")
+        return event.msg.reply("```\n{}\n```".format("\n".join(lines))[:2000])
+
+    @Plugin.command('commandstats')
+    def command_stats(self, event):
+        c = self.command_counts
+        table = self._command_table[0] if self._command_table else {}
+        return event.msg.reply(f"`{c['filtered']} filtered (no prefix), {c['denied']} denied, {c['unknown']} "
+                               f"unknown, {c['dispatched']} dispatched; {len(table)} triggers indexed`")
+
     @Plugin.command('echo', '<msg:snowflake> [channel:snowflake|channel] [topic:str...]')
     def echo_command(self, event, msg, channel=None, topic=None):
         api_message = None
@@ -317,12 +541,13 @@ class CorePlugin(Plugin):
                 raise e
         return event.msg.add_reaction("👍")
 
+    # The one InteractionCreate listener: every plugin's buttons, menus, modals and slash commands are
+    # routed from here (see PunyBot.utils.interactions).
     @Plugin.listen('InteractionCreate')
-    def test_menu_select(self, event):
+    def on_interaction(self, event):
+        router.dispatch(event)
 
-        # TODO: Fix after Disco fixes their enum bug.
-        if event.raw_data['interaction']['type'] != 3:
-            return
+    def test_menu_select(self, event):
 
         if event.data.custom_id.startswith('roles_menu_'):
             tmp_roles = event.member.roles
@@ -1,14 +1,19 @@
+import functools
+import logging
 import re
 import time
 from collections import deque
 
 import gevent
-import requests
 from disco.bot import Plugin
 
 from PunyBot import CONFIG
 from PunyBot.constants import Messages
 from PunyBot.models import DystopiaFeedCache
+from PunyBot.utils.http_pool import http_client
+from PunyBot.utils.metrics import POLLS, metrics, track_poll
+from PunyBot.utils.post_scheduler import post_scheduler
+from PunyBot.utils.write_behind import FLUSH_TIMEOUT, write_behind
 
 
 # Dystopia team ids -> human labels (2 = Punks, 3 = Corporation; see the stats schema).
@@ -70,9 +75,6 @@ CURSOR_TS_PAD = 11
 # Bound on the in-memory "already posted" id guard (belt-and-suspenders on top of cursor dedupe).
 SEEN_MAXLEN = 2000
 
-# Small pause between individual posts so a legitimate multi-event batch doesn't hammer Discord.
-POST_SPACING_SECONDS = 0.4
-
 # Events collected in one poll are BATCHED into combined messages (consecutive same-channel lines
 # joined with newlines) instead of one message per event - a busy round's kill burst is one or two
 # posts, not fifteen, which is what keeps the bot clear of Discord's ~5 msg/5 s per-channel limit.
@@ -95,10 +97,28 @@ _ZWSP = "​"             # zero-width space, inserted to break mention tokens w
 _MD_META = re.compile(r"([\\`*_~|\[\]()])")
 _WS_RUN = re.compile(r"\s+")  # collapse any whitespace run (incl. newlines/tabs) to one space
 
+# Bound on the raw feed weapon string -> emoji markup memo (see _weapon_emoji). The real weapon set is
+# a few dozen strings; the cap only matters if the feed ever sends garbage.
+WEAPON_LOOKUP_MAX = 512
+
+# Bound on each per-fragment render memo (escaped names, player links, round tags/urls; see
+# _compile_templates). A drain repeats the same few hundred players, servers and rounds constantly.
+FORMAT_CACHE_MAX = 4096
+
 # Emit a "still alive, caught up" heartbeat every this-many quiet cycles so a working-but-idle poller
 # (nobody playing => nothing to post) is distinguishable in the logs from a dead greenlet.
 HEARTBEAT_EVERY = 30
 
+# Feed telemetry for the metrics endpoint. Cursor lag is the age of the stored cursor after each poll -
+# it climbs when the poller falls behind (or stops); buffer depth is pulled at scrape time (see load).
+DRAIN_PAGES = metrics.histogram("punybot_dystopia_drain_pages", "Feed pages walked per drain.",
+                                buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, MAX_DRAIN_PAGES))
+DRAIN_EVENTS = metrics.counter("punybot_dystopia_events_total", "Feed events drained.")
+FEED_ERRORS = metrics.counter("punybot_dystopia_feed_errors_total", "Feed page fetches that failed.")
+CURSOR_LAG = metrics.gauge("punybot_dystopia_cursor_lag_seconds", "Age of the stored feed cursor after the last poll.")
+FLUSHED_LINES = metrics.counter("punybot_dystopia_flushed_lines_total", "Buffered lines posted by a flush.",
+                                ("buffer",))
+
 # -- per-round threads ----------------------------------------------------------------------------
 # When enabled (dystopia.thread_per_round), each LIVE round's feed goes into its own Discord thread:
 # the channel shows one round-start header per round, and that round's kills/captures/round-end land
@@ -111,8 +131,8 @@ ROUND_THREADS_MAX = 400       # bound on the in-memory round_id -> thread_id map
 
 # Message templates live in config/message_templates.yaml (loaded as `Messages`), but that file is a
 # mounted config volume in deployment and can lag the repo — a missing key would AttributeError mid-poll
-# and block every post. These built-in defaults keep the plugin self-contained: `_tpl` prefers the
-# external template when present and falls back here otherwise. Keep them in sync with the yaml.
+# and block every post. These built-in defaults keep the plugin self-contained: `_compile_templates` prefers
+# the external template when present and falls back here otherwise. Keep them in sync with the yaml.
 # Every line leads with a [R<roundId>](<url>) tag: events from multiple servers interleave in one
 # channel, so each line carries its round's unique id, and the tag doubles as the "watch this round"
 # link. The <> inside the masked link suppresses Discord's embed preview. (A "join server" link can't
@@ -153,9 +173,11 @@ class DystopiaPlugin(Plugin):
     """
 
     def load(self, ctx):
+        self._compile_templates()
         self._seen_ids = deque(maxlen=SEEN_MAXLEN)
         self._seen_set = set()
         self._polling = False  # re-entrancy guard: a long backfill must not overlap the next tick
+        self._draining = False  # set by drain() at shutdown: no new poll starts
         self._polls = 0          # cycle counter, for a low-frequency "still alive" heartbeat
         self._announced_resume = False  # log the resume cursor + age exactly once at startup
         # Kills are buffered here (as postable tuples) and flushed on a timer / round-end / unload,
@@ -168,6 +190,14 @@ class DystopiaPlugin(Plugin):
         # round_id -> thread channel id, for per-round threading. Bounded via _round_thread_order.
         self._round_threads = {}
         self._round_thread_order = deque()
+        # Weapon emoji index: WEAPON_EMOJI display name -> rendered `<:dys_x:id>` markup for the emoji
+        # guild, built on first use and rebuilt from GuildCreate / GuildEmojisUpdate. None = not built.
+        self._weapon_markup = None
+        self._weapon_lookup = {}   # raw feed weapon string -> markup (or None), memoized per index
+        self._emoji_guild_id = None
+        self._emoji_hits = self._emoji_misses = 0
+        metrics.gauge("punybot_dystopia_buffer_depth", "Lines waiting in the kill/chat buffers.", ("buffer",),
+                      fn=lambda: {"kill": len(self._kill_buffer), "chat": len(self._chat_buffer)})
 
         cfg = CONFIG.dystopia
         if not cfg or (not cfg.channel_id and not cfg.server_channels):
@@ -196,6 +226,16 @@ class DystopiaPlugin(Plugin):
 
         super(DystopiaPlugin, self).load(ctx)
 
+    def drain(self):
+        """Shutdown step (see PunyBot.utils.shutdown): let an in-flight poll finish - its cursor saves
+        are already queued on the write-behind queue - start no new one, then post the kill and chat
+        buffers. unload() flushes again, but by then there's nothing left."""
+        self._draining = True
+        while self._polling or self._flushing or self._flushing_chat:
+            gevent.sleep(0.1)
+        self.flush_kills()
+        self.flush_chat()
+
     def unload(self, ctx):
         # Flush any buffered kills before the schedules are killed, so a redeploy/shutdown never drops
         # the current kill window. super().unload() then kills greenlets/listeners/schedules.
@@ -262,8 +302,8 @@ class DystopiaPlugin(Plugin):
     def _post_return(self, channel_id, content):
         """Like _post_message but returns the created Message (for thread creation) or None."""
         try:
-            return self.bot.client.api.channels_messages_create(
-                channel_id, content=content, allowed_mentions={"parse": []})
+            return post_scheduler.send(self.bot.client.api, channel_id, content=content,
+                                       allowed_mentions={"parse": []})
         except Exception as e:
             self.log.error("[dystopia] Failed to post to channel %s: %s", channel_id, e)
             return None
@@ -272,7 +312,7 @@ class DystopiaPlugin(Plugin):
         """A concise (<=100 char) thread title: the round tag digits + map."""
         rid = event.get("roundId")
         last5 = str(rid or 0)[-5:].zfill(5)
-        game_map = self._escape_md(event.get("mapName") or "")  # display-only; keep it short/plain
+        game_map = self._escape_name(event.get("mapName") or "")  # display-only; keep it short/plain
         name = "Round #{}".format(last5)
         if game_map:
             name += " · " + game_map
@@ -310,55 +350,72 @@ class DystopiaPlugin(Plugin):
         start_ts = int(time.time()) - int(days) * 86400
         return "{ts:0{pad}d}:0".format(ts=max(0, start_ts), pad=CURSOR_TS_PAD)
 
+    def _compile_templates(self, cache_max=FORMAT_CACHE_MAX):
+        """Resolve every message template once per load - the external one
+        (config/message_templates.yaml) if it's defined, else the built-in default, which guards against
+        a stale/partial mounted template file crashing a poll - and bind its formatter. Also (re)creates
+        the bounded LRU memos for the fragments that repeat across a drain: escaped names, player
+        links, round tags and round urls. ``cache_max=0`` disables the memos (benchmark baseline)."""
+        self._templates = {name: getattr(Messages, name, None) or default
+                           for name, default in DEFAULT_TEMPLATES.items()}
+        self._render = {name: tpl.format for name, tpl in self._templates.items()}
+        memo = functools.lru_cache(maxsize=cache_max)
+        self._escape_name = memo(self._escape_md)
+        self._player_links = memo(self._build_player_link)
+        self._round_tags = memo(self._build_round_tag)
+        self._round_url = memo(self._build_round_url)
+
     def _tpl(self, name):
-        """Message template ``name``: the external one (config/message_templates.yaml) if it's defined,
-        else the built-in default. Guards against a stale/partial mounted template file crashing a poll."""
-        return getattr(Messages, name, None) or DEFAULT_TEMPLATES[name]
+        """Message template ``name`` as resolved at load (see _compile_templates)."""
+        return self._templates[name]
 
     def _format(self, event):
         """Return the message string for an event, or None to skip (e.g. kills when disabled)."""
-        cfg = CONFIG.dystopia
         kind = event.get("kind")
-        game_map = self._escape_md(event.get("mapName") or "unknown")
-        server = self._escape_md(event.get("serverName") or "a Dystopia server")
+        if kind not in ("round_start", "round_end", "capture"):
+            # Kills are NOT formatted here: they're batched (see _format_kill / _drain_and_post / flush_kills).
+            return None
+        game_map = self._escape_name(event.get("mapName") or "unknown")
+        server = self._escape_name(event.get("serverName") or "a Dystopia server")
         round_id = event.get("roundId")
-        round_url = f"{self.feed_url}/round/{round_id}"
+        round_url = self._round_url(round_id)
         actor = event.get("actor") or {}
-        victim = event.get("victim") or {}
 
         if kind == "round_start":
-            return self._tpl("dystopia_round_start").format(
+            return self._render["dystopia_round_start"](
                 map=game_map, server=server, round_id=round_id, round_url=round_url)
 
         if kind == "round_end":
             team = event.get("winningTeam")
             winner = f"{TEAM_NAMES[team]} won" if team in TEAM_NAMES else "Round ended"
-            return self._tpl("dystopia_round_end").format(
+            return self._render["dystopia_round_end"](
                 winner=winner, map=game_map, server=server, round_id=round_id, round_url=round_url)
 
         if kind == "capture":
-            return self._tpl("dystopia_capture").format(
-                player=self._escape_md(actor.get("name") or "Someone"),
-                objective=self._escape_md(event.get("objective") or "an objective"),
+            return self._render["dystopia_capture"](
+                player=self._escape_name(actor.get("name") or "Someone"),
+                objective=self._escape_name(event.get("objective") or "an objective"),
                 map=game_map,
                 round_id=round_id,
                 round_url=round_url,
             )
 
-        # Kills are NOT formatted here: they're batched (see _format_kill / _drain_and_post / flush_kills).
-        return None
-
     # -- kill line rendering ---------------------------------------------------------------------
 
+    def _build_round_url(self, round_id):
+        return f"{self.feed_url}/round/{round_id}"
+
     def _round_tag(self, round_id):
+        return self._round_tags(round_id)
+
+    def _build_round_tag(self, round_id):
         """Round tag for batched kill lines: the last 5 digits (zero-padded) HYPERLINKED to the round
         page, wrapped in LITERAL brackets - e.g. 2000000112 -> `[00112]` where `00112` links to the
         round and the `[` `]` are plain text. Per Mike: link the digits, not the brackets. The brackets
         are backslash-escaped so Discord's masked-link parser does not fold them into the link, and the
         <> around the url suppresses the embed preview (same as the round-start/end templates)."""
         last5 = str(round_id or 0)[-5:].zfill(5)
-        round_url = f"{self.feed_url}/round/{round_id}"
-        return f"\\[[{last5}](<{round_url}>)\\]"
+        return f"\\[[{last5}](<{self._round_url(round_id)}>)\\]"
 
     def _escape_md(self, s):
         """Neutralize a user-controlled string for inline use in a Discord message: collapse whitespace
@@ -373,15 +430,18 @@ class DystopiaPlugin(Plugin):
         return s.replace("@", "@" + _ZWSP).replace("<", "<" + _ZWSP)
 
     def _player_link(self, player):
+        player = player or {}
+        raw = player.get("name")
+        if not raw:
+            return None
+        return self._player_links(raw, player.get("communityId"))
+
+    def _build_player_link(self, raw, cid):
         """A killer/victim as `**[Name](<{feed}/player/<communityId>>)**`, or bold-only if we have no
         stable id (environment/suicide victims have no communityId). communityId is the steamid64 the
         stats site keys player pages on (verified: GET /player/<communityId> -> 200). The name is
         markdown-escaped (`_escape_md`) so a crafted name can't break out of the masked link or ping."""
-        raw = (player or {}).get("name")
-        if not raw:
-            return None
         name = self._escape_md(raw)
-        cid = (player or {}).get("communityId")
         if cid:
             return "**[{name}](<{url}/player/{cid}>)**".format(name=name, url=self.feed_url, cid=cid)
         return "**{}**".format(name)
@@ -398,23 +458,69 @@ class DystopiaPlugin(Plugin):
                 return g
         return None
 
+    def _index_emojis(self, guild_id, emojis):
+        """(Re)build the weapon index from one guild's emojis: every WEAPON_EMOJI display name whose
+        `dys_<short>` emoji exists maps straight to its rendered markup."""
+        by_name = {e.name: str(e) for e in emojis if (e.name or "").startswith("dys_")}
+        self._weapon_markup = {weapon: by_name["dys_" + short]
+                               for weapon, short in WEAPON_EMOJI.items() if "dys_" + short in by_name}
+        self._weapon_lookup = {}
+        self._emoji_guild_id = guild_id if by_name else None
+        self.log.info("[dystopia] weapon emoji index built from guild %s: %d/%d weapon names resolved.",
+                      guild_id, len(self._weapon_markup), len(WEAPON_EMOJI))
+
+    def _rebuild_emoji_index(self):
+        guild = self._emoji_guild()
+        if guild is None:
+            self._weapon_markup, self._weapon_lookup, self._emoji_guild_id = {}, {}, None
+            return
+        self._index_emojis(guild.id, guild.emojis.values())
+
+    def _on_guild_emojis(self, guild_id, emojis):
+        """Keep the index in step with a guild's (new) emoji set. With dystopia.guild_id configured only
+        that guild matters; otherwise the indexed guild is refreshed, or adopted if none is indexed."""
+        if self._weapon_markup is None:
+            return  # not built yet; the first kill line builds it from current state
+        gid = CONFIG.dystopia.guild_id if CONFIG.dystopia else None
+        if gid:
+            if guild_id == gid:
+                self._index_emojis(guild_id, emojis)
+            return
+        if guild_id == self._emoji_guild_id:
+            self._index_emojis(guild_id, emojis)
+            if self._emoji_guild_id is None:
+                self._rebuild_emoji_index()  # that guild dropped its dys_ emojis; look elsewhere
+        elif self._emoji_guild_id is None and any((e.name or "").startswith("dys_") for e in emojis):
+            self._index_emojis(guild_id, emojis)
+
+    @Plugin.listen('GuildEmojisUpdate')
+    def on_guild_emojis_update(self, event):
+        self._on_guild_emojis(event.guild_id, event.emojis)
+
+    @Plugin.listen('GuildCreate')
+    def on_guild_create(self, event):
+        self._on_guild_emojis(event.guild.id, list(event.guild.emojis.values()))
+
     def _weapon_emoji(self, weapon):
-        """Custom-emoji markup (`<:dys_x:id>`) for a feed weapon display-name, resolved BY NAME from the
-        guild at runtime (survives Mike re-uploading the emojis with new ids), or None to fall back to
-        plain text. Maps the feed's weapon name -> `dys_<short>` via WEAPON_EMOJI."""
+        """Custom-emoji markup (`<:dys_x:id>`) for a feed weapon display-name, or None to fall back to
+        plain text. Resolved BY NAME against the emoji guild (survives Mike re-uploading the emojis with
+        new ids) through the prebuilt index, so each kill line is a dict lookup rather than a scan of
+        every guild's emojis."""
         if not weapon:
             return None
-        short = WEAPON_EMOJI.get(weapon.strip().lower())
-        if not short:
-            return None
-        guild = self._emoji_guild()
-        if not guild:
-            return None
-        name = "dys_" + short
-        for e in guild.emojis.values():
-            if e.name == name:
-                return str(e)  # disco Emoji.__str__ -> "<:name:id>" (or "<a:name:id>")
-        return None
+        if self._weapon_markup is None:
+            self._rebuild_emoji_index()
+        try:
+            markup = self._weapon_lookup[weapon]
+        except KeyError:
+            markup = self._weapon_markup.get(weapon.strip().lower())
+            if len(self._weapon_lookup) < WEAPON_LOOKUP_MAX:
+                self._weapon_lookup[weapon] = markup
+        if markup:
+            self._emoji_hits += 1
+        else:
+            self._emoji_misses += 1
+        return markup
 
     def _format_kill(self, event):
         """The batched kill line: plain round tag, player-stats links, weapon emoji.
@@ -424,8 +530,7 @@ class DystopiaPlugin(Plugin):
         weapon = event.get("weapon")
         emoji = self._weapon_emoji(weapon)
         weapon_part = emoji if emoji else "with {}".format(weapon or "an unknown weapon")
-        return "{tag} {killer} killed {victim} {weapon}".format(
-            tag=self._round_tag(event.get("roundId")), killer=killer, victim=victim, weapon=weapon_part)
+        return f"{self._round_tag(event.get('roundId'))} {killer} killed {victim} {weapon_part}"
 
     def _sanitize_chat(self, text):
         """A chat message body, made safe for Discord: escaped/defanged via `_escape_md`, then length
@@ -453,13 +558,30 @@ class DystopiaPlugin(Plugin):
         try:
             # allowed_mentions parse:[] is a hard server-side guarantee that no relay/build
             # post can ever ping (@everyone/@here/@user/role), independent of content escaping.
-            self.bot.client.api.channels_messages_create(
-                channel_id, content=content, allowed_mentions={"parse": []})
+            post_scheduler.send(self.bot.client.api, channel_id, content=content, allowed_mentions={"parse": []})
             return True
         except Exception as e:
             self.log.error("[dystopia] Failed to post to channel %s: %s", channel_id, e)
             return False
 
+    def _post_chunks(self, chunks):
+        """Queue every (channel_id, content, group) chunk on the post scheduler at once - chunks for
+        different channels go out in parallel, a busy channel's queue up behind its rate limit - then
+        yield (group, posted) in the ORIGINAL order as each one completes, so callers can advance the
+        cursor strictly in order."""
+        api = self.bot.client.api
+        pending = [(channel_id, group, post_scheduler.submit(api, channel_id, content=content,
+                                                             allowed_mentions={"parse": []}))
+                   for channel_id, content, group in chunks]
+        for channel_id, group, result in pending:
+            try:
+                post_scheduler.wait(result)
+            except Exception as e:
+                self.log.error("[dystopia] Failed to post to channel %s: %s", channel_id, e)
+                yield group, False
+            else:
+                yield group, True
+
     def _postable(self, event):
         """(event_id, channel_id, content, cursor) for a NEW, postable NON-kill event, or None to skip."""
         event_id = event.get("id")
@@ -532,11 +654,11 @@ class DystopiaPlugin(Plugin):
             # Swap the buffer out atomically (before any gevent yield) so a concurrent flush is a no-op.
             buf, self._kill_buffer = self._kill_buffer, []
             posted = messages = 0
-            for channel_id, content, group in self._chunk(buf):
-                if self._post_message(channel_id, content):
+            for group, ok in self._post_chunks(self._chunk(buf)):
+                if ok:
                     posted += len(group)
                     messages += 1
-                gevent.sleep(POST_SPACING_SECONDS)
+            FLUSHED_LINES.inc(posted, buffer="kill")
             if posted:
                 self.log.info("[dystopia] Flushed %d buffered kill(s) in %d message(s).", posted, messages)
         finally:
@@ -558,14 +680,14 @@ class DystopiaPlugin(Plugin):
                 dropped = len(buf) - CHAT_FLUSH_MAX_LINES
                 buf = buf[:CHAT_FLUSH_MAX_LINES]
             posted = messages = 0
-            for channel_id, content, group in self._chunk(buf):
-                if self._post_message(channel_id, content):
+            for group, ok in self._post_chunks(self._chunk(buf)):
+                if ok:
                     posted += len(group)
                     messages += 1
-                gevent.sleep(POST_SPACING_SECONDS)
             if dropped and buf:
                 # Note the suppressed flood on the same channel as the batch (belt: don't ping/format).
                 self._post_message(buf[0][1], "_… {} more chat message(s) this window suppressed._".format(dropped))
+            FLUSHED_LINES.inc(posted, buffer="chat")
             if posted:
                 self.log.info("[dystopia] Flushed %d chat line(s) in %d message(s)%s.", posted, messages,
                               " (+%d suppressed)" % dropped if dropped else "")
@@ -583,11 +705,13 @@ class DystopiaPlugin(Plugin):
         if CONFIG.dystopia.post_chat:
             params["include"] = "chat"
         try:
-            r = requests.get(f"{self.feed_url}/api/feed/events", params=params,
-                             headers=FEED_HEADERS, timeout=15)
+            # Shared keep-alive pool: a many-page drain reuses one connection instead of paying a
+            # fresh TCP + TLS handshake per page (timeout/retries come from the host's policy).
+            r = http_client.get(f"{self.feed_url}/api/feed/events", params=params, headers=FEED_HEADERS)
             r.raise_for_status()
             data = r.json()
         except Exception as e:
+            FEED_ERRORS.inc()
             self.log.error("[dystopia] Feed poll failed: %s", e)
             return None
         return data.get("events") or [], data.get("cursor")
@@ -595,21 +719,31 @@ class DystopiaPlugin(Plugin):
     def _save_cursor(self, cache, cursor):
         if cursor and cursor != cache.last_cursor:
             cache.last_cursor = cursor
-            cache.save()
+            # Crash-safety point: the cursor only counts as advanced once it's committed, so wait
+            # (off the hub) for the write-behind queue to get it - and everything before it - to disk.
+            write_behind.save(cache, "last_cursor")
+            if not write_behind.flush(FLUSH_TIMEOUT):
+                self.log.warning("[dystopia] Cursor not committed within %ss (%d write(s) queued); it stays "
+                                 "queued and is re-saved next poll.", FLUSH_TIMEOUT, write_behind.pending())
 
     # -- poller ----------------------------------------------------------------------------------
 
     def poll_feed(self):
-        if self._polling:
-            # Previous drain (likely a cold-start backfill) still running - don't overlap.
+        if self._polling or self._draining:
+            # Previous drain (likely a cold-start backfill) still running - don't overlap. Or shutting down.
+            POLLS.inc(poller="dystopia", outcome="skipped")
             return
         self._polling = True
         try:
-            self._poll_once()
+            with track_poll("dystopia"):
+                self._poll_once()
             if self._polls and self._polls % HEARTBEAT_EVERY == 0:
                 cache = DystopiaFeedCache.get_or_none(feed_url=self.feed_url)
-                self.log.info("[dystopia] poll alive: %d cycles, caught up at cursor %s.",
-                              self._polls, cache.last_cursor if cache else "?")
+                lookups = self._emoji_hits + self._emoji_misses
+                self.log.info("[dystopia] poll alive: %d cycles, caught up at cursor %s; weapon emoji "
+                              "hit rate %s (%d/%d).", self._polls, cache.last_cursor if cache else "?",
+                              "{:.0%}".format(self._emoji_hits / lookups) if lookups else "n/a",
+                              self._emoji_hits, lookups)
         except Exception as e:
             # A single bad cycle (feed 500, transient network, one malformed event) must be logged
             # and retried next tick — NOT propagate out of the scheduled callback and kill the
@@ -648,6 +782,15 @@ class DystopiaPlugin(Plugin):
                           "unknown" if age is None else "{:.1f}h".format(age / 3600.0),
                           cfg.backfill_days)
 
+        try:
+            self._fetch_and_drain(cache)
+        finally:
+            # Set even when the fetch failed: a feed that keeps failing shows up as a growing lag.
+            lag = self._cursor_age_seconds(cache.last_cursor)
+            if lag is not None:
+                CURSOR_LAG.set(lag)
+
+    def _fetch_and_drain(self, cache):
         page = self._fetch(cache.last_cursor)
         if page is None:
             return
@@ -662,6 +805,48 @@ class DystopiaPlugin(Plugin):
         # collapses anything older into a single summary line, so we never flood the channel.
         self._drain_and_post(cache, events, cursor)
 
+    def _classify_page(self, events, postable, kills, chats):
+        """Route one page of feed events into the drain's postable/kill/chat lists; True if the page held
+        a round_end. A live round_start opens its round's thread right here (see below); everything
+        else is only formatted, never posted, so classifying a page never touches the stored cursor."""
+        saw_round_end = False
+        for e in events:
+            if e.get("kind") == "kill":
+                k = self._postable_kill(e)
+                if k:
+                    kills.append(k)
+                continue
+            if e.get("kind") == "chat":
+                c = self._postable_chat(e)
+                if c:
+                    chats.append(c)
+                continue
+            # A live round_start opens the round's thread NOW (posting its header to the channel),
+            # so this round's kills - buffered right below - already resolve to the thread, and it
+            # exists before the round-end flush. Backfilled/old round_starts fall through and post
+            # flat (and collapse into the backfill summary) exactly as before.
+            if e.get("kind") == "round_start":
+                en, live = self._threads_enabled(), self._event_is_live(e)
+                if en and live:
+                    eid = e.get("id")
+                    if eid and eid in self._seen_set:
+                        continue
+                    if self._open_round_thread(e):
+                        if eid:
+                            self._mark_seen(eid)
+                        continue
+                    # header didn't post; fall through to post it flat via _postable
+                else:
+                    # Diagnostic: say WHY a round wasn't threaded (config off, or backfill/old).
+                    self.log.info("[dystopia] round_start %s posted flat (threads_enabled=%s live=%s age=%ss)",
+                                  e.get("roundId"), en, live, self._cursor_age_seconds(e.get("cursor")))
+            if e.get("kind") == "round_end":
+                saw_round_end = True
+            p = self._postable(e)
+            if p:
+                postable.append(p)
+        return saw_round_end
+
     def _drain_and_post(self, cache, first_events, first_cursor):
         """Walk the feed forward to "caught up". NON-kill events (round start/end, captures) are posted
         this poll, most-recent in full and older ones collapsed into one summary line. KILLS are routed
@@ -684,60 +869,50 @@ class DystopiaPlugin(Plugin):
         final_cursor = first_cursor
         since = cache.last_cursor
         events, cursor = first_events, first_cursor
-        pages = 0
-        while True:
-            pages += 1
-            if not events:
-                # Empty page => the feed echoes `since`; we're caught up.
-                break
-            for e in events:
-                if e.get("kind") == "kill":
-                    k = self._postable_kill(e)
-                    if k:
-                        kills.append(k)
-                    continue
-                if e.get("kind") == "chat":
-                    c = self._postable_chat(e)
-                    if c:
-                        chats.append(c)
-                    continue
-                # A live round_start opens the round's thread NOW (posting its header to the channel),
-                # so this round's kills - buffered right below - already resolve to the thread, and it
-                # exists before the round-end flush. Backfilled/old round_starts fall through and post
-                # flat (and collapse into the backfill summary) exactly as before.
-                if e.get("kind") == "round_start":
-                    en, live = self._threads_enabled(), self._event_is_live(e)
-                    if en and live:
-                        eid = e.get("id")
-                        if eid and eid in self._seen_set:
-                            continue
-                        if self._open_round_thread(e):
-                            if eid:
-                                self._mark_seen(eid)
-                            continue
-                        # header didn't post; fall through to post it flat via _postable
-                    else:
-                        # Diagnostic: say WHY a round wasn't threaded (config off, or backfill/old).
-                        self.log.info("[dystopia] round_start %s posted flat (threads_enabled=%s live=%s age=%ss)",
-                                      e.get("roundId"), en, live, self._cursor_age_seconds(e.get("cursor")))
-                if e.get("kind") == "round_end":
+        pages = total_events = 0
+        started = time.monotonic()
+        # Pipelined: page N+1 is fetched on its own greenlet while page N is classified, so a long
+        # backlog costs ~max(fetch, classify) per page instead of their sum. Only the fetch overlaps -
+        # the stored cursor is still untouched until the post phase below, so the crash guarantees
+        # are exactly those of the one-page-at-a-time walk.
+        prefetch = None
+        try:
+            while True:
+                pages += 1
+                if not events:
+                    # Empty page => the feed echoes `since`; we're caught up.
+                    break
+                total_events += len(events)
+                more = cursor != since and pages < MAX_DRAIN_PAGES
+                if more:
+                    prefetch = gevent.spawn(self._fetch, cursor)
+                if self._classify_page(events, postable, kills, chats):
                     saw_round_end = True
-                p = self._postable(e)
-                if p:
-                    postable.append(p)
-            final_cursor = cursor
-            if cursor == since:
-                break  # safety: cursor didn't advance despite events (shouldn't happen)
-            if pages >= MAX_DRAIN_PAGES:
-                self.log.warning("[dystopia] Drain hit page cap (%d); will continue next poll.", pages)
-                break
-            since = cursor
-            nxt = self._fetch(since)
-            if nxt is None:
-                break  # transient error: post what we have; the stored cursor lets us resume later
-            events, cursor = nxt
-            if not cursor:
-                break
+                final_cursor = cursor
+                if cursor == since:
+                    break  # safety: cursor didn't advance despite events (shouldn't happen)
+                if pages >= MAX_DRAIN_PAGES:
+                    self.log.warning("[dystopia] Drain hit page cap (%d); will continue next poll.", pages)
+                    break
+                since = cursor
+                nxt, prefetch = prefetch.get(), None
+                if nxt is None:
+                    break  # transient error: post what we have; the stored cursor lets us resume later
+                events, cursor = nxt
+                if not cursor:
+                    break
+        finally:
+            if prefetch is not None:
+                prefetch.kill(block=False)
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        DRAIN_PAGES.observe(pages)
+        DRAIN_EVENTS.inc(total_events)
+        # Steady caught-up ticks are one page every poll_seconds; only a real multi-page drain is worth
+        # an INFO line.
+        self.log.log(logging.INFO if pages > 1 else logging.DEBUG,
+                     "[dystopia] Drain finished: %d page(s), %d event(s) in %.2fs (%.1f pages/s, %.1f events/s).",
+                     pages, total_events, elapsed, pages / elapsed, total_events / elapsed)
 
         # Buffer this drain's kills (mark them seen so a same-process re-drain won't re-buffer). The
         # cursor is advanced past them below.
@@ -770,7 +945,7 @@ class DystopiaPlugin(Plugin):
         to_post = postable
         if cap and len(postable) > cap:
             older, to_post = postable[:len(postable) - cap], postable[len(postable) - cap:]
-            summary = self._tpl("dystopia_backfill_summary").format(
+            summary = self._render["dystopia_backfill_summary"](
                 count=len(older), days=cfg.backfill_days, feed_url=self.feed_url)
             target = cfg.channel_id or older[0][1]
             self._post_message(target, summary)
@@ -781,18 +956,18 @@ class DystopiaPlugin(Plugin):
                           len(older), len(to_post))
 
         # Batch consecutive same-channel events into combined messages (rate-limit safety; see the
-        # BATCH_* constants). Crash semantics unchanged: each chunk marks its events seen and
-        # advances the cursor to its last event, so a crash resumes after the last posted CHUNK.
+        # BATCH_* constants). The chunks are all queued on the post scheduler up front, but complete
+        # in order here: each marks its events seen and advances the cursor to its last event, so a
+        # crash resumes after the last CONFIRMED chunk.
         posted = 0
         messages = 0
-        for channel_id, content, group in self._chunk(to_post):
-            if self._post_message(channel_id, content):
+        for group, ok in self._post_chunks(self._chunk(to_post)):
+            if ok:
                 posted += len(group)
                 messages += 1
             for event_id, _, _, _ in group:
                 self._mark_seen(event_id)
             self._save_cursor(cache, group[-1][3])
-            gevent.sleep(POST_SPACING_SECONDS)
 
         # Advance over any trailing non-postable events (e.g. kills while post_kills=False) so we don't
         # re-drain the same tail every poll.
@@ -1,10 +1,13 @@
-import time
-
+import gevent
 import requests
 from disco.bot import Plugin
 
 from PunyBot import CONFIG
 from PunyBot.models import DystopiaBuildCache
+from PunyBot.utils.http_pool import http_client
+from PunyBot.utils.metrics import POLLS, metrics, track_poll
+from PunyBot.utils.post_scheduler import post_scheduler
+from PunyBot.utils.write_behind import FLUSH_TIMEOUT, write_behind
 
 # Posts finished dystopia-build CI runs to the builds channel. Shape per hub decision
 # 2026-07-15-build-posts-use-punybot-not-a-webhook.md: the BOT polls Forgejo with a repo-read
@@ -25,7 +28,35 @@ BUILDID_LABELS = (("17580", "client"), ("17585", "dedicated server"))
 # (concurrency used to kill them; now only a human cancelling does).
 POSTED_STATUSES = {"success", "failure"}
 
-POST_SPACING_SECONDS = 0.4
+# Every state a task can't leave. Cancelled tasks are final but silent.
+FINAL_STATUSES = POSTED_STATUSES | {"cancelled"}
+
+# Page size for the tasks listing: Forgejo clamps `limit` to its [api] MAX_RESPONSE_ITEMS (50 by
+# default), so anything beyond one page is fetched page by page up to dystopia_build.task_limit.
+TASK_PAGE_SIZE = 50
+
+# Build posts by task status, for the metrics endpoint (poll timing/outcomes come from track_poll).
+BUILD_POSTS = metrics.counter("punybot_dystopia_build_posts_total", "Finished build tasks announced.", ("status",))
+
+
+class _RunSummary(object):
+    """One run's jobs, aggregated in a single pass: ``final`` = every job is in a final state, ``ok`` =
+    every job succeeded, ``carrier`` = id of the posted job that carries the run's '#discord' notes
+    (the highest-id success/failure task)."""
+
+    def __init__(self):
+        self.final = True
+        self.ok = True
+        self.carrier = None
+
+    def add(self, task):
+        status = task.get("status")
+        if status not in FINAL_STATUSES:
+            self.final = False
+        if status != "success":
+            self.ok = False
+        if status in POSTED_STATUSES and (self.carrier is None or task["id"] > self.carrier):
+            self.carrier = task["id"]
 
 
 class DystopiaBuildPlugin(Plugin):
@@ -39,6 +70,8 @@ class DystopiaBuildPlugin(Plugin):
 
     def load(self, ctx):
         self._polling = False
+        self._draining = False  # set by drain() at shutdown: no new poll starts
+        self._summaries = {}  # (job_name, run_number) -> _summary_for result, for the current poll
         cfg = CONFIG.dystopia_build
         if not cfg or not cfg.channel_id or not cfg.token:
             self.log.info("Dystopia build poller config missing (channel_id/token), skipping.")
@@ -53,20 +86,55 @@ class DystopiaBuildPlugin(Plugin):
 
     # -- helpers ---------------------------------------------------------------------------------
 
-    def _api(self, path, timeout=20):
-        return requests.get(
+    def _api(self, path):
+        # The timeout comes from the host's HostPolicy (see PunyBot.utils.http_pool).
+        return http_client.get(
             f"{self.forgejo_url}/api/v1/{path}",
             headers={"Authorization": f"token {CONFIG.dystopia_build.token}"},
-            timeout=timeout,
         )
 
+    def _fetch_tasks(self, floor):
+        """The newest tasks, newest first: pages of TASK_PAGE_SIZE until one reaches down to ``floor``
+        (the stored cursor - the page holding it also carries the older siblings of any run straddling
+        it), the listing runs out, or task_limit tasks have been read."""
+        limit = CONFIG.dystopia_build.task_limit or TASK_PAGE_SIZE
+        tasks = []
+        page = 1
+        while len(tasks) < limit:
+            r = self._api(f"repos/{self.repo}/actions/tasks?limit={TASK_PAGE_SIZE}&page={page}")
+            r.raise_for_status()
+            batch = (r.json() or {}).get("workflow_runs") or []
+            tasks.extend(batch)
+            if len(batch) < TASK_PAGE_SIZE or floor is None or min(t["id"] for t in batch) <= floor:
+                break
+            page += 1
+        return tasks[:limit]
+
+    @staticmethod
+    def _group_runs(tasks):
+        """run_number -> _RunSummary over every listed task, in one pass."""
+        runs = {}
+        for task in tasks:
+            run = runs.get(task["run_number"])
+            if run is None:
+                run = runs[task["run_number"]] = _RunSummary()
+            run.add(task)
+        return runs
+
     def _summary_for(self, job_name, run_number):
-        """(buildid_string_or_None, discord_lines) from ci-logs/<job>'s SUMMARY.txt.
+        """(buildid_string_or_None, discord_lines) from ci-logs/<job>'s SUMMARY.txt, fetched at most
+        once per (job, run) per poll.
 
         The ci-logs branch only ever holds the LATEST run of that job, so the summary's `run:` line
         must match this task's run_number; a mismatch (an even newer run already published) means we
         can't attribute anything and the post goes out bare rather than with wrong data.
         """
+        key = (job_name, run_number)
+        if key not in self._summaries:
+            self._summaries[key] = self._fetch_summary(job_name, run_number)
+        return self._summaries[key]
+
+    def _fetch_summary(self, job_name, run_number):
         try:
             r = self._api(f"repos/{self.repo}/raw/SUMMARY.txt?ref=ci-logs/{job_name}")
             if r.status_code != 200:
@@ -110,25 +178,33 @@ class DystopiaBuildPlugin(Plugin):
 
     # -- poller ----------------------------------------------------------------------------------
 
+    def drain(self):
+        """Shutdown step (see PunyBot.utils.shutdown): let an in-flight poll finish posting and queue
+        its cursor, and start no new one."""
+        self._draining = True
+        while self._polling:
+            gevent.sleep(0.1)
+
     def poll_builds(self):
-        if self._polling:
+        if self._polling or self._draining:
+            POLLS.inc(poller="dystopia_build", outcome="skipped")
             return
         self._polling = True
         try:
-            self._poll_once()
+            with track_poll("dystopia_build"):
+                self._poll_once()
         except Exception:
             self.log.exception("[dystopia_build] poll failed (will retry next tick)")
         finally:
             self._polling = False
 
     def _poll_once(self):
-        r = self._api(f"repos/{self.repo}/actions/tasks?limit=50")
-        r.raise_for_status()
-        tasks = (r.json() or {}).get("workflow_runs") or []
+        self._summaries = {}
+        row = DystopiaBuildCache.get_or_none(DystopiaBuildCache.repo == self.cache_key)
+        tasks = self._fetch_tasks(row.last_task_id if row else None)
         if not tasks:
             return
 
-        row = DystopiaBuildCache.get_or_none(DystopiaBuildCache.repo == self.cache_key)
         if row is None:
             # First run: start at the newest task, announce nothing historical.
             top = max(t["id"] for t in tasks)
@@ -139,33 +215,35 @@ class DystopiaBuildPlugin(Plugin):
         # Walk strictly upward in id order and stop at the first task that isn't final yet - a
         # still-running build stays above the cursor and gets announced when it finishes, and
         # nothing can be skipped past it. Cancelled tasks are final but silent.
-        FINAL = POSTED_STATUSES | {"cancelled"}
+        runs = self._group_runs(tasks)
         high = row.last_task_id
         for task in sorted((t for t in tasks if t["id"] > row.last_task_id), key=lambda t: t["id"]):
-            if task.get("status") not in FINAL:
+            if task.get("status") not in FINAL_STATUSES:
                 break
             if task["status"] in POSTED_STATUSES:
                 # This task carries the run's '#discord' notes iff it is the run's last unfinished
                 # job: all sibling tasks of the run are final AND it has the highest id among them
-                # (the ascending walk means ties resolve to exactly one carrier).
-                siblings = [t for t in tasks if t["run_number"] == task["run_number"]]
-                posting = [t for t in siblings if t.get("status") in POSTED_STATUSES]
-                run_final = (all(t.get("status") in FINAL for t in siblings)
-                             and posting and task["id"] == max(t["id"] for t in posting))
-                # Notes attach only on the last-finishing job AND only if EVERY job of the run
-                # succeeded - a build that failed (or partially failed) must not announce its
-                # player-facing '#discord' notes.
-                run_ok = all(t.get("status") == "success" for t in siblings)
+                # (ids are unique, so exactly one carrier). Notes attach only on that job AND only if
+                # EVERY job of the run succeeded - a build that failed (or partially failed) must not
+                # announce its player-facing '#discord' notes.
+                run = runs[task["run_number"]]
+                run_final = run.final and task["id"] == run.carrier
+                run_ok = run.ok
                 try:
-                    self.bot.client.api.channels_messages_create(
-                        CONFIG.dystopia_build.channel_id, content=self._format(task, run_final and run_ok),
-                        allowed_mentions={"parse": []})
+                    # Blocking send: posts stay in task order, paced by the channel's rate limit.
+                    post_scheduler.send(self.bot.client.api, CONFIG.dystopia_build.channel_id,
+                                        content=self._format(task, run_final and run_ok),
+                                        allowed_mentions={"parse": []})
+                    BUILD_POSTS.inc(status=task["status"])
                 except Exception:
                     self.log.exception("[dystopia_build] post failed for task %s; retrying next tick", task["id"])
                     break
-                time.sleep(POST_SPACING_SECONDS)
             high = task["id"]
 
         if high != row.last_task_id:
-            DystopiaBuildCache.update(last_task_id=high).where(
-                DystopiaBuildCache.repo == self.cache_key).execute()
+            # Barrier: the cursor is committed before the next poll can read it back.
+            write_behind.execute(DystopiaBuildCache.update(last_task_id=high).where(
+                DystopiaBuildCache.repo == self.cache_key))
+            if not write_behind.flush(FLUSH_TIMEOUT):
+                self.log.warning("[dystopia_build] Cursor %s not committed within %ss (%d write(s) queued); "
+                                 "it stays queued.", high, FLUSH_TIMEOUT, write_behind.pending())
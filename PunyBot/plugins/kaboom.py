@@ -1,79 +1,333 @@
+import time
+from collections import OrderedDict
 from datetime import datetime
 
-import gevent
 from disco.api.http import APIException
 from disco.bot import Plugin
 from disco.types.message import ActionRow, MessageComponent, ComponentTypes, SelectOption
 
 from PunyBot.models.kaboom import KaboomMessage
-from PunyBot.utils.timing import Eventual
+from PunyBot.utils.interactions import router
+from PunyBot.utils.metrics import metrics
+from PunyBot.utils.timing import timers
+from PunyBot.utils.write_behind import write_behind
+
+# Discord's bulk-delete endpoint takes 2-100 message ids, all younger than 14 days. Stay an hour
+# inside that so a message doesn't age out between the check and the call.
+BULK_DELETE_MAX = 100
+BULK_DELETE_MAX_AGE = 14 * 86400 - 3600
+
+# A delete that fails for a transient reason (network error, 5xx after disco's own retries) is
+# retried after RETRY_BASE_DELAY seconds, doubling per attempt up to RETRY_MAX_DELAY.
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 30 * 60
+
+# Discord epoch (2015-01-01) in ms; a snowflake's top 42 bits are ms since then.
+DISCORD_EPOCH_MS = 1420070400000
+
+# /kaboom autocomplete is answered from a ring of each author's most recent messages per channel
+# (Discord shows at most 25 choices). At most RECENT_MAX_RINGS (channel, author) rings are kept,
+# least recently used dropped first.
+RECENT_PER_AUTHOR = 25
+RECENT_MAX_RINGS = 4096
+
+# Kaboomed messages by outcome, for the metrics endpoint (timer lag is recorded by the timer service).
+KABOOMED = metrics.counter("punybot_kaboom_messages_total", "Kaboomed messages, by outcome.", ("outcome",))
+
+
+def _snowflake_ms(snowflake):
+    return (int(snowflake) >> 22) + DISCORD_EPOCH_MS
+
+
+def _choice_label(msg):
+    """The autocomplete label for a message: its content (or attachment names), cut to Discord's 100 chars."""
+    if msg.content:
+        label = msg.content
+    elif msg.attachments:
+        label = ", ".join(msg.attachments[file].filename for file in msg.attachments)
+    else:
+        return "*NO CONTENT*"
+    return f"{label[:97]}..." if len(label) > 100 else label
+
+
+class _RecentMessages(object):
+    """
+    Bounded cache of recent messages per (channel, author), fed from the gateway, holding ready-made
+    autocomplete choices. Each ring keeps the author's RECENT_PER_AUTHOR newest messages (by id, so
+    a REST seed and live events merge in order). A ring only counts as warm once it has been seeded
+    from REST - live events alone can't know what was posted before the bot started.
+    """
+
+    def __init__(self, per_author=RECENT_PER_AUTHOR, max_rings=RECENT_MAX_RINGS):
+        self.per_author = per_author
+        self.max_rings = max_rings
+        self._rings = OrderedDict()  # (channel_id, author_id) -> {"seeded": bool, "messages": {id: (label, folded)}}
+        self._owner = {}  # message_id -> (channel_id, author_id)
+
+    def _ring(self, key):
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = {"seeded": False, "messages": {}}
+            if len(self._rings) > self.max_rings:
+                _, evicted = self._rings.popitem(last=False)
+                for message_id in evicted["messages"]:
+                    self._owner.pop(message_id, None)
+        else:
+            self._rings.move_to_end(key)
+        return ring
+
+    def add(self, channel_id, author_id, message_id, label):
+        key = (channel_id, author_id)
+        messages = self._ring(key)["messages"]
+        messages[message_id] = (label, label.casefold())
+        self._owner[message_id] = key
+        if len(messages) > self.per_author:
+            oldest = min(messages)
+            del messages[oldest]
+            self._owner.pop(oldest, None)
+
+    def relabel(self, message_id, label):
+        key = self._owner.get(message_id)
+        if key is not None:
+            self._rings[key]["messages"][message_id] = (label, label.casefold())
+
+    def remove(self, message_id):
+        key = self._owner.pop(message_id, None)
+        if key is not None:
+            self._rings[key]["messages"].pop(message_id, None)
+
+    def seed(self, channel_id, author_id, entries):
+        """Merge ``(message_id, label)`` pairs fetched over REST and mark the ring warm."""
+        for message_id, label in entries:
+            self.add(channel_id, author_id, message_id, label)
+        self._ring((channel_id, author_id))["seeded"] = True
+
+    def choices(self, channel_id, author_id, prefix=""):
+        """Autocomplete choices (newest first) whose label or id starts with ``prefix``, or None when
+        the ring is cold and must be seeded first."""
+        ring = self._rings.get((channel_id, author_id))
+        if ring is None or not ring["seeded"]:
+            return None
+        self._rings.move_to_end((channel_id, author_id))
+        prefix = (prefix or "").strip().casefold()
+        messages = ring["messages"]
+        return [{"name": messages[message_id][0], "value": str(message_id)}
+                for message_id in sorted(messages, reverse=True)
+                if not prefix or messages[message_id][1].startswith(prefix) or str(message_id).startswith(prefix)]
 
 
 class KaboomPlugin(Plugin):
     def load(self, ctx):
 
-        self.timed_tasks = Eventual(self.kaboom_messages)
+        # Message ids whose timers have fired and are waiting for the sweeper (see kaboom_due).
+        self.due_messages = set()
+        self.sweeper = None
+
+        # Message id -> failed attempts so far, for messages waiting on a retry timer.
+        self.retry_attempts = {}
+
+        # Recent messages per (channel, author), for /kaboom autocomplete.
+        self.recent = _RecentMessages()
+
+        router.add(self, self.kaboom_cmd, (2,), command="💣")
+        router.add(self, self.kaboom_cmd, (2, 4), command="kaboom")
+        router.add(self, self.kaboom_cmd, (3,), prefix="kaboom_select_")
 
-        self.spawn_later(5, self.queue_tasks)
+        self.spawn_later(5, self.recover_timers)
 
         super(KaboomPlugin, self).load(ctx)
 
-    def kaboom_messages(self):
+    def unload(self, ctx):
+        timers.cancel_namespace("kaboom")
+        router.remove_owner(self)
+        super(KaboomPlugin, self).unload(ctx)
+
+    def recover_timers(self):
+        """Re-arm a timer for every queued message (once, at startup)."""
+        rows = list(KaboomMessage.select())
+        for row in rows:
+            timers.schedule(("kaboom", row.message_id), row.expire_time, self.kaboom_due, row.message_id)
+        self.log.info(f"[Kaboom System]: Recovered {len(rows)} pending message timer(s).")
+
+    def kaboom_due(self, message_id):
+        # Timers that fire together (a moderator kabooming a whole thread) are coalesced into one
+        # sweep, so they still get blown up per channel in bulk.
+        self.due_messages.add(message_id)
+        if self.sweeper is None:
+            self.sweeper = self.spawn(self.sweep_due)
+
+    def sweep_due(self):
+        try:
+            while self.due_messages:
+                due, self.due_messages = self.due_messages, set()
+                try:
+                    self.kaboom_messages(due)
+                except Exception:
+                    self.log.exception("[Kaboom System]: Sweep failed.")
+                    self.retry_later(due)
+        finally:
+            self.sweeper = None
 
-        next_delete = list(KaboomMessage.select().where(
-            (KaboomMessage.expire_time < datetime.now())
-        ))
+    def kaboom_messages(self, due_ids):
+
+        next_delete = list(KaboomMessage.select().where(KaboomMessage.message_id.in_(list(due_ids))))
 
         if len(next_delete) > 0:
             self.log.info(f"[Kaboom System]: Attempting to blow up {len(next_delete)} messages!")
+            started = time.monotonic()
+            by_channel = {}
             for msg in next_delete:
-                try:
-                    self.client.api.channels_messages_delete(msg.channel_id, msg.message_id)
-                    self.log.info(f"[Kaboom System]: Message {msg.message_id} has been blown up.")
-                    KaboomMessage.delete_by_id(msg.message_id)
-                except APIException as e:
-                    fail = "[Kaboom System] | Failed to blow up message: {}"
-                    if e.code == 10008:
-                        self.log.error(fail.format("Message not found..."))
-                    elif e.code == 10003:
-                        self.log.error(fail.format("Channel not found..."))
-                    elif e.code == 50013:
-                        self.log.error(fail.format("Permission Denied..."))
-                    KaboomMessage.delete_by_id(msg.message_id)
-                    self.log.error(f"[Kaboom System] | Removing message: {msg.message_id} from the database to stop infinite loop.")
-                    with self.bot.plugins['CorePlugin'].send_control_message() as embed:
-                        embed.title = "Kaboom Error"
-                        embed.color = 0xf04747
-                        embed.add_field(name='Message', value=f'``{msg.message_id}``', inline=True)
-                        embed.add_field(name='Channel', value=f'``{msg.channel_id}``', inline=True)
-                        embed.description = f'```{fail.format(f"API Error {e.code}, {e.msg}")}```'
-
-            gevent.sleep(5)
-            self.queue_tasks()
-        else:
+                by_channel.setdefault(msg.channel_id, []).append(msg.message_id)
+
+            totals = {"deleted": 0, "failed": 0, "retried": 0, "bulk_calls": 0, "single_calls": 0}
+            for channel_id, message_ids in by_channel.items():
+                self.kaboom_channel(channel_id, message_ids, totals)
+
+            KABOOMED.inc(totals["deleted"], outcome="deleted")
+            KABOOMED.inc(totals["failed"], outcome="failed")
+            KABOOMED.inc(totals["retried"], outcome="retried")
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.log.info(f"[Kaboom System]: Blew up {totals['deleted']} message(s) in {len(by_channel)} channel(s) "
+                          f"({totals['bulk_calls']} bulk, {totals['single_calls']} single deletes, "
+                          f"{totals['failed']} failed, {totals['retried']} to retry) in {elapsed:.2f}s "
+                          f"({len(next_delete) / elapsed:.1f} msg/s).")
+
+    def kaboom_channel(self, channel_id, message_ids, totals):
+        """Blow up one channel's due messages: bulk-delete everything young enough for Discord's bulk
+        endpoint (in batches of BULK_DELETE_MAX), single-delete the rest (and any batch the bulk call
+        rejects), queueing each batch's rows for deletion as it goes. Messages that fail for any reason
+        other than an API error are put back on a timer (see retry_later)."""
+        cutoff = (time.time() - BULK_DELETE_MAX_AGE) * 1000
+        recent = [m for m in message_ids if _snowflake_ms(m) > cutoff]
+        singles = [m for m in message_ids if _snowflake_ms(m) <= cutoff]
+        bulk_deleted = set()
+        retry = []
+
+        for i in range(0, len(recent), BULK_DELETE_MAX):
+            batch = recent[i:i + BULK_DELETE_MAX]
+            if len(batch) < 2:
+                singles.extend(batch)  # the bulk endpoint takes 2-100 ids
+                continue
+            try:
+                self.client.api.channels_messages_delete_bulk(channel_id, batch)
+                totals["bulk_calls"] += 1
+                totals["deleted"] += len(batch)
+                bulk_deleted.update(batch)
+                self.log.info(f"[Kaboom System]: Bulk blew up {len(batch)} messages in channel {channel_id}.")
+                self.forget_kabooms(batch)
+            except APIException as e:
+                if e.code == 10003:
+                    # The channel is gone: nothing in it can be deleted, single or bulk.
+                    remaining = [m for m in message_ids if m not in bulk_deleted]
+                    self.kaboom_failed(channel_id, remaining, e)
+                    totals["failed"] += len(remaining)
+                    return
+                self.log.warning(f"[Kaboom System]: Bulk delete of {len(batch)} messages in channel {channel_id} "
+                                 f"failed ({e.code}), falling back to single deletes.")
+                singles.extend(batch)
+            except Exception as e:
+                self.log.warning(f"[Kaboom System]: Bulk delete of {len(batch)} messages in channel {channel_id} "
+                                 f"failed ({e!r}), retrying later.")
+                retry.extend(batch)
+
+        # Single deletes go one at a time through disco's per-route rate limiter.
+        done = []
+        for message_id in singles:
+            try:
+                totals["single_calls"] += 1
+                self.client.api.channels_messages_delete(channel_id, message_id)
+                self.log.info(f"[Kaboom System]: Message {message_id} has been blown up.")
+                totals["deleted"] += 1
+                done.append(message_id)
+            except APIException as e:
+                totals["failed"] += 1
+                self.kaboom_failed(channel_id, [message_id], e)
+            except Exception as e:
+                self.log.warning(f"[Kaboom System]: Deleting message {message_id} in channel {channel_id} "
+                                 f"failed ({e!r}), retrying later.")
+                retry.append(message_id)
+        self.forget_kabooms(done)
+        totals["retried"] += len(retry)
+        self.retry_later(retry)
+
+    def retry_later(self, message_ids):
+        """Re-arm the timers of messages whose delete failed transiently, backing off per message."""
+        for message_id in message_ids:
+            attempts = self.retry_attempts.get(message_id, 0) + 1
+            self.retry_attempts[message_id] = attempts
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+            timers.schedule(("kaboom", message_id), time.time() + delay, self.kaboom_due, message_id)
+
+    def forget_kabooms(self, message_ids):
+        if not message_ids:
             return
-
-    def queue_tasks(self):
-
-        next_delete = list(KaboomMessage.select().order_by(KaboomMessage.expire_time.asc()).limit(1))
-
-        if not next_delete:
-            self.log.info("[Kaboom System]: There are no messages to blow up at this time.")
-        else:
-            self.log.info(
-                f"[Kaboom System]: Waiting until {next_delete[0].expire_time} for Message ID: {next_delete[0].message_id}")
-            self.timed_tasks.set_next_schedule(next_delete[0].expire_time)
+        for message_id in message_ids:
+            self.retry_attempts.pop(message_id, None)
+        # Not a crash-safety point: a row that outlives its message just gets a 10008 next start.
+        write_behind.execute(KaboomMessage.delete().where(KaboomMessage.message_id.in_(message_ids)))
+
+    def kaboom_failed(self, channel_id, message_ids, e):
+        fail = "[Kaboom System] | Failed to blow up message: {}"
+        if e.code == 10008:
+            self.log.error(fail.format("Message not found..."))
+        elif e.code == 10003:
+            self.log.error(fail.format("Channel not found..."))
+        elif e.code == 50013:
+            self.log.error(fail.format("Permission Denied..."))
+        self.forget_kabooms(message_ids)
+        self.log.error(f"[Kaboom System] | Removing message(s): {', '.join(map(str, message_ids))} from the database "
+                       f"to stop infinite loop.")
+        with self.bot.plugins['CorePlugin'].send_control_message() as embed:
+            embed.title = "Kaboom Error"
+            embed.color = 0xf04747
+            embed.add_field(name='Message' if len(message_ids) == 1 else 'Messages',
+                            value=f'``{message_ids[0]}``' if len(message_ids) == 1 else f'``{len(message_ids)}``',
+                            inline=True)
+            embed.add_field(name='Channel', value=f'``{channel_id}``', inline=True)
+            embed.description = f'```{fail.format(f"API Error {e.code}, {e.msg}")}```'
 
     def mark_as_kaboom(self, message, channel, expire_time):
         kaboom, created = KaboomMessage.get_or_create(message_id=message, channel_id=channel,
                                                       expire_time=datetime.fromtimestamp(
                                                           datetime.now().timestamp() + (expire_time * 60)))
         if created:
-            self.queue_tasks()
+            timers.schedule(("kaboom", kaboom.message_id), kaboom.expire_time, self.kaboom_due, kaboom.message_id)
             return True
         else:
             return False
 
+    @Plugin.listen('MessageCreate')
+    def on_message_create(self, event):
+        if not event.message.guild_id or not event.message.author:
+            return
+        self.recent.add(event.message.channel_id, event.message.author.id, event.message.id,
+                        _choice_label(event.message))
+
+    @Plugin.listen('MessageUpdate')
+    def on_message_update(self, event):
+        # Updates can be partial (e.g. just an embed unfurl); only relabel when the body came along.
+        if event.message.content or event.message.attachments:
+            self.recent.relabel(event.message.id, _choice_label(event.message))
+
+    @Plugin.listen('MessageDelete')
+    def on_message_delete(self, event):
+        self.recent.remove(event.id)
+
+    @Plugin.listen('MessageDeleteBulk')
+    def on_message_delete_bulk(self, event):
+        for message_id in event.ids:
+            self.recent.remove(message_id)
+
+    def autocomplete_choices(self, channel_id, author_id, prefix):
+        choices = self.recent.choices(channel_id, author_id, prefix)
+        if choices is None:
+            # Cold ring: one REST listing seeds it, every later keystroke is answered from memory.
+            messages = self.client.api.channels_messages_list(channel_id, limit=RECENT_PER_AUTHOR)
+            self.recent.seed(channel_id, author_id,
+                             [(msg.id, _choice_label(msg)) for msg in messages if msg.author.id == author_id])
+            choices = self.recent.choices(channel_id, author_id, prefix)
+        return choices[:25]
+
     # TODO: Move all slash commands to a single register event with a "first_run" flag in the database or something.
     @Plugin.command('setupcmds')
     def setup_commands_cmd(self, event):
@@ -156,7 +410,6 @@ class KaboomPlugin(Plugin):
         event.channel.send_typing()
         return event.msg.reply("Commands have been updated!")
 
-    @Plugin.listen('InteractionCreate')
     def kaboom_cmd(self, event):
 
         min_to_string = {
@@ -225,42 +478,5 @@ class KaboomPlugin(Plugin):
                 return event.reply(type=4, content="Unable to blow up. Message is already marked for deletion!", flags=(1 << 6))
 
         if event.raw_data['interaction']['type'] == 4 and event.data.name == "kaboom":
-            messages = self.client.api.channels_messages_list(event.channel.id, limit=25)
-
-            messages = [msg for msg in messages if msg.author.id == event.member.id]
-
-            choices = []
-            for msg in messages:
-                if len(choices) == 25:
-                    break
-                if not msg.content:
-                    if msg.attachments:
-                        names = [msg.attachments[file].filename for file in msg.attachments]
-                        name_str = ", ".join(names)
-                        if len(name_str) > 100:
-                            choices.append({
-                                "name": f"{name_str[:97]}...",
-                                "value": str(msg.id)
-                            })
-                        else:
-                            choices.append({
-                                "name": name_str,
-                                "value": str(msg.id)
-                            })
-                    else:
-                        choices.append({
-                            "name": "*NO CONTENT*",
-                            "value": str(msg.id)
-                        })
-                elif len(msg.content) > 100:
-                    choices.append({
-                        "name": f"{msg.content[:97]}...",
-                        "value": str(msg.id)
-                    })
-                else:
-                    choices.append({
-                        "name": msg.content,
-                        "value": str(msg.id)
-                    })
-
-            return event.reply(type=8, choices=choices)
+            typed = next((opt.value for opt in event.data.options if opt.name == "message"), "")
+            return event.reply(type=8, choices=self.autocomplete_choices(event.channel.id, event.member.id, typed))
@@ -1,10 +1,11 @@
 import os
+import time
 from datetime import datetime
 
 import feedparser
 import re
 import gevent
-import requests
+from gevent.pool import Pool
 # import tweepy
 import dateutil.parser as parser
 from disco.bot import Plugin
@@ -12,7 +13,19 @@ from urllib.parse import urlparse
 
 from PunyBot import CONFIG
 from PunyBot.constants import Messages
-from PunyBot.models import SteamNewsCache, RssCache
+from PunyBot.models import SteamNewsCache, RssCache, HttpValidatorCache
+from PunyBot.utils.http_pool import http_client
+from PunyBot.utils.metrics import metrics, track_poll
+
+# Upper bound on concurrent source fetches in one media tick: dozens of feeds/apps cost about the
+# slowest fetch, without opening dozens of sockets at once.
+FETCH_CONCURRENCY = 8
+
+# Sources whose fetch raised, per media poller, for the metrics endpoint.
+FETCH_ERRORS = metrics.counter("punybot_media_fetch_errors_total", "Media source fetches that failed.", ("source",))
+
+STEAM_NEWS_URL = ("https://api.steampowered.com/ISteamNews/GetNewsForApp/v0002/"
+                  "?appid={app_id}&count=1&maxlength=400&format=json")
 
 
 # class TwitterStream(tweepy.StreamingClient):
@@ -55,6 +68,15 @@ class MediaPlugin(Plugin):
         if not os.path.exists(os.getcwd() + "/data"):
             raise FileExistsError("Missing Data Directory!")
 
+        # Conditional-GET savings (see _conditional_get): polls sent, 304s received, and the download
+        # bytes / parse time those 304s skipped.
+        self.conditional_stats = {"requests": 0, "not_modified": 0, "bytes_saved": 0, "parse_ms_saved": 0.0}
+        stats = self.conditional_stats
+        metrics.counter("punybot_media_conditional_requests_total", "Media polls sent, by whether the source "
+                        "answered 304 Not Modified.", ("result",),
+                        fn=lambda: {"modified": stats["requests"] - stats["not_modified"],
+                                    "not_modified": stats["not_modified"]})
+
         if os.getenv("TWITTER_BEARER_TOKEN"):
             self.log.warning("Twitter currently disabled. WIP for now.")
             # self.start_twitter_client()
@@ -131,53 +153,162 @@ class MediaPlugin(Plugin):
 
         self.log.info("Twitter Client Started!")
 
-    def get_steam_news(self):
-        for app_id in self.steam_news_config.keys():
-            r = requests.get(
-                f"https://api.steampowered.com/ISteamNews/GetNewsForApp/v0002/?appid={app_id}&count=1&maxlength=400&format=json")
-            if not r.json():
-                return
-            post = r.json()['appnews']['newsitems'][0]
-
-            cache = SteamNewsCache.get_or_none(app=app_id)
-
-            if not cache:
-                SteamNewsCache.create(app=app_id, post_id=post["gid"])
-            elif int(post["gid"]) == cache.post_id:
-                continue
-            else:
-                cache.post_id = post["gid"]
-                cache.save()
-
-            img = None
-            information = post['contents']
-            if post['contents'].startswith('{STEAM_CLAN_IMAGE}'):
-                hash = post['contents'].split(' ')[0]
-                img = f"https://cdn.akamai.steamstatic.com/steamcommunity/public/images/clans/{hash[19:]}"
-                information = information[len(hash):]
-            data = {
-                "content": "",
-                "embeds": [
-                    {
-                        "type": "rich",
-                        "title": post['title'],
-                        "description": information,
-                        "color": 0xe9e9e9,
-                        "footer": {
-                            "text": f"Posted by {post['author']}"
-                        },
-                        "url": post['url']
-                    }
-                ]
-            }
-            if img:
-                data['embeds'][0]['image'] = {'url': img}
-
-            for webhook in self.steam_news_config[app_id]:
-                info = webhook.split("/")
-                self.bot.client.api.webhooks_token_execute(info[0], info[1], data=data)
+    def _load_validators(self, urls):
+        """{url: HttpValidatorCache} for every url that has stored validators, in one query."""
+        return {v.url: v for v in HttpValidatorCache.select().where(HttpValidatorCache.url.in_(list(urls)))}
+
+    def _conditional_get(self, url, validators, headers=None):
+        """GET ``url`` with its stored validators (``If-None-Match``/``If-Modified-Since``). Returns the
+        response, or None when the server answered 304 Not Modified, in which case there is nothing
+        to download or parse."""
+        headers = dict(headers or {})
+        if validators:
+            if validators.etag:
+                headers["If-None-Match"] = validators.etag
+            if validators.last_modified:
+                headers["If-Modified-Since"] = validators.last_modified
+
+        r = http_client.get(url, headers=headers)
+        self.conditional_stats["requests"] += 1
+        if r.status_code == 304 and validators:
+            self.conditional_stats["not_modified"] += 1
+            self.conditional_stats["bytes_saved"] += validators.body_bytes
+            self.conditional_stats["parse_ms_saved"] += validators.parse_ms
+            return None
+        r.raise_for_status()
+        return r
+
+    def _fan_out(self, label, fetch, sources):
+        """Fetch stage: run ``fetch(source)`` for every source on a bounded gevent pool, so N sources
+        cost about the slowest one rather than the sum. Results come back in source order; a source
+        whose fetch raised (logged here) or returned None is dropped without affecting the others."""
+        def run(source):
+            try:
+                return source, fetch(source)
+            except Exception as e:
+                FETCH_ERRORS.inc(source=label)
+                self.log.error("[%s] Failed to fetch %s: %s", label, source, e)
+                return source, None
+
+        return [(source, result) for source, result in Pool(FETCH_CONCURRENCY).imap(run, sources)
+                if result is not None]
+
+    def _save_validators(self, url, validators, r, parse_seconds):
+        """Persist the response's validators. Only called once the response has been fully handled:
+        storing them earlier would turn a failed post into a permanent 304-skip of that update."""
+        etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if not validators:
+            if etag or last_modified:
+                HttpValidatorCache.create(url=url, etag=etag, last_modified=last_modified,
+                                          body_bytes=len(r.content), parse_ms=parse_seconds * 1000.0)
+            return
+        validators.etag = etag
+        validators.last_modified = last_modified
+        validators.body_bytes = len(r.content)
+        validators.parse_ms = parse_seconds * 1000.0
+        validators.save()
 
+    @track_poll("steam_news")
+    def get_steam_news(self):
+        urls = {app_id: STEAM_NEWS_URL.format(app_id=app_id) for app_id in self.steam_news_config}
+        validators = self._load_validators(urls.values())
+
+        def fetch(app_id):
+            r = self._conditional_get(urls[app_id], validators.get(urls[app_id]))
+            if r is None:
+                return None
+            started = time.monotonic()
+            data = r.json()
+            parse_seconds = time.monotonic() - started
+            items = ((data or {}).get('appnews') or {}).get('newsitems')
+            if not items:
+                self.log.warning("[Steam News] Empty news response for app %s, skipping.", app_id)
+                return None
+            return items[0], r, parse_seconds
+
+        # Post stage: serial, so webhook executes stay ordered and one app's failure is its own.
+        for app_id, (post, r, parse_seconds) in self._fan_out("Steam News", fetch, list(urls)):
+            try:
+                self.post_steam_news(app_id, post)
+                self._save_validators(urls[app_id], validators.get(urls[app_id]), r, parse_seconds)
+            except Exception:
+                self.log.exception("[Steam News] Failed to post news for app %s", app_id)
+
+    def post_steam_news(self, app_id, post):
+        cache = SteamNewsCache.get_or_none(app=app_id)
+
+        if not cache:
+            SteamNewsCache.create(app=app_id, post_id=post["gid"])
+        elif int(post["gid"]) == cache.post_id:
+            return
+        else:
+            cache.post_id = post["gid"]
+            cache.save()
+
+        img = None
+        information = post['contents']
+        if post['contents'].startswith('{STEAM_CLAN_IMAGE}'):
+            hash = post['contents'].split(' ')[0]
+            img = f"https://cdn.akamai.steamstatic.com/steamcommunity/public/images/clans/{hash[19:]}"
+            information = information[len(hash):]
+        data = {
+            "content": "",
+            "embeds": [
+                {
+                    "type": "rich",
+                    "title": post['title'],
+                    "description": information,
+                    "color": 0xe9e9e9,
+                    "footer": {
+                        "text": f"Posted by {post['author']}"
+                    },
+                    "url": post['url']
+                }
+            ]
+        }
+        if img:
+            data['embeds'][0]['image'] = {'url': img}
+
+        for webhook in self.steam_news_config[app_id]:
+            info = webhook.split("/")
+            self.bot.client.api.webhooks_token_execute(info[0], info[1], data=data)
+
+    @track_poll("rss")
     def check_rss(self):
+        saved = dict(self.conditional_stats)
+        validators = self._load_validators(self.rss_config.keys())
+
+        def fetch(feed_url):
+            # Fetch through the shared keep-alive pool and hand feedparser the body; feedparser's own
+            # fetcher opens a fresh connection every time. Its User-Agent is kept, since some feeds
+            # refuse python-requests'.
+            r = self._conditional_get(feed_url, validators.get(feed_url),
+                                      headers={"User-Agent": feedparser.USER_AGENT})
+            if r is None:
+                return None
+            # feedparser looks headers up by lowercase name (a requests CaseInsensitiveDict would hide the
+            # charset), and without a URL it takes the base for relative links from Content-Location.
+            response_headers = {name.lower(): value for name, value in r.headers.items()}
+            response_headers.setdefault("content-location", r.url or feed_url)
+            started = time.monotonic()
+            feed = feedparser.parse(r.content, response_headers=response_headers)
+            return feed, r, time.monotonic() - started
+
+        for feed_url, (feed, r, parse_seconds) in self._fan_out("RSS", fetch, list(self.rss_config)):
+            try:
+                self.post_rss_feed(feed_url, feed)
+                self._save_validators(feed_url, validators.get(feed_url), r, parse_seconds)
+            except Exception:
+                self.log.exception("[RSS] Failed to handle feed %s", feed_url)
+
+        unchanged = self.conditional_stats["not_modified"] - saved["not_modified"]
+        if unchanged:
+            self.log.info("[RSS] %d/%d feed(s) unchanged (304): skipped %.1f KiB and %.0f ms of parsing this tick.",
+                          unchanged, len(self.rss_config),
+                          (self.conditional_stats["bytes_saved"] - saved["bytes_saved"]) / 1024.0,
+                          self.conditional_stats["parse_ms_saved"] - saved["parse_ms_saved"])
+
+    def post_rss_feed(self, feed_url, feed):
 
         def pubdate_to_timestamp(pub_date):
             return int(parser.parse(pub_date).timestamp())
@@ -185,55 +316,52 @@ class MediaPlugin(Plugin):
         def sort_post_by_published(e):
             return pubdate_to_timestamp(e['published'])
 
-        for feed_url in self.rss_config.keys():
-            feed = feedparser.parse(feed_url)
-
-            if not feed.get('entries') or len(feed['entries']) == 0:
-                continue
+        if not feed.get('entries') or len(feed['entries']) == 0:
+            return
 
-            unsorted_feed = [entry for entry in feed['entries'] if entry.get('published')]
+        unsorted_feed = [entry for entry in feed['entries'] if entry.get('published')]
 
-            if len(unsorted_feed) == 0:
-                continue
+        if len(unsorted_feed) == 0:
+            return
 
-            sorted_feed = sorted(unsorted_feed, key=sort_post_by_published, reverse=True)
+        sorted_feed = sorted(unsorted_feed, key=sort_post_by_published, reverse=True)
 
-            domain = urlparse(sorted_feed[0]['link']).netloc
+        domain = urlparse(sorted_feed[0]['link']).netloc
 
-            if pubdate_to_timestamp(sorted_feed[0]['published']) < int(datetime.now().timestamp() - 3600):
-                continue
+        if pubdate_to_timestamp(sorted_feed[0]['published']) < int(datetime.now().timestamp() - 3600):
+            return
 
-            cache = RssCache.get_or_none(url=feed_url)
+        cache = RssCache.get_or_none(url=feed_url)
 
-            if cache:
-                if cache.latest_post == sorted_feed[0]['link']:
-                    continue
-                else:
-                    cache.latest_post = sorted_feed[0]['link']
-                    cache.save()
+        if cache:
+            if cache.latest_post == sorted_feed[0]['link']:
+                return
             else:
-                RssCache.create(url=feed_url, latest_post=sorted_feed[0]['link'])
+                cache.latest_post = sorted_feed[0]['link']
+                cache.save()
+        else:
+            RssCache.create(url=feed_url, latest_post=sorted_feed[0]['link'])
 
-            author = None
-            if 'author_detail' in sorted_feed[0].keys():
-                author = f" by: {sorted_feed[0]['author_detail']['name']}"
+        author = None
+        if 'author_detail' in sorted_feed[0].keys():
+            author = f" by: {sorted_feed[0]['author_detail']['name']}"
 
-            title = re.sub("<[^>]*>", "", sorted_feed[0]['title'], count=0, flags=0)
+        title = re.sub("<[^>]*>", "", sorted_feed[0]['title'], count=0, flags=0)
 
-            timestamp = pubdate_to_timestamp(sorted_feed[0]['published'])
+        timestamp = pubdate_to_timestamp(sorted_feed[0]['published'])
 
-            content = Messages.rss_news_message.format(title=title, author=author or '', timestamp=timestamp, url=sorted_feed[0]['link'])
+        content = Messages.rss_news_message.format(title=title, author=author or '', timestamp=timestamp, url=sorted_feed[0]['link'])
 
-            # content = f"📰 | **{title}**{author or ''} (<t:{timestamp}:R>)\n\n** {sorted_feed[0]['link']} **"
+        # content = f"📰 | **{title}**{author or ''} (<t:{timestamp}:R>)\n\n** {sorted_feed[0]['link']} **"
 
-            for channel in self.rss_config[feed_url]:
-                try:
-                    self.bot.client.api.channels_messages_create(channel, content=content)
-                    self.log.info("[RSS] Posted '%s' to channel %s", title, channel)
-                except Exception as e:
-                    self.log.error("[RSS] Failed to post to channel %s: %s", channel, e)
-                # If wanted to use announcement channels and have the bot auto-publish articles
-                # try:
-                #     self.bot.client.api.channels_messages_publish(channel, msg.id)
-                # except:
-                #     continue
+        for channel in self.rss_config[feed_url]:
+            try:
+                self.bot.client.api.channels_messages_create(channel, content=content)
+                self.log.info("[RSS] Posted '%s' to channel %s", title, channel)
+            except Exception as e:
+                self.log.error("[RSS] Failed to post to channel %s: %s", channel, e)
+            # If wanted to use announcement channels and have the bot auto-publish articles
+            # try:
+            #     self.bot.client.api.channels_messages_publish(channel, msg.id)
+            # except:
+            #     continue
@@ -1,20 +1,30 @@
 import os
+import time
 from datetime import datetime
 from json import JSONDecodeError
 
 import gevent
-import requests
 from disco.api.http import APIException
 from disco.bot import Plugin
 from disco.types.channel import PermissionOverwrite, PermissionOverwriteType
 from disco.types.message import ActionRow, MessageComponent, ButtonStyles, ComponentTypes, SelectOption, MessageEmbed, \
     MessageModal, TextInputStyles
 from disco.types.permissions import Permissions
+from gevent.event import Event
 
 from PunyBot import CONFIG
 from PunyBot.constants import PickupGamesConfig, Messages
-from PunyBot.models import PickupGame
-from PunyBot.utils.timing import Eventual
+from PunyBot.models import PickupGame, PickupPlayer
+from PunyBot.utils.http_pool import http_client
+from PunyBot.utils.interactions import router
+from PunyBot.utils.metrics import metrics
+from PunyBot.utils.timing import timers
+from PunyBot.utils.write_behind import FLUSH_TIMEOUT, write_behind
+
+
+# A game's active-game embed and control message are re-rendered at most once per this many seconds:
+# the first change arms a render, later changes inside the window ride along with it.
+GAME_INFO_DEBOUNCE_SECONDS = 2
 
 
 class TimerOffsets(object):
@@ -32,6 +42,25 @@ class ActionType(object):
     END_GAME = 4
 
 
+# Config fields games are looked up by (a game's category / a pickup menu's channel).
+INDEXED_CFG_KEYS = ("chat_channels_category", "active_games_channel")
+
+# (guild, key, value) -> (config key, PickupGamesConfig), built by index_pickup_configs().
+_cfg_index = None
+
+
+def index_pickup_configs() -> dict:
+    """Build the reverse index behind get_cfg_for_game (once per config load)."""
+    global _cfg_index
+    index = {}
+    for guild, games in CONFIG.pickup_games.items():
+        for dict_key, game_cfg in games.items():
+            for key in INDEXED_CFG_KEYS:
+                index.setdefault((guild, key, getattr(game_cfg, key)), (dict_key, game_cfg))
+    _cfg_index = index
+    return index
+
+
 def get_cfg_for_game(guild: int, key: str, value) -> tuple[str, PickupGamesConfig]:
     """
     :param guild: The guild's ID
@@ -39,9 +68,163 @@ def get_cfg_for_game(guild: int, key: str, value) -> tuple[str, PickupGamesConfi
     :param value: The value we are checking against. Ex: 991457779271356496 (The category ID in the config)
     :return: game_cgf_id, PickupGamesConfig - The config key, The config relating to the corresponding game.
     """
-    for dict_key, game_cfg in CONFIG.pickup_games[guild].items():
-        if game_cfg.to_dict()[key] == value:
-            return dict_key, game_cfg
+    index = _cfg_index if _cfg_index is not None else index_pickup_configs()
+    return index.get((guild, key, value))
+
+
+class ActiveGames(object):
+    """
+    Write-behind registry of the active pickup games, held in memory and indexed by game id, chat
+    channel and active-game message id, so interactions resolve their game with a dict lookup.
+
+    Each game's roster is a set of user ids (``players`` / ``is_player`` / ``add_player`` /
+    ``remove_player``), with a reverse user -> game ids map for ``games_for_user``.
+
+    ``save(game, *fields)`` marks a game (or just the given fields) dirty and returns straight away;
+    a writer greenlet hands dirty games and roster changes to the write-behind queue once the current
+    burst yields, coalescing repeated saves of the same game into one UPDATE. ``flush(wait=True)``
+    also waits (up to FLUSH_TIMEOUT) for them to be committed; ``stop()`` ends the writer greenlet
+    after a last flush.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_channel = {}
+        self._by_message = {}
+        self._players = {}  # game id -> set of user ids
+        self._user_games = {}  # user id -> set of active game ids
+        self._dirty = {}  # game id -> (game, set of field names, or None for the whole row)
+        self._roster_dirty = {}  # (game id, user id) -> joined_at, or None to remove
+        self._wakeup = Event()
+        self._writer = None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def load(self):
+        """(Re)build the registry from the active rows."""
+        self._by_id, self._by_channel, self._by_message = {}, {}, {}
+        self._players, self._user_games = {}, {}
+        for game in PickupGame.select().where(PickupGame.active == True):
+            self.add(game)
+        if self._by_id:
+            for row in PickupPlayer.select().where(PickupPlayer.game_id.in_(list(self._by_id))):
+                self._players[row.game_id].add(row.user_id)
+                self._user_games.setdefault(row.user_id, set()).add(row.game_id)
+
+    def add(self, game):
+        self._by_id[game.id] = game
+        self._by_channel[game.chat_channel_id] = game
+        self._by_message[game.active_game_message_id] = game
+        self._players.setdefault(game.id, set())
+
+    def remove(self, game):
+        """Drop an ended game from the indexes (a pending write for it still goes out)."""
+        self._by_id.pop(game.id, None)
+        self._by_channel.pop(game.chat_channel_id, None)
+        self._by_message.pop(game.active_game_message_id, None)
+        for user_id in self._players.pop(game.id, ()):
+            games = self._user_games.get(user_id)
+            if games is not None:
+                games.discard(game.id)
+                if not games:
+                    del self._user_games[user_id]
+
+    def get(self, game_id):
+        return self._by_id.get(game_id)
+
+    def by_channel(self, channel_id):
+        return self._by_channel.get(channel_id)
+
+    def by_message(self, message_id):
+        return self._by_message.get(message_id)
+
+    def players(self, game):
+        """The game's roster (a set of user ids; don't mutate it)."""
+        return self._players.get(game.id, set())
+
+    def is_player(self, game, user_id):
+        return user_id in self._players.get(game.id, ())
+
+    def add_player(self, game, user_id):
+        """Put ``user_id`` on the roster; False if they already were."""
+        roster = self._players.setdefault(game.id, set())
+        if user_id in roster:
+            return False
+        roster.add(user_id)
+        self._user_games.setdefault(user_id, set()).add(game.id)
+        self._queue_roster(game.id, user_id, datetime.now())
+        return True
+
+    def remove_player(self, game, user_id):
+        """Take ``user_id`` off the roster; False if they weren't on it."""
+        roster = self._players.get(game.id)
+        if not roster or user_id not in roster:
+            return False
+        roster.discard(user_id)
+        games = self._user_games.get(user_id)
+        if games is not None:
+            games.discard(game.id)
+            if not games:
+                del self._user_games[user_id]
+        self._queue_roster(game.id, user_id, None)
+        return True
+
+    def games_for_user(self, user_id):
+        """The active games ``user_id`` is playing in."""
+        return [self._by_id[game_id] for game_id in self._user_games.get(user_id, ())]
+
+    def _queue_roster(self, game_id, user_id, joined_at):
+        self._roster_dirty[(game_id, user_id)] = joined_at
+        self._wake()
+
+    def save(self, game, *fields):
+        """Queue ``game`` to be written: only ``fields`` (names) if given, else the whole row."""
+        pending = self._dirty.get(game.id)
+        if not fields or (pending is not None and pending[1] is None):
+            merged = None
+        else:
+            merged = set(fields) | (pending[1] if pending is not None else set())
+        self._dirty[game.id] = (game, merged)
+        self._wake()
+
+    def _wake(self):
+        self._wakeup.set()
+        if self._writer is None:
+            self._writer = gevent.spawn(self._run)
+
+    def flush(self, wait=False):
+        """Hand every pending change to the write-behind queue. With ``wait``, False if they weren't
+        committed within FLUSH_TIMEOUT (they stay queued)."""
+        dirty, self._dirty = self._dirty, {}
+        roster, self._roster_dirty = self._roster_dirty, {}
+        for (game_id, user_id), joined_at in roster.items():
+            if joined_at is None:
+                write_behind.execute(PickupPlayer.delete().where((PickupPlayer.game_id == game_id) &
+                                                                 (PickupPlayer.user_id == user_id)))
+            else:
+                write_behind.execute(PickupPlayer.insert(game_id=game_id, user_id=user_id,
+                                                         joined_at=joined_at).on_conflict_ignore())
+        for game, fields in dirty.values():
+            write_behind.save(game, *(fields or ()))
+        return not wait or write_behind.flush(FLUSH_TIMEOUT)
+
+    def stop(self):
+        """Kill the writer greenlet (plugin unload), then flush what it had not handed over yet. False
+        if those writes weren't committed within FLUSH_TIMEOUT."""
+        if self._writer is not None:
+            self._writer.kill()
+            self._writer = None
+        return self.flush(wait=True)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.flush()
 
 
 class PickupPlugin(Plugin):
@@ -53,12 +236,40 @@ class PickupPlugin(Plugin):
 
         self.info_cache = {}
 
-        self.timed_tasks = Eventual(self.action_games)
+        # update_game_info calls vs. renders actually made (see !pugstats).
+        self.info_stats = {"requested": 0, "rendered": 0}
 
-        self.spawn_later(5, self.queue_tasks)
+        index_pickup_configs()
+
+        # Live games, rebuilt from the active rows; every lookup and save below goes through it.
+        self.games = ActiveGames()
+        self.games.load()
+
+        metrics.gauge("punybot_pickup_active_games", "Pickup games currently active.", fn=self.games.__len__)
+        metrics.counter("punybot_pickup_info_updates_total", "Game info updates requested vs. renders made.",
+                        ("stage",), fn=lambda: self.info_stats)
+
+        router.add(self, self.ag_tiv_listener, (3, 5), prefix="ag_")
+        router.add(self, self.pug_listener, (3, 5), prefix="pug_")
+
+        self.spawn_later(5, self.recover_timers)
 
         super(PickupPlugin, self).load(ctx)
 
+    def drain(self):
+        """Shutdown step (see PunyBot.utils.shutdown): hand every unsaved game/roster change to the
+        write-behind queue, which the coordinator flushes next."""
+        self.games.flush()
+
+    def unload(self, ctx):
+        timers.cancel_namespace("pickup")
+        timers.cancel_namespace("pickup_info")
+        router.remove_owner(self)
+        if not self.games.stop():
+            self.log.warning("[PUG System]: Game writes not committed within %ss on unload (%d write(s) queued).",
+                             FLUSH_TIMEOUT, write_behind.pending())
+        super(PickupPlugin, self).unload(ctx)
+
     # TODO: Check given server credentials to get server information during PUG creation.
     def check_steam_server(self, server_host, cfg):
         steam_key = os.getenv("STEAM_API_KEY")
@@ -68,7 +279,7 @@ class PickupPlugin(Plugin):
             return None
 
         try:
-            r = requests.get(
+            r = http_client.get(
                 f"https://api.steampowered.com/IGameServersService/GetServerList/v1/?filter=\appid\\{cfg.game_id}&limit=5000&key={steam_key}")
             if r.status_code == 403:
                 self.log.error(
@@ -82,105 +293,98 @@ class PickupPlugin(Plugin):
                 "Error: JSONDecodeException when getting Server List from Steam's API. Possible bad response? Skipping...")
             return None
 
-    def end_games(self):
-        needs_to_end = list(PickupGame.select().where(
-            (PickupGame.active == True) &
-            (PickupGame.end_time < datetime.now())
-        ))
-
-        if len(needs_to_end) > 0:
-            self.log.info(f"[PUG Ending System]: Attempting to end {len(needs_to_end)} games!")
-            for game in needs_to_end:
-                self.end_game(game, from_tasks=True)
-
-            gevent.sleep(5)
-            self.queue_tasks()
-        else:
+    def action_game(self, game_id):
+        """Timer callback: run a game's next timed action (a prompt, or the end) and arm the one after."""
+        game = self.games.get(game_id)
+        if game is None:
             return
 
-    def action_games(self):
-        next_game = list(PickupGame.select().where(
-            (PickupGame.active == True) &
-            (PickupGame.next_action_time < datetime.now())
-        ))
-
-        if len(next_game) > 0:
-            self.log.info(f"[PUG Warning System]: Attempting to prompt {len(next_game)} games!")
-            for game in next_game:
+        self.log.info(f"[PUG Warning System]: Attempting to prompt game {game_id}!")
 
-                game_channel = self.client.state.channels.get(game.chat_channel_id)
-                content = f"**Warning** This channel will expire <t:{int(game.end_time.timestamp())}:R>. If you need to extend the time, please click the button below!"
+        game_channel = self.client.state.channels.get(game.chat_channel_id)
+        content = f"**Warning** This channel will expire <t:{int(game.end_time.timestamp())}:R>. If you need to extend the time, please click the button below!"
 
-                control_buttons = ActionRow()
-                extend_timer_button = MessageComponent()
-                extend_timer_button.type = ComponentTypes.BUTTON
-                extend_timer_button.style = ButtonStyles.SECONDARY
-                extend_timer_button.emoji = None
-                extend_timer_button.label = "Extend Channel Time"
-                extend_timer_button.custom_id = "ag_extend_time"
-                control_buttons.add_component(extend_timer_button)
+        control_buttons = ActionRow()
+        extend_timer_button = MessageComponent()
+        extend_timer_button.type = ComponentTypes.BUTTON
+        extend_timer_button.style = ButtonStyles.SECONDARY
+        extend_timer_button.emoji = None
+        extend_timer_button.label = "Extend Channel Time"
+        extend_timer_button.custom_id = "ag_extend_time"
+        control_buttons.add_component(extend_timer_button)
+
+        if game.action_type == ActionType.END_GAME:
+            self.log.info(f"Ending Game!: {game.id}")
+            self.end_game(game)
+            return
 
-                if game.action_type == ActionType.END_GAME:
-                    self.log.info(f"Ending Game!: {game.id}")
-                    self.end_game(game, from_tasks=True)
-                    return
-
-                if game.action_type == ActionType.ONE_MINUTE_PROMPT:
-                    self.log.info(f"One Minute Left!: {game.id}")
-                    game.action_type = ActionType.END_GAME
-                    game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 60)
-                    # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
-
-                if game.action_type == ActionType.FIVE_MINUTE_PROMPT:
-                    self.log.info(f"Five Minutes Left!: {game.id}")
-                    game.action_type = ActionType.ONE_MINUTE_PROMPT
-                    game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 240)
-                    # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
-
-                if game.action_type == ActionType.TEN_MINUTE_PROMPT:
-                    self.log.info(f"Ten Minutes Left!: {game.id}")
-                    game.action_type = ActionType.FIVE_MINUTE_PROMPT
-                    game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 300)
-                    # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
-
-                if game.action_type == ActionType.HALF_TIME_PROMPT:
-                    self.log.info(f"Half Time Prompt!: {game.id}")
-                    game.action_type = ActionType.TEN_MINUTE_PROMPT
-                    game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 1200)
-                    # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
-
-                msg = game_channel.send_message(content=content,
-                                                allowed_mentions={"parse": ["roles"]},
-                                                components=[control_buttons.to_dict()])
-
-                # Track prompt messages to use with timer extensions
-                if not game.extra_info.get('prompt_messages'):
-                    game.extra_info['prompt_messages'] = [msg.id]
-                else:
-                    game.extra_info['prompt_messages'].append(msg.id)
-
-                game.save()
-
-            gevent.sleep(5)
-            self.queue_tasks()
+        if game.action_type == ActionType.ONE_MINUTE_PROMPT:
+            self.log.info(f"One Minute Left!: {game.id}")
+            game.action_type = ActionType.END_GAME
+            game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 60)
+            # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
+
+        if game.action_type == ActionType.FIVE_MINUTE_PROMPT:
+            self.log.info(f"Five Minutes Left!: {game.id}")
+            game.action_type = ActionType.ONE_MINUTE_PROMPT
+            game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 240)
+            # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
+
+        if game.action_type == ActionType.TEN_MINUTE_PROMPT:
+            self.log.info(f"Ten Minutes Left!: {game.id}")
+            game.action_type = ActionType.FIVE_MINUTE_PROMPT
+            game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 300)
+            # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
+
+        if game.action_type == ActionType.HALF_TIME_PROMPT:
+            self.log.info(f"Half Time Prompt!: {game.id}")
+            game.action_type = ActionType.TEN_MINUTE_PROMPT
+            game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 1200)
+            # game.next_action_time = datetime.fromtimestamp(datetime.now().timestamp() + 10)
+
+        msg = game_channel.send_message(content=content,
+                                        allowed_mentions={"parse": ["roles"]},
+                                        components=[control_buttons.to_dict()])
+
+        # Track prompt messages to use with timer extensions
+        if not game.extra_info.get('prompt_messages'):
+            game.extra_info['prompt_messages'] = [msg.id]
         else:
-            return
+            game.extra_info['prompt_messages'].append(msg.id)
 
-    def queue_tasks(self):
+        self.games.save(game, 'action_type', 'next_action_time', 'extra_info')
+        self.schedule_game(game)
 
-        next_action = list(PickupGame.select().where(
-            (PickupGame.active == True) &
-            (~(PickupGame.next_action_time >> None))
-        ).order_by(PickupGame.next_action_time.asc()).limit(1))
+    def game_config(self, game):
+        """(config key, PickupGamesConfig) for a game, from the key stored on it. Games created before
+        the key was stored fall back to their channel's category (one REST call) and get it saved."""
+        config = CONFIG.pickup_games.get(game.guild_id, {}).get(game.config_key) if game.config_key else None
+        if config is not None:
+            return game.config_key, config
 
-        if not next_action:
+        channel = self.client.api.channels_get(game.chat_channel_id)
+        key, config = get_cfg_for_game(game.guild_id, 'chat_channels_category', channel.parent_id)
+        game.config_key = key
+        self.games.save(game, 'config_key')
+        return key, config
+
+    def schedule_game(self, game):
+        """(Re)arm the timer for a game's next action, or drop it if the game has none / has ended."""
+        if not game.active or game.next_action_time is None:
+            timers.cancel(("pickup", game.id))
+            return
+        timers.schedule(("pickup", game.id), game.next_action_time, self.action_game, game.id)
+        self.log.info(f"[PUG Warning System]: Waiting until {game.next_action_time} for Game ID: {game.id}")
+
+    def recover_timers(self):
+        """Re-arm a timer for every active game's pending action (once, at startup)."""
+        games = [game for game in self.games if game.next_action_time is not None]
+        for game in games:
+            self.schedule_game(game)
+        if not games:
             self.log.info("[PUG Warning System]: No currently active games pending action.")
-        else:
-            self.log.info(
-                f"[PUG Warning System]: Waiting until {next_action[0].next_action_time} for Game ID: {next_action[0].id}")
-            self.timed_tasks.set_next_schedule(next_action[0].next_action_time)
 
-    def start_game(self, event, information, config):
+    def start_game(self, event, information, key, config):
 
         server_info = ""
         if information.get('server_info'):
@@ -277,7 +481,6 @@ class PickupPlugin(Plugin):
                                          components=[button_row.to_dict()])
 
         extra_info = {
-            "players": [event.member.id],
             "server": information.get('server_info') or {}
         }
 
@@ -287,29 +490,44 @@ class PickupPlugin(Plugin):
         new_game = PickupGame().create(host_id=event.member.id, chat_channel_id=channel.id,
                                        active_game_message_id=am.id,
                                        control_message_id=cm.id, extra_info=extra_info, guild_id=event.guild.id,
-                                       region=information['region'], action_type=0)
+                                       region=information['region'], action_type=0,
+                                       config_key=key)
+
+        self.games.add(new_game)
+        self.games.add_player(new_game, event.member.id)
 
         channel.set_name(f"{new_game.region}-{new_game.id}")
 
-        # Just make sure all the tasks are up to date!
-        self.queue_tasks()
+        self.schedule_game(new_game)
         return event.reply(type=7, content="Setup completed.").after(10).delete()
 
     def update_game_info(self, game, config, update_player_count=False):
+        """Mark a game's active-game embed and control message stale. Changes are coalesced: the two
+        messages are re-rendered once, GAME_INFO_DEBOUNCE_SECONDS after the first change."""
+        self.info_stats["requested"] += 1
+        key = ("pickup_info", game.id)
+        if key not in timers:
+            timers.schedule(key, time.time() + GAME_INFO_DEBOUNCE_SECONDS, self.render_game_info, game.id)
+
+    def render_game_info(self, game_id):
+        game = self.games.get(game_id)
+        if game is None:
+            # Ended before the window closed; its messages are gone.
+            return
+        key, config = self.game_config(game)
+        self.info_stats["rendered"] += 1
 
-        # Grab the message in the active games channel to edit!
+        # Edit the message in the active games channel by its known id - no fetch first.
         host = self.client.state.guilds[game.guild_id].get_member(game.host_id)
 
         try:
-            agc_message = self.client.api.channels_messages_get(config.active_games_channel,
-                                                                game.active_game_message_id)
-
             new_content = f"Hello <@&{config.lfg_role}>, A new game is starting!"
             embed = MessageEmbed()
             embed.set_author(name=f"Host: {host}", icon_url=host.get_avatar_url())
-            embed.description = f"**Region**: `{game.region}`\n**Chat**: <#{game.chat_channel_id}>\n**Players**: {len(game.extra_info['players'])}"  # {server_info}"
+            embed.description = f"**Region**: `{game.region}`\n**Chat**: <#{game.chat_channel_id}>\n**Players**: {len(self.games.players(game))}"  # {server_info}"
 
-            agc_message.edit(content=new_content, embeds=[embed])
+            self.client.api.channels_messages_modify(config.active_games_channel, game.active_game_message_id,
+                                                     content=new_content, embeds=[embed])
 
         except APIException as e:
             if e.code == 10008:
@@ -320,7 +538,7 @@ class PickupPlugin(Plugin):
 
         # if update_player_count:
         #     try:
-        #         self.client.api.channels_get(game.chat_channel_id).set_name(f"({game.region}) {len(game.extra_info['players'])} Player{'s' if len(game.extra_info['players']) > 1 else ''}")
+        #         self.client.api.channels_get(game.chat_channel_id).set_name(f"({game.region}) {len(self.games.players(game))} Player{'s' if len(self.games.players(game)) > 1 else ''}")
         #     except APIException as e:
         #         if e.code == 10008:
         #             self.log.error(
@@ -328,10 +546,8 @@ class PickupPlugin(Plugin):
         #         else:
         #             raise e
 
-        # Grab the message in the game's chat channel to edit!
+        # Edit the message in the game's chat channel, again by id.
         try:
-            control_message = self.client.api.channels_messages_get(game.chat_channel_id, game.control_message_id)
-
             server_info = ""
             if game.extra_info.get('server'):
                 server_info = Messages.pickup_chat_server_information.format(
@@ -345,7 +561,7 @@ class PickupPlugin(Plugin):
                                                                        action_time=int(
                                                                            game.next_action_time.timestamp()))
 
-            control_message.edit(content=content)
+            self.client.api.channels_messages_modify(game.chat_channel_id, game.control_message_id, content=content)
 
         except APIException as e:
             if e.code == 10008:
@@ -354,11 +570,9 @@ class PickupPlugin(Plugin):
             else:
                 raise e
 
-    def end_game(self, game, from_tasks=False):
+    def end_game(self, game):
 
-        channel = self.client.api.channels_get(game.chat_channel_id)
-
-        key, config = get_cfg_for_game(game.guild_id, 'chat_channels_category', channel.parent_id)
+        key, config = self.game_config(game)
 
         try:
             self.client.api.channels_messages_delete(config.active_games_channel,
@@ -376,44 +590,35 @@ class PickupPlugin(Plugin):
                     f"[PUG Ending System]: Unable to delete PUG Chat - Channel not found! Game ID: {game.id}, Channel ID: {game.chat_channel_id}")
 
         game.active = False
-        game.save()
+        self.games.save(game, 'active')
+        self.games.remove(game)
+        timers.cancel(("pickup_info", game.id))
 
-        if not from_tasks:
-            # Requeue in case this was at the front of the line!
-            return self.queue_tasks()
+        # Drop its pending prompt (a no-op when the timer itself is what ended the game).
+        self.schedule_game(game)
 
     # The listener for active games.
     # This will listen for and respond to button presses from the control messages from active games.
-    @Plugin.listen('InteractionCreate')
+    # Routed here for every "ag_" component/modal (see load).
     def ag_tiv_listener(self, event):
 
-        if event.raw_data['interaction']['type'] not in [3, 5]:
-            return
-
-        if not event.data.custom_id.startswith("ag_"):
-            return
-
         function = event.data.custom_id[3:]
 
-        game = PickupGame.get_or_none(chat_channel_id=event.channel.id)
+        game = self.games.by_channel(event.channel.id)
 
         if not game:
             return event.reply(type=4, content="**Error**: `Game not found`", flags=(1 << 6))
 
-        channel = self.client.api.channels_get(game.chat_channel_id)
-
-        key, config = get_cfg_for_game(game.guild_id, 'chat_channels_category', channel.parent_id)
+        key, config = self.game_config(game)
 
         if function == "leave_game":
-            if event.member.id not in game.extra_info['players']:
+            if not self.games.is_player(game, event.member.id):
                 return event.reply(type=4, content="**Unable To Leave Game**: `Not a player`", flags=(1 << 6))
             elif event.member.id == game.host_id:
                 return event.reply(type=4, content="**Error**: `Must migrate game host before leaving!`",
                                    flags=(1 << 6))
 
-            game.extra_info['players'].remove(event.member.id)
-
-            game.save()
+            self.games.remove_player(game, event.member.id)
 
             self.client.api.channels_permissions_delete(event.channel.id, event.member.id)
 
@@ -480,7 +685,7 @@ class PickupPlugin(Plugin):
                         break
 
             game.extra_info['server'] = new_server_info
-            game.save()
+            self.games.save(game, 'extra_info')
 
             self.update_game_info(game, config)
 
@@ -517,15 +722,16 @@ class PickupPlugin(Plugin):
                 return event.reply(type=7, content=f"Region is already set to {game.region}")
 
             game.region = event.data.values[0]
-            game.save()
+            self.games.save(game, 'region')
 
             self.update_game_info(game, config)
 
             return event.reply(type=7, content="Region has been updated!")
 
         if function == "select_host":
-            game.host_id = event.data.values[0]
-            game.save()
+            # Select values arrive as strings; the registry's copy must keep comparing equal to member ids.
+            game.host_id = int(event.data.values[0])
+            self.games.save(game, 'host_id')
 
             self.update_game_info(game, config)
 
@@ -540,10 +746,10 @@ class PickupPlugin(Plugin):
             select_menu.custom_id = "ag_select_host"
             select_menu.placeholder = "Select a new host!"
 
-            if len(game.extra_info['players']) == 1:
+            if len(self.games.players(game)) == 1:
                 return event.reply(type=4, content="Not enough players to change game host.", flags=(1 << 6))
 
-            for player in game.extra_info['players']:
+            for player in self.games.players(game):
 
                 if player == game.host_id:
                     continue
@@ -599,10 +805,6 @@ class PickupPlugin(Plugin):
             if event.member.id != game.host_id:
                 event.reply(type=4, content="Only the host may extend the timer.", flags=(1 << 6))
             else:
-                game.active = False
-                game.save()
-                self.queue_tasks()
-
                 # Get new ending time
                 new_end_time = datetime.fromtimestamp(datetime.now().timestamp() + 3600)
                 game.end_time = new_end_time
@@ -610,10 +812,9 @@ class PickupPlugin(Plugin):
                 game.action_type = ActionType.HALF_TIME_PROMPT
                 # Reset the next action time
                 game.next_action_time = datetime.fromtimestamp(new_end_time.timestamp() - 1800)
-                # Save the game to DB
-                game.active = True
-                game.save()
-                self.queue_tasks()
+                # Save the game to DB and re-arm its timer for the new half-time prompt
+                self.games.save(game, 'end_time', 'action_type', 'next_action_time')
+                self.schedule_game(game)
                 event.reply(type=4,
                             content=f"Time Extended, the channel will now expire at <t:{int(new_end_time.timestamp())}:T> (<t:{int(new_end_time.timestamp())}:R>)",
                             flags=(1 << 6))
@@ -649,15 +850,9 @@ class PickupPlugin(Plugin):
 
     # This is the listener for game creation/role handout for LFG.
     # 4 == Reply to message || 7 == Edit message || 9 == Reply w/modal
-    @Plugin.listen('InteractionCreate')
+    # Routed here for every "pug_" component/modal (see load).
     def pug_listener(self, event):
 
-        if event.raw_data['interaction']['type'] not in [3, 5]:
-            return
-
-        if not event.data.custom_id.startswith("pug_"):
-            return
-
         function = event.data.custom_id[4:]
 
         key, config = get_cfg_for_game(event.guild.id, 'active_games_channel', event.channel.id)
@@ -758,7 +953,7 @@ class PickupPlugin(Plugin):
             # return event.delete()
 
         if function == "supply_server_no":
-            return self.start_game(event, self.info_cache.pop(event.member.id), config)
+            return self.start_game(event, self.info_cache.pop(event.member.id), key, config)
 
         if function == "server_info":
 
@@ -803,24 +998,20 @@ class PickupPlugin(Plugin):
                                components=[yes_no.to_dict()], flags=(1 << 6))
 
         if function == "confirm_yes":
-            return self.start_game(event, self.info_cache.pop(event.member.id), config)
+            return self.start_game(event, self.info_cache.pop(event.member.id), key, config)
 
         if function == "confirm_no":
             return event.reply(type=7, content="Setup cancelled.").after(10).delete()
 
         if function == "join_game":
-            game = PickupGame.get_or_none(active_game_message_id=event.message.id)
+            game = self.games.by_message(event.message.id)
 
             if not game:
                 return event.reply(type=4, content="**Unable To Join Game**: `Game not found`", flags=(1 << 6))
 
-            if event.member.id in game.extra_info['players']:
+            if not self.games.add_player(game, event.member.id):
                 return event.reply(type=4, content="**Unable To Join Game**: `Already a player`", flags=(1 << 6))
 
-            game.extra_info['players'].append(event.member.id)
-
-            game.save()
-
             chat_channel = self.client.state.channels.get(game.chat_channel_id) or self.client.api.channels_get(
                 game.chat_channel_id)
             chat_channel.create_overwrite(event.member, allow=(Permissions.VIEW_CHANNEL + Permissions.CONNECT))
@@ -832,6 +1023,14 @@ class PickupPlugin(Plugin):
 
             return event.reply(type=4, content="Game joined!", flags=(1 << 6)).after(10).delete()
 
+    @Plugin.command('pugstats')
+    def pug_stats(self, event):
+        requested, rendered = self.info_stats["requested"], self.info_stats["rendered"]
+        # Each render is two edits; every request used to be two fetches and two edits.
+        saved = requested * 4 - rendered * 2
+        return event.msg.reply(f"`{len(self.games)} active game(s). Game info: {requested} update(s) coalesced into "
+                               f"{rendered} render(s), {saved} REST call(s) saved.`")
+
     @Plugin.command('sendpugmsg')
     def send_pug_msg(self, event):
         content = "replaced with template"
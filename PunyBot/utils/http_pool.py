@@ -0,0 +1,174 @@
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from PunyBot.utils.metrics import metrics
+
+# Latency samples kept per host for the percentile metrics (a rolling window, not all-time).
+LATENCY_SAMPLES = 512
+
+# Status codes worth a retry: throttling and transient upstream failures. Anything else (403, 404, ...)
+# is the caller's to handle and is returned as-is.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Outbound request latency per host (including retries and backoff), served on the metrics endpoint.
+REQUEST_SECONDS = metrics.histogram("punybot_http_request_seconds",
+                                    "Outbound HTTP request latency, including retries.", ("host",))
+
+
+class HostPolicy(object):
+    """
+    Per-host request policy: default timeout, retry budget and exponential backoff factor (urllib3
+    sleeps ``backoff * 2 ** (retry - 1)`` between attempts, honoring Retry-After), and the number of
+    keep-alive connections kept open to the host.
+    """
+
+    def __init__(self, timeout=15, retries=1, backoff=0.5, pool_size=4):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+
+    def __repr__(self):
+        return '<HostPolicy timeout={} retries={} backoff={} pool_size={}>'.format(
+            self.timeout, self.retries, self.backoff, self.pool_size)
+
+
+DEFAULT_POLICY = HostPolicy()
+
+# The hosts the pollers hit on a fixed cadence. Anything not listed (RSS feeds, a non-default stats or
+# Forgejo host) gets DEFAULT_POLICY.
+HOST_POLICIES = {
+    # Stats feed: polled every ~20 s, and a backlog drain prefetches one page ahead (2 in flight).
+    "dystopia-stats.com": HostPolicy(timeout=15, retries=2, backoff=0.5, pool_size=2),
+    # Forgejo tasks + ci-logs SUMMARY.txt.
+    "git.punyhuman.com": HostPolicy(timeout=20, retries=1, backoff=1.0, pool_size=2),
+    # Player counts, news, server list.
+    "api.steampowered.com": HostPolicy(timeout=10, retries=2, backoff=1.0, pool_size=4),
+    # The store API rate-limits hard; back off longer and don't hammer it.
+    "store.steampowered.com": HostPolicy(timeout=10, retries=1, backoff=2.0, pool_size=1),
+}
+
+
+class _HostState(object):
+    def __init__(self, host, policy, tls):
+        self.host = host
+        self.policy = policy
+        self.tls = tls
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+        retry = Retry(total=policy.retries, backoff_factor=policy.backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(("GET", "HEAD")), raise_on_status=False,
+                      respect_retry_after_header=True)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=policy.pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.adapter = adapter
+
+    def connection_counts(self):
+        """(connections opened, requests sent) across this host's urllib3 pools - every opened
+        connection is one TCP (+TLS) handshake; every other request rode a pooled connection."""
+        opened = sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+        return opened, sent
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return None
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class HttpClient(object):
+    """
+    Shared outbound HTTP client for every poller plugin.
+
+    Each host gets its own ``requests.Session`` with a keep-alive connection pool and the host's
+    ``HostPolicy`` (timeout + retry/backoff), created on first use. Callers use ``get``/``request``
+    exactly like ``requests`` and get a ``requests.Response`` back; ``stats()`` reports pool reuse and
+    latency percentiles per host.
+    """
+
+    def __init__(self, policies=None, default_policy=DEFAULT_POLICY):
+        self.policies = dict(policies or {})
+        self.default_policy = default_policy
+        self._hosts = {}
+
+    def _state_for(self, url):
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        state = self._hosts.get(host)
+        if state is None:
+            state = _HostState(host, self.policies.get(host, self.default_policy), parts.scheme == "https")
+            self._hosts[host] = state
+        return state
+
+    def request(self, method, url, **kwargs):
+        state = self._state_for(url)
+        kwargs.setdefault("timeout", state.policy.timeout)
+        state.requests += 1
+        started = time.monotonic()
+        try:
+            return state.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            state.errors += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            state.latencies.append(elapsed)
+            REQUEST_SECONDS.observe(elapsed, host=state.host)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def stats(self):
+        """{host: metrics} for every host used so far. ``connections`` is the number of connections
+        opened (each a TCP/TLS handshake), ``pool_hits`` the requests that reused a pooled connection,
+        ``handshakes_avoided`` the same for TLS hosts only, and ``p50/p90/p99_ms`` the recent request
+        latency (including retries and backoff)."""
+        out = {}
+        for host, state in self._hosts.items():
+            opened, sent = state.connection_counts()
+            hits = max(0, sent - opened)
+            ordered = sorted(state.latencies)
+            out[host] = {
+                "requests": state.requests,
+                "errors": state.errors,
+                "connections": opened,
+                "pool_hits": hits,
+                "handshakes_avoided": hits if state.tls else 0,
+                "p50_ms": self._ms(_percentile(ordered, 50)),
+                "p90_ms": self._ms(_percentile(ordered, 90)),
+                "p99_ms": self._ms(_percentile(ordered, 99)),
+            }
+        return out
+
+    @staticmethod
+    def _ms(seconds):
+        return None if seconds is None else round(seconds * 1000.0, 1)
+
+    def close(self):
+        """Close every pooled connection (shutdown). Safe to call more than once."""
+        for state in self._hosts.values():
+            state.session.close()
+
+
+http_client = HttpClient(HOST_POLICIES)
+
+metrics.counter("punybot_http_requests_total", "Outbound HTTP requests per host.", ("host",),
+                fn=lambda: {host: s.requests for host, s in http_client._hosts.items()})
+metrics.counter("punybot_http_errors_total", "Outbound HTTP requests that raised (no response).", ("host",),
+                fn=lambda: {host: s.errors for host, s in http_client._hosts.items()})
@@ -0,0 +1,183 @@
+import logging
+import time
+
+from PunyBot.utils.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Interaction types (Discord's numbering) -> the name used in route keys and stats.
+INTERACTION_TYPES = {2: "command", 3: "component", 4: "autocomplete", 5: "modal"}
+
+# Discord fails an interaction that isn't acknowledged within 3 s of being created.
+ACK_DEADLINE_SECONDS = 3.0
+
+# Discord epoch (2015-01-01) in ms; an interaction id's top 42 bits are ms since then.
+DISCORD_EPOCH_MS = 1420070400000
+
+# Latency samples kept per route for the percentiles.
+LATENCY_SAMPLES = 256
+
+
+class _PrefixTrie(object):
+    """Character trie mapping prefixes to values; ``longest(s)`` finds the longest registered prefix of ``s``."""
+
+    def __init__(self):
+        self._root = {}
+
+    def insert(self, prefix, value):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = value
+
+    def remove(self, prefix):
+        path = [self._root]
+        for char in prefix:
+            node = path[-1].get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].pop(None, None)
+        # Prune the branches left empty, deepest first.
+        for depth in range(len(prefix), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][prefix[depth - 1]]
+
+    def longest(self, s):
+        node, found = self._root, self._root.get(None)
+        for char in s:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found = node[None]
+        return found
+
+
+class _Route(object):
+    def __init__(self, key, owner, handler):
+        self.key = key
+        self.owner = owner
+        self.handler = handler
+        self.calls = 0
+        self.errors = 0
+        self.late = 0
+        self.handler_seconds = 0.0
+        self.ages = []
+
+    def record(self, handler_seconds, age):
+        self.calls += 1
+        self.handler_seconds += handler_seconds
+        if age is not None:
+            self.ages.append(age)
+            del self.ages[:-LATENCY_SAMPLES]
+            if age > ACK_DEADLINE_SECONDS:
+                self.late += 1
+
+
+class InteractionRouter(object):
+    """
+    Central InteractionCreate dispatch.
+
+    Plugins register a handler per route - interaction type plus an exact ``custom_id``, a ``custom_id``
+    prefix, or a command name - and one listener (CorePlugin) hands every interaction to ``dispatch``,
+    which finds its single handler with a dict lookup (exact id / command) or a trie walk (longest
+    prefix) and calls it. Each route tracks its handler time and how old the interaction was when the
+    handler returned, against Discord's 3 s acknowledgement deadline (see ``stats``).
+    """
+
+    def __init__(self):
+        self._exact = {}  # (type, custom_id or command name) -> _Route
+        self._prefixes = {}  # type -> _PrefixTrie of _Route
+        self._routes = []
+        self.unrouted = 0
+
+    def add(self, owner, handler, types, custom_id=None, prefix=None, command=None):
+        """Route interactions of ``types`` (ints) matching exactly one of ``custom_id``, ``prefix`` or
+        ``command`` to ``handler(event)``. ``owner`` (the plugin) is what ``remove_owner`` drops."""
+        if sum(x is not None for x in (custom_id, prefix, command)) != 1:
+            raise ValueError("A route needs exactly one of custom_id, prefix or command")
+        for interaction_type in types:
+            kind, match = (("id", custom_id) if custom_id is not None else
+                           ("prefix", prefix) if prefix is not None else ("command", command))
+            route = _Route(f"{INTERACTION_TYPES.get(interaction_type, interaction_type)}:{kind}:{match}",
+                           owner, handler)
+            if kind == "prefix":
+                self._prefixes.setdefault(interaction_type, _PrefixTrie()).insert(match, route)
+            else:
+                self._exact[(interaction_type, match)] = route
+            self._routes.append((interaction_type, kind, match, route))
+
+    def remove_owner(self, owner):
+        """Drop every route ``owner`` registered (call from the plugin's unload)."""
+        keep = []
+        for interaction_type, kind, match, route in self._routes:
+            if route.owner is not owner:
+                keep.append((interaction_type, kind, match, route))
+            elif kind == "prefix":
+                self._prefixes[interaction_type].remove(match)
+            elif self._exact.get((interaction_type, match)) is route:
+                del self._exact[(interaction_type, match)]
+        self._routes = keep
+
+    def resolve(self, interaction_type, key):
+        """The route for an interaction's type and custom_id / command name, or None."""
+        route = self._exact.get((interaction_type, key))
+        if route is None and key is not None and interaction_type in self._prefixes:
+            route = self._prefixes[interaction_type].longest(key)
+        return route
+
+    def dispatch(self, event):
+        interaction = event.raw_data['interaction']
+        interaction_type = interaction['type']
+        data = interaction.get('data') or {}
+        key = data.get('name') if interaction_type in (2, 4) else data.get('custom_id')
+        route = self.resolve(interaction_type, key)
+        if route is None:
+            self.unrouted += 1
+            return None
+
+        started = time.monotonic()
+        try:
+            return route.handler(event)
+        except Exception:
+            route.errors += 1
+            log.exception("Interaction handler for %s failed", route.key)
+        finally:
+            try:
+                age = time.time() - ((int(interaction['id']) >> 22) + DISCORD_EPOCH_MS) / 1000
+            except (KeyError, TypeError, ValueError):
+                age = None
+            route.record(time.monotonic() - started, age)
+
+    def stats(self):
+        """{route key: metrics} for every route that has been hit. ``p50_s``/``p95_s``/``max_s`` are how old
+        the interaction was when its handler returned, ``late`` how many of those were past the 3 s
+        ack deadline, ``handler_ms`` the average time spent in the handler itself."""
+        out = {}
+        for _, _, _, route in self._routes:
+            if not route.calls:
+                continue
+            ages = sorted(route.ages)
+            out[route.key] = {
+                "calls": route.calls,
+                "errors": route.errors,
+                "late": route.late,
+                "handler_ms": round(route.handler_seconds / route.calls * 1000, 1),
+                "p50_s": round(ages[len(ages) // 2], 2) if ages else None,
+                "p95_s": round(ages[int(len(ages) * 0.95)], 2) if ages else None,
+                "max_s": round(ages[-1], 2) if ages else None,
+            }
+        return out
+
+
+router = InteractionRouter()
+
+metrics.counter("punybot_interactions_unrouted_total", "Interactions no route matched.", fn=lambda: router.unrouted)
+metrics.counter("punybot_interactions_total", "Routed interactions handled, by route.", ("route",),
+                fn=lambda: {r.key: r.calls for _, _, _, r in router._routes})
+metrics.counter("punybot_interaction_errors_total", "Routed interactions whose handler raised, by route.", ("route",),
+                fn=lambda: {r.key: r.errors for _, _, _, r in router._routes})
+metrics.counter("punybot_interactions_late_total", "Routed interactions handled past the 3 s ack deadline.",
+                ("route",), fn=lambda: {r.key: r.late for _, _, _, r in router._routes})
@@ -0,0 +1,220 @@
+import bisect
+import logging
+import math
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Histogram buckets (seconds) for any histogram that doesn't pass its own: 5 ms up to 2 minutes.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Prometheus text exposition format served by the endpoint.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+        return str(int(value))
+    return repr(value)
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.fn = fn
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _collected(self):
+        """{label values: value} - from ``fn`` for a pulled metric (a number, or a dict keyed by a
+        label value / tuple of them), else what was recorded."""
+        if self.fn is None:
+            return self._values
+        value = self.fn()
+        if not isinstance(value, dict):
+            return {(): value}
+        return {tuple(map(str, k)) if isinstance(k, tuple) else (str(k),): v for k, v in value.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._collected().items()):
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count; ``inc(amount, **labels)``. A counter built with ``fn`` reads an existing
+    running total instead (a number, or {label value(s): number})."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Point-in-time value; ``set``/``inc``/``dec``, or pulled from ``fn`` at scrape time."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution over fixed ``buckets`` (upper bounds); ``observe(value, **labels)`` or
+    ``with histogram.time(**labels):``."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), sum, count.
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry(object):
+    """
+    Process-wide counters, gauges and histograms, rendered as Prometheus text.
+
+    ``counter``/``gauge``/``histogram`` are get-or-create by name, so a module or plugin that is
+    reloaded keeps its series; re-registering a pulled metric (``fn``) rebinds it to the new callable.
+    ``serve(host, port)`` exposes ``/metrics`` from a small gevent WSGI server on the bot's own hub.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._server = None
+
+    def _get(self, cls, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif type(metric) is not cls:
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        elif kwargs.get("fn") is not None:
+            metric.fn = kwargs["fn"]
+        return metric
+
+    def counter(self, name, help, labels=(), fn=None):
+        return self._get(Counter, name, help, labels, fn=fn)
+
+    def gauge(self, name, help, labels=(), fn=None):
+        return self._get(Gauge, name, help, labels, fn=fn)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            try:
+                lines += metric.render()
+            except Exception:
+                log.exception("Collecting metric %s failed", name)
+        return "\n".join(lines) + "\n"
+
+    def _app(self, environ, start_response):
+        if environ.get("PATH_INFO") not in ("/metrics", "/metrics/"):
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"Not Found\n"]
+        body = self.render().encode("utf-8")
+        start_response("200 OK", [("Content-Type", CONTENT_TYPE), ("Content-Length", str(len(body)))])
+        return [body]
+
+    def serve(self, host, port):
+        """Start serving ``/metrics`` on ``host:port`` (replacing an endpoint already running)."""
+        from gevent.pywsgi import WSGIServer
+
+        self.stop()
+        self._server = WSGIServer((host, port), self._app, log=None)
+        self._server.start()
+        log.info("Serving metrics on http://%s:%s/metrics", host, self._server.server_port)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop(timeout=1)
+            self._server = None
+
+
+metrics = MetricsRegistry()
+
+# Shared poller telemetry: every scheduled poller wraps a cycle in track_poll(<poller name>).
+POLL_SECONDS = metrics.histogram("punybot_poll_seconds", "Duration of one poll cycle.", ("poller",))
+POLLS = metrics.counter("punybot_polls_total", "Poll cycles by outcome (ok/error).", ("poller", "outcome"))
+LAST_POLL = metrics.gauge("punybot_last_successful_poll_timestamp_seconds",
+                          "Unix time the poller last completed a cycle without raising.", ("poller",))
+
+
+@contextmanager
+def track_poll(poller):
+    """Time one poll cycle of ``poller`` and count its outcome; an exception is counted and re-raised.
+    Works as a ``with`` block or as a decorator on the scheduled method."""
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        POLLS.inc(poller=poller, outcome="error")
+        raise
+    else:
+        POLLS.inc(poller=poller, outcome="ok")
+        LAST_POLL.set(time.time(), poller=poller)
+    finally:
+        POLL_SECONDS.observe(time.monotonic() - started, poller=poller)
@@ -0,0 +1,254 @@
+import logging
+import time
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.lock import BoundedSemaphore
+from gevent.queue import Empty, Queue
+
+from PunyBot.utils.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Discord's message-create limit is per channel (5 per 5 s at the time of writing). A channel's bucket
+# starts there and is then corrected from the X-RateLimit-* headers of every response.
+DEFAULT_CAPACITY = 5
+DEFAULT_PERIOD = 5.0
+
+# Message creates in flight at once across ALL channels - well under the 50 req/s global limit, and
+# enough that a backlog to one channel never holds up posts to the others.
+MAX_IN_FLIGHT = 8
+
+# A channel's worker greenlet exits after this long with nothing queued; the next post respawns it.
+WORKER_IDLE_SECONDS = 30
+
+# How long send()/wait() block on one post (seconds) - its turn in the channel's queue plus the call.
+# On a timeout the post stays queued and may still go out.
+SEND_TIMEOUT = 60
+
+
+def _retry_after(response, default):
+    """Seconds a 429 asks us to wait: the JSON body's retry_after, else the Retry-After header."""
+    try:
+        return float(response.json()["retry_after"])
+    except Exception:
+        pass
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return default
+
+
+class _ChannelBucket(object):
+    """Token bucket + FIFO for one channel. ``capacity`` posts per ``period`` seconds, refilled
+    continuously; ``blocked_until`` holds the whole channel back after a 429 or an exhausted bucket."""
+
+    def __init__(self, channel_id, capacity, period):
+        self.channel_id = channel_id
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+        self.queue = Queue()
+        self.worker = None
+        self.busy = False
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.peak_queued = 0
+        self.waited = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.capacity / self.period)
+        self.stamp = now
+
+    def delay(self, now):
+        """Seconds until the next post may go out (0 = now)."""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.period / self.capacity
+
+    def update(self, response, now):
+        """Fold one response's rate-limit headers into the bucket. Returns the 429's retry-after, else None."""
+        headers = response.headers
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_after = float(headers["X-RateLimit-Reset-After"])
+        except (KeyError, TypeError, ValueError):
+            pass
+        else:
+            self._refill(now)
+            self.capacity = max(1, limit)
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0:
+                self.blocked_until = max(self.blocked_until, now + reset_after)
+
+        if response.status_code != 429:
+            return None
+        self.rate_limited += 1
+        wait = _retry_after(response, self.period)
+        self.blocked_until = max(self.blocked_until, now + wait)
+        return wait
+
+
+class PostScheduler(object):
+    """
+    Central outbound Discord message scheduler.
+
+    Every channel gets a token bucket (seeded at Discord's per-channel limit, then driven by the
+    ``X-RateLimit-*`` headers and 429s seen on its own responses) and a FIFO drained by its own worker
+    greenlet, so posts to different channels go out in parallel while a busy channel queues instead
+    of every post paying a fixed sleep. ``submit`` queues a message and returns an ``AsyncResult`` for
+    the created Message; ``send`` is the blocking form. ``stats()`` reports queue depth and 429s.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, period=DEFAULT_PERIOD, max_in_flight=MAX_IN_FLIGHT):
+        self.capacity = capacity
+        self.period = period
+        self._buckets = {}
+        self._slots = BoundedSemaphore(max_in_flight)
+        self.global_until = 0.0
+        self.rate_limited = 0
+        self.global_rate_limited = 0
+
+    def _bucket(self, channel_id):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = _ChannelBucket(channel_id, self.capacity, self.period)
+        return bucket
+
+    def submit(self, api, channel_id, **kwargs):
+        """Queue ``api.channels_messages_create(channel_id, **kwargs)``; returns its AsyncResult."""
+        bucket = self._bucket(channel_id)
+        result = AsyncResult()
+        bucket.queue.put((api, kwargs, result))
+        bucket.peak_queued = max(bucket.peak_queued, bucket.queue.qsize())
+        if bucket.worker is None:
+            bucket.worker = gevent.spawn(self._run, bucket)
+        return result
+
+    def send(self, api, channel_id, timeout=SEND_TIMEOUT, **kwargs):
+        """Post in ``channel_id``'s turn and return the created Message; raises what the API raised, or
+        TimeoutError after ``timeout`` seconds (None waits forever)."""
+        return self.wait(self.submit(api, channel_id, **kwargs), timeout)
+
+    @staticmethod
+    def wait(result, timeout=SEND_TIMEOUT):
+        """The Message of a ``submit`` result, waiting up to ``timeout`` seconds (TimeoutError after)."""
+        try:
+            return result.get(timeout=timeout)
+        except gevent.Timeout:
+            raise TimeoutError(f"Post not sent within {timeout}s (still queued)")
+
+    def _run(self, bucket):
+        try:
+            while True:
+                try:
+                    api, kwargs, result = bucket.queue.get(timeout=WORKER_IDLE_SECONDS)
+                except Empty:
+                    if bucket.queue.empty():
+                        return
+                    continue
+                bucket.busy = True
+                try:
+                    self._wait_turn(bucket)
+                    bucket.tokens -= 1
+                    with self._slots:
+                        self._call(bucket, api, kwargs, result)
+                except Exception as e:
+                    # Never leave a sender waiting on a post the worker can't finish.
+                    log.exception("Post to channel %s failed in the scheduler", bucket.channel_id)
+                    if not result.ready():
+                        bucket.failed += 1
+                        result.set_exception(e)
+                finally:
+                    bucket.busy = False
+        finally:
+            # Exited (idle) or died: the next submit spawns a fresh worker.
+            bucket.worker = None
+
+    def _wait_turn(self, bucket):
+        while True:
+            now = time.monotonic()
+            delay = max(bucket.delay(now), self.global_until - now)
+            if delay <= 0:
+                return
+            bucket.waited += delay
+            gevent.sleep(delay)
+
+    def _call(self, bucket, api, kwargs, result):
+        # capture() records every raw response of this call (disco retries 429/5xx internally, so there
+        # can be several); it's greenlet-local under the monkey-patched runtime.
+        with api.capture() as responses:
+            try:
+                msg = api.channels_messages_create(bucket.channel_id, **kwargs)
+            except Exception as e:
+                bucket.failed += 1
+                result.set_exception(e)
+            else:
+                bucket.sent += 1
+                result.set(msg)
+        now = time.monotonic()
+        for captured in responses:
+            response = captured.response
+            if response is None:
+                continue
+            wait = bucket.update(response, now)
+            if wait is None:
+                continue
+            self.rate_limited += 1
+            if response.headers.get("X-RateLimit-Global") or response.headers.get("X-RateLimit-Scope") == "global":
+                self.global_rate_limited += 1
+                self.global_until = max(self.global_until, now + wait)
+
+    def pending(self):
+        """Messages queued or being sent, across every channel."""
+        return sum(b.queue.qsize() + (1 if b.busy else 0) for b in self._buckets.values())
+
+    def flush(self, timeout=None):
+        """Wait (up to ``timeout`` seconds) for everything queued to be sent. True if it all went out."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            gevent.sleep(0.1)
+        return True
+
+    def stats(self):
+        """{channel_id: metrics} for every channel posted to so far. ``queued`` is the current depth,
+        ``peak_queued`` the deepest it has been, ``waited_s`` the total time posts were held back by the
+        bucket, and ``rate_limited`` the 429s Discord returned for the channel."""
+        now = time.monotonic()
+        out = {}
+        for channel_id, b in self._buckets.items():
+            out[channel_id] = {
+                "queued": b.queue.qsize(),
+                "peak_queued": b.peak_queued,
+                "sent": b.sent,
+                "failed": b.failed,
+                "rate_limited": b.rate_limited,
+                "waited_s": round(b.waited, 1),
+                "capacity": b.capacity,
+                "tokens": round(min(b.capacity, b.tokens), 2),
+                "blocked_s": round(max(0.0, b.blocked_until - now), 1),
+            }
+        return out
+
+
+post_scheduler = PostScheduler()
+
+metrics.gauge("punybot_posts_pending", "Messages queued or being sent by the post scheduler.",
+              fn=post_scheduler.pending)
+metrics.counter("punybot_posts_total", "Messages posted through the post scheduler, by outcome.",
+                ("outcome",), fn=lambda: {
+                    "sent": sum(b.sent for b in post_scheduler._buckets.values()),
+                    "failed": sum(b.failed for b in post_scheduler._buckets.values())})
+metrics.counter("punybot_posts_rate_limited_total", "429 responses to scheduled posts.", ("scope",),
+                fn=lambda: {"any": post_scheduler.rate_limited, "global": post_scheduler.global_rate_limited})
+metrics.counter("punybot_posts_held_seconds_total", "Time posts were held back by channel rate limits.",
+                fn=lambda: sum(b.waited for b in post_scheduler._buckets.values()))
@@ -0,0 +1,198 @@
+import logging
+import os
+import sys
+import time
+import weakref
+from collections import Counter
+from datetime import datetime
+
+import gevent
+import greenlet
+from gevent import monkey
+from gevent.hub import get_hub
+
+log = logging.getLogger(__name__)
+
+# The sampler thread looks at the hub thread's stack this often (seconds): 100 Hz.
+SAMPLE_INTERVAL = 0.01
+
+# Profile window (seconds) when none is given, and the longest one allowed.
+DEFAULT_SECONDS = 30
+MAX_SECONDS = 300
+
+# Frames kept per sampled stack (innermost dropped beyond this).
+MAX_STACK_DEPTH = 64
+
+# Greenlets listed in the report, by time spent running.
+REPORT_TOP = 10
+
+# Collapsed-stack files are written here, one per profile.
+PROFILE_DIR = os.path.join(os.getcwd(), "data")
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    """The stack under ``frame``, outermost first, as flamegraph frame names."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+def _label(frame):
+    """A greenlet's name for the report: its outermost PunyBot function (``dystopia.poll_feed``), else
+    its outermost function of any kind."""
+    ours = outermost = None
+    while frame is not None:
+        code = frame.f_code
+        if f"{os.sep}PunyBot{os.sep}" in code.co_filename:
+            ours = f"{os.path.splitext(os.path.basename(code.co_filename))[0]}.{code.co_name}"
+        outermost = code.co_name
+        frame = frame.f_back
+    return ours or outermost
+
+
+class _GreenletStats(object):
+    __slots__ = ("label", "runs", "seconds", "longest", "samples")
+
+    def __init__(self, label=None):
+        self.label = label
+        self.runs = 0
+        self.seconds = 0.0
+        self.longest = 0.0
+        self.samples = 0
+
+
+class GreenletProfiler(object):
+    """
+    On-demand sampling profiler for the bot's greenlets, cheap enough to run in production.
+
+    For ``seconds`` it does two things:
+
+    * a greenlet switch tracer charges the wall time between switches to the greenlet that was
+      running. Time a greenlet runs without switching is time the hub (and every other greenlet)
+      waited on it, so ``longest`` in the report is its worst hub stall. The hub's own time is idle
+      time plus the event loop.
+    * a native thread (not a greenlet - it must keep sampling while the hub is blocked) records the
+      hub thread's stack every SAMPLE_INTERVAL and files it under the greenlet that was running.
+
+    The samples are written to ``data/`` as collapsed stacks (``label;outer;...;inner count``, the
+    input of flamegraph.pl / speedscope), and a per-greenlet summary is logged and returned. One
+    profile runs at a time.
+    """
+
+    def __init__(self):
+        self.running = False
+        self._stats = None
+        self._by_greenlet = None
+        self._samples = None
+        self._current = None
+        self._switched_at = 0.0
+        self._switches = 0
+        self._previous_trace = None
+        self._hub = None
+
+    def _stats_for(self, glet):
+        stats = self._by_greenlet.get(glet)
+        if stats is None:
+            stats = self._by_greenlet[glet] = _GreenletStats("hub" if glet is self._hub else None)
+            self._stats.append(stats)
+        return stats
+
+    def _trace(self, event, args):
+        if event in ("switch", "throw"):
+            origin, target = args
+            now = time.perf_counter()
+            ran = now - self._switched_at
+            stats = self._current
+            stats.runs += 1
+            stats.seconds += ran
+            if ran > stats.longest:
+                stats.longest = ran
+            if stats.label is None and origin.gr_frame is not None:
+                stats.label = _label(origin.gr_frame)
+            self._current = self._stats_for(target)
+            self._switched_at = now
+            self._switches += 1
+        if self._previous_trace is not None:
+            self._previous_trace(event, args)
+
+    def _sample(self, thread_id, stop_at):
+        sleep = monkey.get_original("time", "sleep")
+        while self.running and time.monotonic() < stop_at:
+            sleep(SAMPLE_INTERVAL)
+            frame = sys._current_frames().get(thread_id)
+            stats = self._current
+            if frame is None or stats is None:
+                continue
+            stats.samples += 1
+            if stats.label is None:
+                stats.label = _label(frame)
+            self._samples[(stats, _collapse(frame))] += 1
+
+    def profile(self, seconds=DEFAULT_SECONDS):
+        """Profile every greenlet for ``seconds`` (blocks this greenlet only). Returns (report text,
+        collapsed-stack file path)."""
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        seconds = max(1, min(MAX_SECONDS, seconds))
+        self.running = True
+        self._hub = get_hub()
+        self._stats = []
+        self._by_greenlet = weakref.WeakKeyDictionary()
+        self._samples = Counter()
+        self._switches = 0
+        self._current = self._stats_for(greenlet.getcurrent())
+        self._current.label = "profiler"
+        self._switched_at = time.perf_counter()
+        started = time.monotonic()
+        self._previous_trace = greenlet.settrace(self._trace)
+        log.info("Profiling greenlets for %ss", seconds)
+        try:
+            start_thread = monkey.get_original("_thread", "start_new_thread")
+            start_thread(self._sample, (monkey.get_original("_thread", "get_ident")(), started + seconds))
+            gevent.sleep(seconds)
+        finally:
+            greenlet.settrace(self._previous_trace)
+            self._previous_trace = None
+            self.running = False
+        elapsed = time.monotonic() - started
+        return self._report(elapsed), self._write()
+
+    def _write(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed")
+        with open(path, "w") as f:
+            # Snapshot first: the sampler thread may still record one last sample.
+            for (stats, stack), count in sorted(dict(self._samples).items(), key=lambda item: -item[1]):
+                label = (stats.label or "greenlet").replace(";", ",").replace(" ", "_")
+                f.write(";".join((label,) + stack) + f" {count}\n")
+        return path
+
+    def _report(self, elapsed):
+        by_label = {}
+        for stats in self._stats:
+            if stats is self._by_greenlet.get(self._hub):
+                continue
+            total = by_label.setdefault(stats.label or "greenlet", _GreenletStats(stats.label))
+            total.runs += stats.runs
+            total.seconds += stats.seconds
+            total.longest = max(total.longest, stats.longest)
+            total.samples += stats.samples
+        hub = self._by_greenlet.get(self._hub) or _GreenletStats("hub")
+        samples = sum(dict(self._samples).values())
+        lines = [f"profiled {elapsed:.1f}s: {samples} samples, {self._switches} switches, "
+                 f"hub idle/loop {hub.seconds:.2f}s ({hub.seconds / elapsed:.0%})",
+                 f"{'greenlet':<36} {'run s':>7} {'runs':>7} {'max ms':>8} {'samples':>7}"]
+        for label, stats in sorted(by_label.items(), key=lambda item: -item[1].seconds)[:REPORT_TOP]:
+            lines.append(f"{label[:36]:<36} {stats.seconds:>7.2f} {stats.runs:>7} "
+                         f"{stats.longest * 1000:>8.1f} {stats.samples:>7}")
+        return "\n".join(lines)
+
+
+profiler = GreenletProfiler()
@@ -0,0 +1,120 @@
+import logging
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import gevent
+
+from PunyBot.database import sqlite_db
+from PunyBot.utils.http_pool import http_client
+from PunyBot.utils.metrics import metrics
+from PunyBot.utils.post_scheduler import post_scheduler
+from PunyBot.utils.write_behind import write_behind
+
+log = logging.getLogger(__name__)
+
+# Phase budgets (seconds). Together they stay inside `docker stop`'s default 10 s grace period.
+# Every plugin's drain() runs in parallel under DRAIN_DEADLINE; the shared post and write queues then
+# get FLUSH_DEADLINE to empty; the plugin unloads (in parallel again) get UNLOAD_DEADLINE before any
+# straggler is torn down by force, and the writes the unloads queued get UNLOAD_DEADLINE to commit.
+DRAIN_DEADLINE = 4
+FLUSH_DEADLINE = 2
+UNLOAD_DEADLINE = 1.5
+
+
+class ShutdownCoordinator(object):
+    """
+    Graceful shutdown in phases, each bounded by a deadline and timed in the log:
+
+    1. drain   - every plugin with a ``drain()`` method (flush its buffers, let an in-flight poll
+                 finish, hand its state to the write-behind queue) runs it, all in parallel.
+    2. flush   - the post scheduler sends what's queued, then the write-behind queue commits.
+    3. unload  - plugins are unloaded in parallel (stopping their schedules and greenlets); plugins
+                 in ``keep`` just have their schedules stopped.
+    4. close   - metrics endpoint, pooled HTTP connections and the database.
+
+    A drain or unload that misses its deadline or raises is logged and the shutdown carries on.
+    Must run on its own greenlet (not the hub/a signal handler), since every phase blocks.
+    """
+
+    def __init__(self, bot, keep=()):
+        self.bot = bot
+        self.keep = set(keep)
+        self.timings = []
+
+    @contextmanager
+    def _phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.timings.append((name, elapsed))
+            log.info("[shutdown] %s finished in %.2fs", name, elapsed)
+
+    @staticmethod
+    def _parallel(phase, calls, deadline):
+        """Run every ``{name: func}`` on its own greenlet and wait up to ``deadline`` for all of them.
+        Returns the names that raised or were still running (those are killed)."""
+        jobs = {name: gevent.spawn(func) for name, func in calls.items()}
+        gevent.joinall(list(jobs.values()), timeout=deadline)
+        failed = []
+        for name, job in jobs.items():
+            if not job.ready():
+                log.warning("[shutdown] %s of %s missed its %ss deadline; abandoning it.", phase, name, deadline)
+                job.kill(block=False)
+                failed.append(name)
+            elif not job.successful():
+                log.error("[shutdown] %s of %s failed: %r", phase, name, job.exception)
+                failed.append(name)
+        return failed
+
+    def _force_unload(self, name):
+        plugin = self.bot.plugins.pop(name, None)
+        if plugin is None:
+            return
+        log.warning("[shutdown] Tearing down %s by force.", name)
+        for greenlet in list(plugin.greenlets):
+            greenlet.kill(block=False)
+        for schedule in plugin.schedules.values():
+            schedule.kill(block=False)
+        for listener in plugin.listeners:
+            listener.remove()
+
+    def run(self):
+        started = time.monotonic()
+        plugins = {name: plugin for name, plugin in self.bot.plugins.items() if name not in self.keep}
+
+        with self._phase("drain"):
+            self._parallel("drain", {name: plugin.drain for name, plugin in plugins.items()
+                                     if callable(getattr(plugin, "drain", None))}, DRAIN_DEADLINE)
+
+        with self._phase("flush"):
+            deadline = time.monotonic() + FLUSH_DEADLINE
+            if not post_scheduler.flush(FLUSH_DEADLINE):
+                log.warning("[shutdown] %d post(s) still unsent.", post_scheduler.pending())
+            if not write_behind.flush(max(0.1, deadline - time.monotonic())):
+                log.warning("[shutdown] %d database write(s) still uncommitted.", write_behind.pending())
+
+        with self._phase("unload"):
+            for name in self.keep:
+                plugin = self.bot.plugins.get(name)
+                for schedule in (plugin.schedules.values() if plugin else ()):
+                    schedule.kill(block=False)
+            for name in self._parallel("unload", {name: partial(self.bot.rmv_plugin, plugin.__class__)
+                                                  for name, plugin in plugins.items()}, UNLOAD_DEADLINE):
+                self._force_unload(name)
+            # Anything an unload queued (pickup's last roster/state writes) goes out before the close.
+            write_behind.flush(UNLOAD_DEADLINE)
+
+        with self._phase("close"):
+            metrics.stop()
+            http_client.close()
+            write_behind.close()
+            try:
+                sqlite_db.close()
+            except Exception:
+                log.exception("[shutdown] Failed to close the database connection.")
+
+        log.info("[shutdown] Done in %.2fs (%s).", time.monotonic() - started,
+                 ", ".join(f"{name} {elapsed:.2f}s" for name, elapsed in self.timings))
@@ -1,40 +1,112 @@
+import heapq
+import itertools
+import logging
+import time
 from datetime import datetime
 
 import gevent
+from gevent.event import Event
 
+from PunyBot.utils.metrics import metrics
 
-class Eventual(object):
+log = logging.getLogger(__name__)
+
+# How late each timer callback started versus its due time, per key namespace ("kaboom", "pickup", ...).
+TIMER_LAG_SECONDS = metrics.histogram("punybot_timer_lag_seconds", "Delay between a timer's due time and its callback "
+                                      "starting.", ("namespace",), buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60, 300))
+
+
+def _timestamp(when):
+    """Unix seconds for a datetime (naive = local time, like every DateTimeField in the DB) or a number."""
+    if isinstance(when, datetime):
+        return when.timestamp()
+    return float(when)
+
+
+class TimerScheduler(object):
     """
-    A function that will be triggered eventually.
+    Shared timer service: one greenlet sleeping on an in-memory min-heap of (due time, key, callback).
+
+    Timers are identified by a ``key`` - by convention ``(namespace, id)``, e.g. ``("kaboom",
+    message_id)`` - so any number of plugins can share the one scheduler. ``schedule`` both creates
+    and reschedules (O(log n)); ``cancel`` is O(1) (the heap entry is invalidated in place and
+    skipped when it surfaces). The runner sleeps exactly until the earliest due time and is woken
+    early whenever a sooner timer is added. Each callback runs on its own greenlet; an exception is
+    logged and doesn't affect other timers.
     """
 
-    def __init__(self, func):
-        self.func = func
-        self._next = None
-        self._t = None
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._wakeup = Event()
+        self._runner = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, when, callback, *args):
+        """Run ``callback(*args)`` at ``when`` (datetime or unix seconds; past = as soon as possible),
+        replacing any timer already scheduled under ``key``."""
+        self.cancel(key)
+        entry = [_timestamp(when), next(self._seq), key, callback, args]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+        if self._runner is None:
+            self._runner = gevent.spawn(self._run)
+
+    def cancel(self, key):
+        """Drop the timer for ``key``; True if there was one."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[3] = None
+        return True
+
+    def cancel_namespace(self, namespace):
+        """Drop every ``(namespace, ...)`` timer, e.g. when the owning plugin unloads."""
+        keys = [key for key in self._entries if isinstance(key, tuple) and key and key[0] == namespace]
+        for key in keys:
+            self.cancel(key)
+        return len(keys)
 
-    def wait(self, nxt):
-        def f():
-            wait_time = (self._next - datetime.now())
-            gevent.sleep(wait_time.seconds + (wait_time.microseconds / 1000000.0))
-            self._next = None
-            gevent.spawn(self.func)
+    def due(self, key):
+        """When ``key`` is due (as a datetime), or None if nothing is scheduled under it."""
+        entry = self._entries.get(key)
+        return None if entry is None else datetime.fromtimestamp(entry[0])
 
-        if self._t:
-            self._t.kill()
+    def _run(self):
+        heap = self._heap
+        while True:
+            while heap and heap[0][3] is None:
+                heapq.heappop(heap)
+            if not heap:
+                timeout = None
+            else:
+                timeout = heap[0][0] - time.time()
+                if timeout <= 0:
+                    due_at, _, key, callback, args = heapq.heappop(heap)
+                    del self._entries[key]
+                    gevent.spawn(self._fire, key, due_at, callback, args)
+                    continue
+            self._wakeup.clear()
+            self._wakeup.wait(timeout)
 
-        self._next = nxt
-        self._t = gevent.spawn(f)
+    @staticmethod
+    def _fire(key, due_at, callback, args):
+        namespace = key[0] if isinstance(key, tuple) and key else "other"
+        TIMER_LAG_SECONDS.observe(max(0.0, time.time() - due_at), namespace=namespace)
+        try:
+            callback(*args)
+        except Exception:
+            log.exception("Timer %r failed", key)
 
-    def trigger(self):
-        if self._t:
-            self._t.kill()
-        self._next = None
-        gevent.spawn(self.func)
 
-    def set_next_schedule(self, date):
-        if date < datetime.now():
-            return gevent.spawn(self.trigger)
+timers = TimerScheduler()
 
-        if not self._next or date < self._next:
-            self.wait(date)
+metrics.gauge("punybot_timers_pending", "Timers scheduled on the shared timer service.", fn=timers.__len__)
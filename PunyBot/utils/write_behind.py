@@ -0,0 +1,174 @@
+import copy
+import logging
+import time
+
+import gevent
+from gevent.event import AsyncResult, Event
+from gevent.threadpool import ThreadPool
+
+from PunyBot.database import sqlite_db
+from PunyBot.utils.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Most writes committed in one transaction. Anything queued beyond this goes in the next batch.
+MAX_BATCH = 500
+
+# How long a poller's crash-safety barrier waits on flush() (seconds). A writer stuck on a locked
+# database or a slow disk must not hang the poller: its writes stay queued, and the poll finishes.
+FLUSH_TIMEOUT = 5
+
+# Commit latencies (submit -> committed) kept for the stats percentiles.
+LATENCY_SAMPLES = 512
+
+
+class WriteBehind(object):
+    """
+    Write-behind persistence for the bot's SQLite database.
+
+    Writes are queued from any greenlet and return straight away. A committer greenlet hands
+    everything queued to one dedicated OS thread, which runs the whole batch in a single
+    transaction - one fsync for a burst of writes instead of one each, and none of it on the gevent
+    hub. Anything queued while a batch is committing goes out in the next one (group commit).
+
+    ``save``/``execute``/``submit`` return an ``AsyncResult`` for the write. ``flush()`` is the barrier
+    for crash-safety points: it returns once everything queued before it is committed. If a batch
+    fails, its writes are retried one transaction each so one bad write can't sink the rest.
+    """
+
+    def __init__(self, database, max_batch=MAX_BATCH):
+        self.database = database
+        self.max_batch = max_batch
+        self._queue = []
+        self._wakeup = Event()
+        self._committer = None
+        self._pool = ThreadPool(1)
+        self._in_flight = 0
+        self.peak_pending = 0
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+        self.largest_batch = 0
+        self.commit_seconds = 0.0
+        self._latencies = []
+
+    def submit(self, func, *args):
+        """Run ``func(*args)`` inside the next committed batch, on the writer thread."""
+        result = AsyncResult()
+        self._queue.append((func, args, result, time.monotonic()))
+        self.peak_pending = max(self.peak_pending, len(self._queue))
+        self._wakeup.set()
+        if self._committer is None:
+            self._committer = gevent.spawn(self._run)
+        return result
+
+    def execute(self, query):
+        """Queue a peewee write query (insert/update/delete) built by the caller."""
+        return self.submit(query.execute)
+
+    def save(self, instance, *fields):
+        """Queue an UPDATE of an existing row with its current values - only ``fields`` (names) if
+        given, else every column. Values are snapshotted now, so later changes to ``instance`` don't
+        leak into this write."""
+        model = type(instance)
+        columns = [model._meta.fields[name] for name in fields] if fields else [
+            field for field in model._meta.sorted_fields if field is not model._meta.primary_key]
+        data = {field: copy.deepcopy(getattr(instance, field.name)) for field in columns}
+        return self.execute(model.update(data).where(model._meta.primary_key == instance._pk))
+
+    def flush(self, timeout=None):
+        """Block (this greenlet) until every write queued so far is committed. True if it made it in time."""
+        barrier = self.submit(lambda: None)
+        try:
+            barrier.get(timeout=timeout)
+        except gevent.Timeout:
+            return False
+        return True
+
+    def pending(self):
+        return len(self._queue) + self._in_flight
+
+    def close(self):
+        """Close the writer thread's database connection (shutdown, after ``flush``). Skipped while a
+        batch is still committing - the writer thread is busy and would hold this up."""
+        if self._in_flight:
+            log.warning("Not closing the writer's database connection: a batch of %d is still committing.",
+                        self._in_flight)
+            return
+        try:
+            self._pool.apply(self.database.close)
+        except Exception:
+            log.exception("Closing the writer thread's database connection failed.")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+                self._in_flight = len(batch)
+                started = time.monotonic()
+                try:
+                    outcomes = self._pool.apply(self._commit, (batch,))
+                except Exception as e:
+                    outcomes = [e] * len(batch)
+                finally:
+                    self._in_flight = 0
+                done = time.monotonic()
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self.commit_seconds += done - started
+                for (_, _, result, queued_at), outcome in zip(batch, outcomes):
+                    self._latencies.append(done - queued_at)
+                    if isinstance(outcome, Exception):
+                        self.failed += 1
+                        result.set_exception(outcome)
+                    else:
+                        self.committed += 1
+                        result.set(outcome)
+                del self._latencies[:-LATENCY_SAMPLES]
+
+    def _commit(self, batch):
+        # Runs on the writer thread (peewee keeps a connection per thread).
+        try:
+            with self.database.atomic():
+                return [func(*args) for func, args, _, _ in batch]
+        except Exception:
+            log.warning("Write batch of %d failed; retrying its writes one at a time.", len(batch))
+        outcomes = []
+        for func, args, _, _ in batch:
+            try:
+                with self.database.atomic():
+                    outcomes.append(func(*args))
+            except Exception as e:
+                log.exception("Queued write %r failed.", func)
+                outcomes.append(e)
+        return outcomes
+
+    def stats(self):
+        """Queue depth (``pending``/``peak_pending``), batch counters, average commit time of a batch,
+        and submit -> committed latency over the most recent writes."""
+        latencies = sorted(self._latencies)
+        return {
+            "pending": self.pending(),
+            "peak_pending": self.peak_pending,
+            "batches": self.batches,
+            "committed": self.committed,
+            "failed": self.failed,
+            "largest_batch": self.largest_batch,
+            "avg_batch": round(self.committed / self.batches, 1) if self.batches else 0,
+            "avg_commit_ms": round(self.commit_seconds / self.batches * 1000, 2) if self.batches else 0,
+            "p50_latency_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else 0,
+            "max_latency_ms": round(latencies[-1] * 1000, 2) if latencies else 0,
+        }
+
+
+write_behind = WriteBehind(sqlite_db)
+
+metrics.gauge("punybot_db_writes_pending", "Writes queued or committing in the write-behind queue.",
+              fn=write_behind.pending)
+metrics.counter("punybot_db_writes_total", "Write-behind writes, by outcome.", ("outcome",),
+                fn=lambda: {"committed": write_behind.committed, "failed": write_behind.failed})
+metrics.counter("punybot_db_batches_total", "Write-behind batches committed.", fn=lambda: write_behind.batches)
+metrics.counter("punybot_db_commit_seconds_total", "Time spent committing write-behind batches.",
+                fn=lambda: write_behind.commit_seconds)
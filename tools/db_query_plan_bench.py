@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""EXPLAIN QUERY PLAN check + benchmark for the bot's hot SQLite queries.
+
+Builds a throwaway database with the REAL models and migrations (PunyBot/models, PunyBot/database.py's
+run_migrations), fills the timer and pickup tables with synthetic rows (100k each by default - mostly
+ended games, ~1% active; kaboom expiries up to three days out, ~1% overdue; a few players per game),
+then for every query in PunyBot.models.migrations.hot_queries():
+
+  * prints its EXPLAIN QUERY PLAN and, unless it is a deliberate whole-table read, checks it uses an
+    index (no full table scan, no temp b-tree sort),
+  * times it with the migration indexes in place, and again after dropping them for comparison.
+
+Nothing touches data/database.db: the database module is pointed at a temp directory.
+
+Run:  python tools/db_query_plan_bench.py [rows] [repeats]
+Exit: 0 if every hot query that needs an index uses one; non-zero otherwise.
+"""
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime, timedelta
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# PunyBot/__init__ loads the bot config (and disco); the models only need PunyBot.database, which opens
+# <cwd>/data/database.db - so import the package without its __init__, from inside a temp directory.
+_punybot = types.ModuleType("PunyBot")
+_punybot.__path__ = [os.path.join(REPO, "PunyBot")]
+sys.modules["PunyBot"] = _punybot
+
+WORKDIR = tempfile.mkdtemp(prefix="punybot-qplan-")
+os.makedirs(os.path.join(WORKDIR, "data"))
+os.chdir(WORKDIR)
+
+from PunyBot.database import sqlite_db  # noqa: E402
+from PunyBot.models import PickupGame, PickupPlayer  # noqa: E402  (runs the migrations)
+from PunyBot.models.kaboom import KaboomMessage  # noqa: E402
+from PunyBot.models.migrations import MIGRATIONS, hot_queries, query_plan, uses_index  # noqa: E402
+
+CHUNK = 500
+
+
+def fill(rows, seed=1):
+    rng = random.Random(seed)
+    now = datetime.now()
+    games = []
+    for i in range(1, rows + 1):
+        active = rng.random() < 0.01
+        start = now - timedelta(seconds=rng.randint(0, 90 * 86400)) if not active else now
+        games.append({
+            "id": i, "guild_id": 1, "host_id": rng.randint(1, rows // 5), "region": "NA",
+            "chat_channel_id": 10 ** 15 + i, "start_datetime": start,
+            "end_time": start + timedelta(hours=1), "next_action_time": start + timedelta(minutes=30),
+            "action_type": 0, "active_game_message_id": 2 * 10 ** 15 + i, "control_message_id": 3 * 10 ** 15 + i,
+            "extra_info": {"server": {}}, "active": active, "config_key": "dystopia",
+        })
+    kabooms = [{"message_id": 4 * 10 ** 15 + i, "channel_id": 10 ** 6 + i % 50,
+                "expire_time": now + timedelta(seconds=rng.randint(-3600, 0) if rng.random() < 0.01
+                                               else rng.randint(60, 3 * 86400))} for i in range(rows)]
+    players = set()
+    while len(players) < rows:
+        players.add((rng.randint(1, rows), rng.randint(1, rows // 5)))
+    roster = [{"game_id": g, "user_id": u, "joined_at": now} for g, u in players]
+
+    with sqlite_db.atomic():
+        for model, data in ((PickupGame, games), (KaboomMessage, kabooms), (PickupPlayer, roster)):
+            for i in range(0, len(data), CHUNK):
+                model.insert_many(data[i:i + CHUNK]).execute()
+    sqlite_db.execute_sql("ANALYZE")
+
+
+def time_query(query, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        list(query.clone().tuples())
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def migration_indexes():
+    names = []
+    for _, _, apply in MIGRATIONS:
+        if not callable(apply):
+            names += [m.group(1) for m in (re.search(r'INDEX IF NOT EXISTS "([^"]+)"', s) for s in apply) if m]
+    return names
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 100000
+    repeats = int(argv[2]) if len(argv) > 2 else 20
+    print("== schema version %d, filling %d rows per table in %s ==" % (
+        sqlite_db.pragma("user_version"), rows, WORKDIR))
+    started = time.perf_counter()
+    fill(rows)
+    print("  filled in %.1fs" % (time.perf_counter() - started))
+
+    queries = hot_queries()
+    report = {}
+    failed = []
+    for name, (query, needs_index) in queries.items():
+        plan = query_plan(query)
+        ok = uses_index(plan)
+        report[name] = {"plan": plan, "uses_index": ok, "indexed_ms": round(time_query(query, repeats), 3)}
+        print("  %-20s %-4s %8.3f ms  %s" % (name, "ok" if ok else "SCAN" if needs_index else "full",
+                                             report[name]["indexed_ms"], " | ".join(plan)))
+        if needs_index and not ok:
+            failed.append(name)
+
+    for index in migration_indexes():
+        sqlite_db.execute_sql('DROP INDEX IF EXISTS "%s"' % index)
+    print("== without the migration indexes ==")
+    for name, (query, _) in queries.items():
+        report[name]["unindexed_ms"] = round(time_query(query, repeats), 3)
+        report[name]["speedup"] = round(report[name]["unindexed_ms"] / max(report[name]["indexed_ms"], 1e-6), 1)
+        print("  %-20s %8.3f ms  (x%.1f)" % (name, report[name]["unindexed_ms"], report[name]["speedup"]))
+
+    print(json.dumps({"rows": rows, "repeats": repeats, "queries": report}, indent=2))
+    if failed:
+        print("FAIL: no index for %s" % ", ".join(failed))
+        return 1
+    print("PASS: every hot query that needs an index uses one.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -62,6 +62,7 @@ class _Cfg(object):
     token = TOKEN
     channel_id = 111111111111111111
     poll_seconds = 60
+    task_limit = 300
 
 
 _punybot = types.ModuleType("PunyBot")
@@ -69,6 +70,49 @@ _punybot.CONFIG = types.SimpleNamespace(dystopia_build=_Cfg())
 sys.modules["PunyBot"] = _punybot
 
 
+# --- real: PunyBot.utils.http_pool (the shared keep-alive client the poller fetches through) -------
+def _load_real(name, *path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO, *path))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+sys.modules["PunyBot.utils"] = types.ModuleType("PunyBot.utils")
+_load_real("PunyBot.utils.metrics", "PunyBot", "utils", "metrics.py")
+_load_real("PunyBot.utils.http_pool", "PunyBot", "utils", "http_pool.py")
+
+
+# --- stub: PunyBot.utils.post_scheduler (posts inline; nothing to rate-limit offline) ---------------
+class _InlineScheduler(object):
+    def send(self, api, channel_id, **kwargs):
+        return api.channels_messages_create(channel_id, **kwargs)
+
+
+_post_scheduler = types.ModuleType("PunyBot.utils.post_scheduler")
+_post_scheduler.post_scheduler = _InlineScheduler()
+sys.modules["PunyBot.utils.post_scheduler"] = _post_scheduler
+
+
+# --- stub: PunyBot.utils.write_behind (writes inline; no writer thread offline) ---------------------
+class _InlineWrites(object):
+    def save(self, instance, *fields):
+        instance.save()
+
+    def execute(self, query):
+        return query.execute()
+
+    def flush(self, timeout=None):
+        return True
+
+
+_write_behind = types.ModuleType("PunyBot.utils.write_behind")
+_write_behind.FLUSH_TIMEOUT = 5
+_write_behind.write_behind = _InlineWrites()
+sys.modules["PunyBot.utils.write_behind"] = _write_behind
+
+
 # --- stub: PunyBot.models.DystopiaBuildCache (in-memory) --------------------------------------------
 class _Col(object):
     def __eq__(self, other):
@@ -114,7 +158,7 @@ class _FakeApi(object):
     def __init__(self):
         self.posts = []
 
-    def channels_messages_create(self, channel_id, content):
+    def channels_messages_create(self, channel_id, content, **k):
         self.posts.append((channel_id, content))
         return {"id": len(self.posts)}
 
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""Offline replay benchmark for the Dystopia feed pipeline.
+
+Runs the REAL plugin code (PunyBot/plugins/dystopia.py) - poll_feed -> _drain_and_post -> _chunk ->
+flush_kills / flush_chat - against a local stand-in for ``GET /api/feed/events`` served over real HTTP
+(through the real shared client, PunyBot/utils/http_pool.py), with the disco framework, gevent, config,
+DB and Discord client stubbed the same way as tools/dystopia_feed_selfcheck.py. Nothing touches
+dystopia-stats.com or Discord; posts go out inline and the post scheduler's rate limiting is modelled
+(``post_seconds``), not slept.
+
+Synthetic traffic comes from tools/dystopia_feed_loadgen.py (its FakeFeed is the stand-in server);
+``--scale`` multiplies it. Scenarios (each on a fresh plugin instance):
+
+* ``steady``     - a few live servers, polled tick by tick with the batch flush timers firing
+* ``backfill``   - first run against 2 days of history (one long drain + the backlog summary)
+* ``kill_storm`` - a handful of live rounds with a very high kill rate
+* ``chat_flood`` - live rounds where chat spam dominates (exercises the per-flush chat cap)
+* ``replay``     - recorded events from ``--replay FILE`` (a saved feed response, or a bare list)
+
+Per scenario it reports end-to-end drain time, formatting throughput (_format / _format_kill /
+_format_chat), chunking throughput (_chunk), peak traced memory, and the simulated Discord message /
+thread count, as one JSON document - diff two runs to catch a regression before deploying.
+
+Run:  python tools/dystopia_feed_bench.py [--scenario NAME ...] [--replay FILE] [--scale N] [--out FILE] [--no-mem]
+Exit: 0 if every scenario drains to caught-up without an exception; non-zero otherwise.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+from dystopia_feed_loadgen import FakeFeed, LoadProfile, cursor_key, generate
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(REPO, "PunyBot", "plugins", "dystopia.py")
+
+logging.basicConfig(level=logging.WARNING, format="  %(levelname)s %(message)s")
+
+
+# --- stub: disco.bot.Plugin -----------------------------------------------------------------------
+class _StubPlugin(object):
+    def __init__(self):
+        self._pre = {}
+        self._post = {}
+        self.commands = {}
+        self.listeners = []
+        self.schedules = {}
+        self.log = logging.getLogger("dystopia")
+
+    @staticmethod
+    def listen(*events, **k):
+        return lambda func: func  # gateway listeners are never fired here
+
+    def register_schedule(self, func, interval, *a, **k):
+        self.schedules[func.__name__] = interval  # captured, not run; the harness drives the ticks
+
+    def load(self, ctx):
+        pass
+
+    def unload(self, ctx):
+        pass
+
+
+def _module(name, **attrs):
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attrs)
+    sys.modules[name] = mod
+    return mod
+
+
+_module("disco")
+_module("disco.bot", Plugin=_StubPlugin)
+
+
+# --- stub: gevent (no sleeping; the drain's prefetch runs inline) ---------------------------------
+class _SyncGreenlet(object):
+    def __init__(self, func, *args, **kwargs):
+        self._value = func(*args, **kwargs)
+
+    def get(self):
+        return self._value
+
+    def kill(self, *a, **k):
+        pass
+
+
+_module("gevent", sleep=lambda *a, **k: None, spawn=_SyncGreenlet)
+
+
+# --- stub: PunyBot.CONFIG / constants / models; real: PunyBot.utils.http_pool ---------------------
+class _Cfg(object):
+    feed_url = None  # set per run to the local stand-in server
+    channel_id = 111111111111111111
+    guild_id = 222222222222222222
+    poll_seconds = 20
+    post_kills = True
+    post_chat = True
+    kill_batch_seconds = 90
+    chat_batch_seconds = 20
+    thread_per_round = True
+    backfill_days = 2
+    backfill_max_posts = 50
+    server_channels = {}
+    reset_cursor = False
+
+
+CFG = _Cfg()
+_module("PunyBot", CONFIG=types.SimpleNamespace(dystopia=CFG))
+_module("PunyBot.constants", Messages=object())  # no dystopia_ attrs -> the built-in templates
+
+
+class _Col(object):
+    def __eq__(self, other):
+        return True
+
+
+class _Cache(object):
+    """In-memory DystopiaFeedCache (get_or_none / create / save / delete().where().execute())."""
+    _rows = {}
+    feed_url = _Col()
+
+    def __init__(self, feed_url, last_cursor):
+        self.feed_url, self.last_cursor = feed_url, last_cursor
+
+    @classmethod
+    def get_or_none(cls, feed_url):
+        return cls._rows.get(feed_url)
+
+    @classmethod
+    def create(cls, feed_url, last_cursor):
+        row = cls._rows[feed_url] = cls(feed_url, last_cursor)
+        return row
+
+    def save(self):
+        _Cache._rows[self.feed_url] = self
+
+    @classmethod
+    def delete(cls):
+        class _Q(object):
+            def where(self, *a, **k):
+                return self
+
+            def execute(self):
+                n = len(cls._rows)
+                cls._rows.clear()
+                return n
+        return _Q()
+
+
+_module("PunyBot.models", DystopiaFeedCache=_Cache)
+_module("PunyBot.utils")
+
+
+def _load_real(name, *path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO, *path))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_load_real("PunyBot.utils.metrics", "PunyBot", "utils", "metrics.py")
+http_pool = _load_real("PunyBot.utils.http_pool", "PunyBot", "utils", "http_pool.py")
+
+
+# --- stub: PunyBot.utils.post_scheduler (posts inline; per-channel rate limits modelled, not slept) --
+class _Done(object):
+    """An already-finished AsyncResult: the call ran at submit time."""
+    def __init__(self, func, *args, **kwargs):
+        self._value = self._error = None
+        try:
+            self._value = func(*args, **kwargs)
+        except Exception as e:
+            self._error = e
+
+    def get(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class _VirtualScheduler(object):
+    """Posts inline and tallies messages per channel, so a run can report how long the real
+    scheduler's per-channel buckets (channels in parallel) would need to send them all."""
+    capacity, period = 5, 5.0  # PunyBot.utils.post_scheduler DEFAULT_CAPACITY / DEFAULT_PERIOD
+
+    def __init__(self):
+        self.per_channel = {}
+
+    def submit(self, api, channel_id, **kwargs):
+        self.per_channel[channel_id] = self.per_channel.get(channel_id, 0) + 1
+        return _Done(api.channels_messages_create, channel_id, **kwargs)
+
+    def send(self, api, channel_id, timeout=None, **kwargs):
+        return self.submit(api, channel_id, **kwargs).get()
+
+    @staticmethod
+    def wait(result, timeout=None):
+        return result.get()
+
+    def post_seconds(self):
+        return max((max(0, n - self.capacity) * self.period / self.capacity for n in self.per_channel.values()),
+                   default=0.0)
+
+
+SCHEDULER = _VirtualScheduler()
+_module("PunyBot.utils.post_scheduler", post_scheduler=SCHEDULER)
+
+
+# --- stub: PunyBot.utils.write_behind (writes inline; no writer thread offline) ---------------------
+class _InlineWrites(object):
+    def save(self, instance, *fields):
+        instance.save()
+
+    def execute(self, query):
+        return query.execute()
+
+    def flush(self, timeout=None):
+        return True
+
+
+_module("PunyBot.utils.write_behind", FLUSH_TIMEOUT=5, write_behind=_InlineWrites())
+
+
+# --- fake Discord: counts messages and threads, plus a guild with the dys_ weapon emojis -----------
+class _Obj(object):
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class _Emoji(object):
+    def __init__(self, emoji_id, name):
+        self.id, self.name = emoji_id, name
+
+    def __str__(self):
+        return "<:{}:{}>".format(self.name, self.id)
+
+
+class _FakeApi(object):
+    def __init__(self):
+        self.messages = 0
+        self.threads = 0
+        self.chars = 0
+
+    def channels_messages_create(self, channel_id, content=None, **k):
+        self.messages += 1
+        self.chars += len(content or "")
+        return _Obj(id=self.messages)
+
+    def channels_messages_threads_create(self, channel_id, message_id, name, **k):
+        self.threads += 1
+        return _Obj(id=900000000000000000 + self.threads)
+
+
+def _emoji_state():
+    shorts = ["katana", "phist", "machp", "shotgun", "ar", "minigun", "laser", "mk808", "ion",
+              "smartlocks", "tesla", "basilisk", "boltgun", "gl", "rl", "emp", "frag", "spider"]
+    emojis = {i: _Emoji(700000000000000000 + i, "dys_" + s) for i, s in enumerate(shorts)}
+    return _Obj(guilds={CFG.guild_id: _Obj(id=CFG.guild_id, emojis=emojis)})
+
+
+# --- recorded events ------------------------------------------------------------------------------
+def load_replay(path):
+    with open(path) as fh:
+        data = json.load(fh)
+    events = data.get("events", []) if isinstance(data, dict) else data
+    return sorted(events, key=lambda e: cursor_key(e["cursor"]))
+
+
+# --- scenarios (synthetic traffic from tools/dystopia_feed_loadgen.py, x --scale) ------------------
+def _ticks_live(events, poll_seconds):
+    """Group live events into per-poll batches by their cursor timestamp."""
+    if not events:
+        return []
+    first = cursor_key(events[0]["cursor"])[0]
+    ticks = {}
+    for e in events:
+        ticks.setdefault((cursor_key(e["cursor"])[0] - first) // poll_seconds, []).append(e)
+    return [ticks.get(i, []) for i in range(max(ticks) + 1)]
+
+
+def scenario_steady(now, scale):
+    # ~15 minutes of live play on 4 servers, fed to the poller one poll interval at a time.
+    profile = LoadProfile(servers=4, rounds_per_hour=6, kills_per_round=60, chat_per_minute=3).scaled(scale)
+    events = generate(now - 900, 900, profile, seed=11)
+    return {"history": [], "ticks": _ticks_live(events, CFG.poll_seconds), "resume": True}
+
+
+def scenario_backfill(now, scale):
+    # A true first run: 2 days of history on 6 servers, drained in one poll.
+    span = CFG.backfill_days * 86400
+    profile = LoadProfile(servers=6, rounds_per_hour=3, kills_per_round=45, chat_per_minute=0.5).scaled(scale)
+    events = generate(now - span + 60, span - 120, profile, seed=22)
+    return {"history": events, "ticks": [[]], "resume": False}
+
+
+def scenario_kill_storm(now, scale):
+    # 3 live servers, 90 s rounds with a very high kill rate, arriving in one burst.
+    profile = LoadProfile(servers=3, rounds_per_hour=30, kills_per_round=400, chat_per_minute=0,
+                          captures_per_round=0).scaled(scale)
+    return {"history": [], "ticks": [generate(now - 240, 240, profile, seed=33)], "resume": True}
+
+
+def scenario_chat_flood(now, scale):
+    # 2 live servers where chat spam (5 lines/s each) dwarfs everything else.
+    profile = LoadProfile(servers=2, rounds_per_hour=24, kills_per_round=10, chat_per_minute=300).scaled(scale)
+    return {"history": [], "ticks": [generate(now - 240, 240, profile, seed=44)], "resume": True}
+
+
+SCENARIOS = {
+    "steady": scenario_steady,
+    "backfill": scenario_backfill,
+    "kill_storm": scenario_kill_storm,
+    "chat_flood": scenario_chat_flood,
+}
+
+
+# --- instrumentation ------------------------------------------------------------------------------
+class _Timer(object):
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.calls += 1
+        return timed
+
+    def wrap_gen(self, func):
+        def timed(entries):
+            self.calls += 1
+            self.items += len(entries)
+            it = func(entries)
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    self.seconds += time.perf_counter() - started
+                yield item
+        return timed
+
+    def rate(self, count):
+        return round(count / self.seconds, 1) if self.seconds else None
+
+
+def run_scenario(mod, spec):
+    """Drive one scenario on a fresh plugin + feed; returns its metrics dict."""
+    feed = FakeFeed(spec["history"])
+    server, base_url = feed.serve()
+    CFG.feed_url = base_url
+    _Cache._rows.clear()
+    SCHEDULER.per_channel.clear()
+    try:
+        plugin = mod.DystopiaPlugin()
+        plugin.load(ctx=None)
+        api = _FakeApi()
+        plugin.bot = _Obj(client=_Obj(api=api))
+        plugin.state = _emoji_state()
+
+        fmt, chunk = _Timer(), _Timer()
+        for name in ("_format", "_format_kill", "_format_chat"):
+            setattr(plugin, name, fmt.wrap(getattr(plugin, name)))
+        plugin._chunk = chunk.wrap_gen(plugin._chunk)
+
+        if spec["resume"]:
+            # Live scenarios resume from "just before the first event", not a cold 2-day backfill.
+            first = spec["ticks"][0][0]["cursor"] if spec["ticks"] and spec["ticks"][0] else None
+            since = "{:011d}:0".format(cursor_key(first)[0] - 1) if first else "{:011d}:0".format(int(time.time()))
+            _Cache.create(feed_url=plugin.feed_url, last_cursor=since)
+
+        polls = 0
+        drain_s = 0.0
+        kill_every = max(1, CFG.kill_batch_seconds // CFG.poll_seconds)
+        chat_every = max(1, CFG.chat_batch_seconds // CFG.poll_seconds)
+        for tick, batch in enumerate(spec["ticks"], 1):
+            feed.extend(batch)
+            started = time.perf_counter()
+            plugin.poll_feed()
+            if tick % kill_every == 0:
+                plugin.flush_kills()
+            if tick % chat_every == 0:
+                plugin.flush_chat()
+            drain_s += time.perf_counter() - started
+            polls += 1
+        started = time.perf_counter()
+        plugin.unload(ctx=None)  # flushes whatever is still buffered, like a redeploy
+        drain_s += time.perf_counter() - started
+
+        events, requests = len(feed), feed.requests
+        cursor = _Cache._rows[plugin.feed_url].last_cursor
+        caught_up = not feed.page(cursor, 1, True)["events"]
+        return {
+            "events": events,
+            "polls": polls,
+            "feed_requests": requests,
+            "caught_up": caught_up,
+            "drain_seconds": round(drain_s, 4),
+            "events_per_sec": round(events / drain_s, 1) if drain_s else None,
+            "format": {"calls": fmt.calls, "seconds": round(fmt.seconds, 4), "per_sec": fmt.rate(fmt.calls)},
+            "chunk": {"lines": chunk.items, "seconds": round(chunk.seconds, 4),
+                      "lines_per_sec": chunk.rate(chunk.items)},
+            "discord": {"messages": api.messages, "threads": api.threads, "chars": api.chars},
+            # Wall time the real bot needs to get these posts out under Discord's per-channel limits if they
+            # were all queued at once
+            # (the old fixed 0.4 s spacing would have been 0.4 * messages).
+            "post_seconds": round(SCHEDULER.post_seconds(), 1),
+            "channels": len(SCHEDULER.per_channel),
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def measure_peak(mod, spec):
+    """Peak traced allocation (KiB) for one scenario run; a separate pass so tracing doesn't skew timings."""
+    tracemalloc.start()
+    try:
+        run_scenario(mod, spec)
+        return round(tracemalloc.get_traced_memory()[1] / 1024.0, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS) + ["replay"],
+                        help="scenario(s) to run (default: all synthetic ones, plus replay with --replay)")
+    parser.add_argument("--replay", help="recorded feed events (JSON response or list) to replay as a backfill")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the synthetic traffic (e.g. 10, 100)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--no-mem", action="store_true", help="skip the tracemalloc peak-memory pass")
+    args = parser.parse_args(argv[1:])
+
+    spec = importlib.util.spec_from_file_location("dystopia_real", PLUGIN)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+
+    names = args.scenario or sorted(SCENARIOS) + (["replay"] if args.replay else [])
+    now = int(time.time())
+    report = {"generated_at": now, "python": sys.version.split()[0], "scale": args.scale, "scenarios": {}}
+    ok = True
+    for name in names:
+        if name == "replay":
+            if not args.replay:
+                parser.error("--scenario replay needs --replay FILE")
+            spec_ = {"history": load_replay(args.replay), "ticks": [[]], "resume": False}
+        else:
+            spec_ = SCENARIOS[name](now, args.scale)
+        result = run_scenario(mod, spec_)
+        if not args.no_mem:
+            result["peak_kib"] = measure_peak(mod, spec_)
+        ok = ok and result["caught_up"]
+        report["scenarios"][name] = result
+        print("  %-10s %7d events  %8.3fs  %6d msgs  %s" % (
+            name, result["events"], result["drain_seconds"], result["discord"]["messages"],
+            "ok" if result["caught_up"] else "NOT CAUGHT UP"), file=sys.stderr)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    http_pool.http_client.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
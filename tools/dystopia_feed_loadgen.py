@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Synthetic load generator for the Dystopia stats feed.
+
+Produces a realistic ``/api/feed/events`` event mix - many servers interleaving back-to-back rounds,
+kills arriving in bursts (a 15-kill teamfight, not a steady drip), chat spam, objective captures and
+round starts that open per-round threads - with the feed's ``<zero-padded-unix>:<id>`` cursors, and
+serves it from a local fake ``GET /api/feed/events`` with the real paging contract (``since`` /
+``limit`` / ``include=chat``). Point ``dystopia.feed_url`` at it to profile ``DystopiaPlugin`` at 10-100x
+today's traffic without touching dystopia-stats.com.
+
+As a module (tools/dystopia_feed_bench.py uses it this way)::
+
+    profile = LoadProfile(servers=12, rounds_per_hour=4, kills_per_round=120).scaled(10)
+    events = generate(start_ts, 3600, profile)
+    feed = FakeFeed(events)
+    server, base_url = feed.serve()
+
+From the command line::
+
+    python tools/dystopia_feed_loadgen.py --servers 12 --hours 2 --scale 10 --port 8765 [--live]
+    python tools/dystopia_feed_loadgen.py --hours 48 --dump events.json
+
+``--live`` generates the history up to now plus ``--hours`` ahead, and only serves events whose
+timestamp has passed, so a bot polling it sees traffic arrive in real time.
+"""
+import argparse
+import bisect
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# The real API caps `limit` at 200 and defaults it to 100.
+FEED_LIMIT_MAX = 200
+FEED_LIMIT_DEFAULT = 100
+
+# Zero-pad width of the seconds half of a cursor; must match the stats API (and CURSOR_TS_PAD in the
+# plugin) so cursors compare correctly as strings.
+CURSOR_TS_PAD = 11
+
+# Gap between one round's end and the next round's start on the same server.
+INTERMISSION_SECONDS = 30
+
+MAPS = ["dys_vaccine", "dys_silo", "dys_fortress", "dys_detonate", "dys_escape", "dys_broadcast",
+        "dys_assimilate", "dys_undertow"]
+# Display names as the live feed sends them; a few have no dys_ emoji on purpose (plain-text fallback).
+WEAPONS = ["MK-808 Rifle", "Assault Rifle", "Laser Rifle", "Tesla Rifle", "Minigun", "Machine Pistol",
+           "Smartlock Pistols", "Shotgun", "Ion Cannon", "Basilisk", "Bolt Gun", "Rocket Launcher",
+           "Grenade Launcher", "Frag Grenade", "EMP Grenade", "Spider Grenade", "Katana (Light)",
+           "Katana (Medium)", "Katana (Heavy)", "Power Fist", "Cortex Bomb", "Leg Boosters", None]
+# Includes the hostile cases the chat sanitizer exists for (mentions, masked links, markdown).
+CHAT_LINES = ["gg", "gg wp", "nice shot", "rush B", "lag", "one more round", "who has the cortex?",
+              "@everyone get in here", "<@123456789012345678> revive me", "[free skins](http://x.example)",
+              "**EZ**", "_so_ ~~close~~", "`rm -rf`", "|| spoiler ||", "defend the terminal!!!"]
+
+
+class LoadProfile(object):
+    """
+    The shape of the generated traffic. Rates are per server: ``rounds_per_hour`` back-to-back rounds,
+    ``kills_per_round`` kills arriving in bursts of about ``burst_size`` within ``burst_seconds``,
+    ``chat_per_minute`` chat lines (Poisson), and ``captures_per_round`` objective captures.
+    """
+
+    def __init__(self, servers=6, rounds_per_hour=4, kills_per_round=90, chat_per_minute=3.0,
+                 captures_per_round=3, burst_size=15, burst_seconds=8, players=96):
+        self.servers = servers
+        self.rounds_per_hour = rounds_per_hour
+        self.kills_per_round = kills_per_round
+        self.chat_per_minute = chat_per_minute
+        self.captures_per_round = captures_per_round
+        self.burst_size = burst_size
+        self.burst_seconds = burst_seconds
+        self.players = players
+
+    def scaled(self, factor):
+        """This profile at ``factor`` x the traffic: more servers (and players to fill them), same
+        per-round shape, so the result looks like a busier weekend rather than a faster game."""
+        out = LoadProfile(**self.__dict__)
+        out.servers = max(1, int(round(self.servers * factor)))
+        out.players = max(self.players, int(round(self.players * factor)))
+        return out
+
+    def __repr__(self):
+        return "<LoadProfile {}>".format(" ".join("{}={}".format(k, v) for k, v in sorted(self.__dict__.items())))
+
+
+def cursor_for(ts, event_id):
+    return "{ts:0{pad}d}:{id}".format(ts=ts, pad=CURSOR_TS_PAD, id=event_id)
+
+
+def cursor_key(cursor):
+    """Sort key for a cursor: (unix seconds, id) - ids aren't zero-padded, so never compare raw strings."""
+    ts, _, eid = str(cursor).partition(":")
+    return int(ts or 0), int(eid or 0)
+
+
+def _round_events(rng, base, start, end, profile, players):
+    out = [(start, dict(base, kind="round_start"))]
+    span = max(1, end - start)
+    left = profile.kills_per_round
+    while left > 0:
+        size = min(left, max(1, int(rng.gauss(profile.burst_size, profile.burst_size / 3.0))))
+        at = rng.randrange(start, end)
+        for _ in range(size):
+            ts = min(end - 1, at + rng.randrange(max(1, profile.burst_seconds)))
+            out.append((ts, dict(base, kind="kill", actor=rng.choice(players), victim=rng.choice(players),
+                                 weapon=rng.choice(WEAPONS))))
+        left -= size
+    for i in range(profile.captures_per_round):
+        out.append((start + span * (i + 1) // (profile.captures_per_round + 1),
+                    dict(base, kind="capture", actor=rng.choice(players), objective="Objective {}".format(i + 1))))
+    out.append((end, dict(base, kind="round_end", winningTeam=rng.choice((2, 3)))))
+    return out
+
+
+def generate(start_ts, duration, profile=None, seed=1, first_id=1, first_round_id=2000000001):
+    """Every feed event in [start_ts, start_ts + duration) for ``profile``, in cursor order, with ids
+    and cursors assigned. Servers start their first round at staggered offsets so rounds interleave."""
+    profile = profile or LoadProfile()
+    rng = random.Random(seed)
+    players = [{"name": "Player_{}".format(i), "communityId": str(76561198000000000 + i)}
+               for i in range(profile.players)]
+    round_seconds = max(60, int(3600 / max(profile.rounds_per_hour, 0.01)) - INTERMISSION_SECONDS)
+    stop = start_ts + duration
+    raw = []
+    round_id = first_round_id
+    for server_id in range(201, 201 + profile.servers):
+        server = {"serverId": server_id, "serverName": "Puny Public #{}".format(server_id - 200)}
+        t = start_ts + rng.randrange(round_seconds + INTERMISSION_SECONDS)
+        while t < stop:
+            end = t + round_seconds
+            base = dict(server, roundId=round_id, mapName=rng.choice(MAPS))
+            raw.extend(pair for pair in _round_events(rng, base, t, end, profile, players) if pair[0] < stop)
+            if profile.chat_per_minute > 0:
+                at = t + rng.expovariate(profile.chat_per_minute / 60.0)
+                while at < min(end + INTERMISSION_SECONDS, stop):
+                    raw.append((int(at), dict(base, kind="chat", actor=rng.choice(players),
+                                              text=rng.choice(CHAT_LINES))))
+                    at += rng.expovariate(profile.chat_per_minute / 60.0)
+            round_id += 1
+            t = end + INTERMISSION_SECONDS
+    raw.sort(key=lambda pair: pair[0])
+    events = []
+    for event_id, (ts, e) in enumerate(raw, first_id):
+        e["id"] = event_id
+        e["cursor"] = cursor_for(ts, event_id)
+        events.append(e)
+    return events
+
+
+class FakeFeed(object):
+    """
+    In-memory ``/api/feed/events`` with the real paging contract: events strictly after ``since`` in
+    cursor order, at most ``limit`` (capped at FEED_LIMIT_MAX) per page, ``kind:"chat"`` only with
+    ``include=chat``, and a response cursor equal to the last returned event's (an empty page echoes
+    ``since``). With ``clock`` set, only events whose timestamp is <= ``clock()`` are visible.
+    """
+
+    def __init__(self, events=None, clock=None):
+        self._keys = []
+        self._events = []
+        self.clock = clock
+        self.requests = 0
+        if events:
+            self.extend(events)
+
+    def __len__(self):
+        return len(self._events)
+
+    def extend(self, events):
+        """Add events (any order); appending newer-than-everything events stays O(1) each."""
+        for e in events:
+            key = cursor_key(e["cursor"])
+            if not self._keys or key > self._keys[-1]:
+                self._keys.append(key)
+                self._events.append(e)
+            else:
+                idx = bisect.bisect_right(self._keys, key)
+                self._keys.insert(idx, key)
+                self._events.insert(idx, e)
+
+    def page(self, since=None, limit=FEED_LIMIT_DEFAULT, include_chat=False):
+        self.requests += 1
+        limit = max(1, min(int(limit), FEED_LIMIT_MAX))
+        horizon = self.clock() if self.clock else None
+        idx = bisect.bisect_right(self._keys, cursor_key(since)) if since else 0
+        out = []
+        while idx < len(self._events) and len(out) < limit:
+            if horizon is not None and self._keys[idx][0] > horizon:
+                break
+            e = self._events[idx]
+            idx += 1
+            if e["kind"] == "chat" and not include_chat:
+                continue
+            out.append(e)
+        return {"events": out, "cursor": out[-1]["cursor"] if out else since}
+
+    def serve(self, host="127.0.0.1", port=0):
+        """Serve on a background thread; returns (server, base_url). ``port=0`` picks a free port."""
+        feed = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if parts.path != "/api/feed/events":
+                    self.send_error(404)
+                    return
+                q = parse_qs(parts.query)
+                try:
+                    limit = int(q.get("limit", [FEED_LIMIT_DEFAULT])[0])
+                except ValueError:
+                    self.send_error(400, "bad limit")
+                    return
+                include_chat = "chat" in q.get("include", [""])[0].split(",")
+                body = json.dumps(feed.page(q.get("since", [None])[0], limit, include_chat)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *a):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, "http://{}:{}".format(host, server.server_address[1])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", type=int, default=6)
+    parser.add_argument("--rounds-per-hour", type=float, default=4)
+    parser.add_argument("--kills-per-round", type=int, default=90)
+    parser.add_argument("--chat-per-minute", type=float, default=3.0)
+    parser.add_argument("--burst-size", type=int, default=15)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the traffic (servers + players)")
+    parser.add_argument("--hours", type=float, default=2.0, help="hours of history (or of future, with --live)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--live", action="store_true", help="release events in real time instead of all at once")
+    parser.add_argument("--dump", help="write the generated events as a feed response JSON and exit")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv[1:])
+
+    profile = LoadProfile(servers=args.servers, rounds_per_hour=args.rounds_per_hour,
+                          kills_per_round=args.kills_per_round, chat_per_minute=args.chat_per_minute,
+                          burst_size=args.burst_size).scaled(args.scale)
+    now = int(time.time())
+    duration = int(args.hours * 3600)
+    start = now - 3600 if args.live else now - duration
+    events = generate(start, duration + (3600 if args.live else 0), profile, seed=args.seed)
+    kinds = {}
+    for e in events:
+        kinds[e["kind"]] = kinds.get(e["kind"], 0) + 1
+    print("generated %d events %s with %r" % (len(events), kinds, profile), file=sys.stderr)
+
+    if args.dump:
+        with open(args.dump, "w") as fh:
+            json.dump({"events": events, "cursor": events[-1]["cursor"] if events else None}, fh)
+        return 0
+
+    feed = FakeFeed(events, clock=time.time if args.live else None)
+    server, base_url = feed.serve(args.host, args.port)
+    print("serving %s/api/feed/events (Ctrl-C to stop)" % base_url, file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -38,6 +38,10 @@ class _StubPlugin(object):
         self.schedules = {}
         self.log = logging.getLogger("dystopia")
 
+    @staticmethod
+    def listen(*events, **k):
+        return lambda func: func  # gateway listeners are never fired here
+
     def register_schedule(self, func, interval, *a, **k):
         self._scheduled = (func, interval)  # captured, not run
 
@@ -52,9 +56,22 @@ _disco.bot = _disco_bot
 sys.modules["disco"] = _disco
 sys.modules["disco.bot"] = _disco_bot
 
-# --- stub: gevent (only sleep is used) ------------------------------------------------------------
+# --- stub: gevent (sleep + the drain's page prefetch) ---------------------------------------------
+class _SyncGreenlet(object):
+    """Runs the spawned call inline; enough for the drain's spawn -> get() prefetch pattern."""
+    def __init__(self, func, *args, **kwargs):
+        self._value = func(*args, **kwargs)
+
+    def get(self):
+        return self._value
+
+    def kill(self, *a, **k):
+        pass
+
+
 _gevent = types.ModuleType("gevent")
 _gevent.sleep = lambda *a, **k: None
+_gevent.spawn = _SyncGreenlet
 sys.modules["gevent"] = _gevent
 
 
@@ -80,6 +97,71 @@ _constants.Messages = object()
 sys.modules["PunyBot.constants"] = _constants
 
 
+# --- real: PunyBot.utils.http_pool (the shared keep-alive client the poller fetches through) -------
+def _load_real(name, *path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO, *path))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+sys.modules["PunyBot.utils"] = types.ModuleType("PunyBot.utils")
+_load_real("PunyBot.utils.metrics", "PunyBot", "utils", "metrics.py")
+_load_real("PunyBot.utils.http_pool", "PunyBot", "utils", "http_pool.py")
+
+
+# --- stub: PunyBot.utils.post_scheduler (posts inline, in order; nothing to rate-limit offline) -----
+class _Done(object):
+    """An already-finished AsyncResult: the call ran at submit time."""
+    def __init__(self, func, *args, **kwargs):
+        self._value = self._error = None
+        try:
+            self._value = func(*args, **kwargs)
+        except Exception as e:
+            self._error = e
+
+    def get(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class _InlineScheduler(object):
+    def submit(self, api, channel_id, **kwargs):
+        return _Done(api.channels_messages_create, channel_id, **kwargs)
+
+    def send(self, api, channel_id, timeout=None, **kwargs):
+        return self.submit(api, channel_id, **kwargs).get()
+
+    @staticmethod
+    def wait(result, timeout=None):
+        return result.get()
+
+
+_post_scheduler = types.ModuleType("PunyBot.utils.post_scheduler")
+_post_scheduler.post_scheduler = _InlineScheduler()
+sys.modules["PunyBot.utils.post_scheduler"] = _post_scheduler
+
+
+# --- stub: PunyBot.utils.write_behind (writes inline; no writer thread offline) ---------------------
+class _InlineWrites(object):
+    def save(self, instance, *fields):
+        instance.save()
+
+    def execute(self, query):
+        return query.execute()
+
+    def flush(self, timeout=None):
+        return True
+
+
+_write_behind = types.ModuleType("PunyBot.utils.write_behind")
+_write_behind.FLUSH_TIMEOUT = 5
+_write_behind.write_behind = _InlineWrites()
+sys.modules["PunyBot.utils.write_behind"] = _write_behind
+
+
 # --- stub: PunyBot.models.DystopiaFeedCache (in-memory) -------------------------------------------
 class _Col(object):
     """Stand-in for a peewee Field so `DystopiaFeedCache.feed_url == url` (class-level, in the plugin's
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Offline micro-benchmark for the Dystopia feed message renderer.
+
+Runs the REAL formatting code (PunyBot/plugins/dystopia.py: _format / _format_kill / _format_chat) over
+a synthetic, repeating event stream - a few servers, maps and rounds, a few dozen players - with the
+disco framework, gevent, config and DB stubbed out, exactly like tools/dystopia_feed_selfcheck.py. Nothing
+touches the network or Discord.
+
+It renders the same stream twice: once with the render memos disabled (``_compile_templates(cache_max=0)``,
+i.e. every name escaped and every link/tag rebuilt per event - the old behavior) and once with the
+default memo size, checks both produce identical text, and prints events/sec for each.
+
+Run:  python tools/dystopia_format_bench.py [events] [rounds]
+Exit: 0 if both passes render identical output; non-zero otherwise.
+"""
+import importlib.util
+import logging
+import os
+import random
+import sys
+import time
+import types
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(REPO, "PunyBot", "plugins", "dystopia.py")
+
+logging.basicConfig(level=logging.WARNING, format="  %(levelname)s %(message)s")
+
+
+# --- stubs: disco.bot.Plugin, gevent, PunyBot.CONFIG / constants / models / utils ------------------
+class _StubPlugin(object):
+    def __init__(self):
+        self._pre = {}
+        self._post = {}
+        self.log = logging.getLogger("dystopia")
+
+    @staticmethod
+    def listen(*events, **k):
+        return lambda func: func
+
+
+def _module(name, **attrs):
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attrs)
+    sys.modules[name] = mod
+    return mod
+
+
+_module("disco")
+_module("disco.bot", Plugin=_StubPlugin)
+_module("gevent", sleep=lambda *a, **k: None, spawn=None)
+_module("PunyBot", CONFIG=types.SimpleNamespace(dystopia=types.SimpleNamespace(
+    post_kills=True, post_chat=True, guild_id=None)))
+_module("PunyBot.constants", Messages=object())  # no dystopia_ attrs -> the built-in templates
+_module("PunyBot.models", DystopiaFeedCache=None)
+_module("PunyBot.utils")
+_metrics_spec = importlib.util.spec_from_file_location(
+    "PunyBot.utils.metrics", os.path.join(REPO, "PunyBot", "utils", "metrics.py"))
+sys.modules["PunyBot.utils.metrics"] = importlib.util.module_from_spec(_metrics_spec)
+_metrics_spec.loader.exec_module(sys.modules["PunyBot.utils.metrics"])
+_module("PunyBot.utils.http_pool", http_client=None)
+_module("PunyBot.utils.post_scheduler", post_scheduler=None)
+_module("PunyBot.utils.write_behind", FLUSH_TIMEOUT=5, write_behind=None)
+
+
+# --- synthetic feed -------------------------------------------------------------------------------
+MAPS = ["dys_vaccine", "dys_silo", "dys_fortress", "dys_detonate"]
+SERVERS = ["[US] Puny *Public* #1", "[EU] Puny_Public #2", "Puny `Test` Server"]
+WEAPONS = ["Laser Rifle", "Mk. 808 Rifle", "Boltgun", "Rocket Launcher", "Katana", "Shotgun", None]
+
+
+def synth_events(count, rounds, seed=1):
+    rng = random.Random(seed)
+    players = [{"name": "Player_{}*{}".format(i, "x" * (i % 4)), "communityId": str(76561198000000000 + i)}
+               for i in range(48)]
+    round_ids = [2000000100 + i for i in range(rounds)]
+    events = []
+    for i in range(count):
+        round_id = rng.choice(round_ids)
+        base = {"roundId": round_id, "mapName": MAPS[round_id % len(MAPS)],
+                "serverName": SERVERS[round_id % len(SERVERS)]}
+        roll = rng.random()
+        if roll < 0.70:
+            base.update(kind="kill", actor=rng.choice(players), victim=rng.choice(players),
+                        weapon=rng.choice(WEAPONS))
+        elif roll < 0.90:
+            base.update(kind="chat", actor=rng.choice(players), text="gg _wp_ #{}".format(i % 7))
+        elif roll < 0.95:
+            base.update(kind="capture", actor=rng.choice(players), objective="Objective *{}*".format(i % 3))
+        else:
+            base.update(kind=rng.choice(("round_start", "round_end")), winningTeam=rng.choice((2, 3, None)))
+        events.append(base)
+    return events
+
+
+def render(plugin, events):
+    out = []
+    for event in events:
+        kind = event["kind"]
+        if kind == "kill":
+            out.append(plugin._format_kill(event))
+        elif kind == "chat":
+            out.append(plugin._format_chat(event))
+        else:
+            out.append(plugin._format(event))
+    return out
+
+
+def run(mod, events, cache_max):
+    plugin = mod.DystopiaPlugin()
+    plugin.feed_url = "https://dystopia-stats.com"
+    plugin._weapon_markup = {"laser rifle": "<:dys_laser:1>", "katana": "<:dys_katana:2>"}
+    plugin._weapon_lookup = {}
+    plugin._emoji_hits = plugin._emoji_misses = 0
+    plugin._compile_templates(cache_max=cache_max)
+    started = time.perf_counter()
+    out = render(plugin, events)
+    return out, time.perf_counter() - started
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 200000
+    rounds = int(argv[2]) if len(argv) > 2 else 40
+    spec = importlib.util.spec_from_file_location("dystopia_real", PLUGIN)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+
+    events = synth_events(count, rounds)
+    print("== rendering %d synthetic events (%d rounds) ==" % (count, rounds))
+    baseline, base_s = run(mod, events, cache_max=0)
+    cached, cached_s = run(mod, events, cache_max=mod.FORMAT_CACHE_MAX)
+    print("  uncached : %8.3fs  %10.0f events/s" % (base_s, count / base_s))
+    print("  cached   : %8.3fs  %10.0f events/s  (x%.2f)" % (cached_s, count / cached_s, base_s / cached_s))
+    if baseline != cached:
+        diff = next(i for i, (a, b) in enumerate(zip(baseline, cached)) if a != b)
+        print("FAIL: output differs at event %d:\n  %r\n  %r" % (diff, baseline[diff], cached[diff]))
+        return 1
+    print("PASS: identical output from both passes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))